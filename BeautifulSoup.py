@@ -84,11 +84,13 @@ __copyright__ = "Copyright (c) 2004-2010 Leonard Richardson"
 __license__ = "New-style BSD"
 
 from sgmllib import SGMLParser, SGMLParseError
+import bisect
 import codecs
 import markupbase
 import types
 import re
 import sgmllib
+from UserDict import DictMixin
 try:
   from htmlentitydefs import name2codepoint
 except ImportError:
@@ -114,6 +116,34 @@ class PageElement(object):
     """Contains the navigational information for some part of the page
     (either a tag or a piece of text)"""
 
+    # The elements of a tree keep their attributes in __slots__ rather
+    # than in a __dict__ each; the navigational ones are declared by
+    # the subclasses, since unicode cannot share an instance layout.
+    # The __dict__ slot is only filled in if something sets an
+    # attribute of its own on an element, and __weakref__ keeps
+    # elements weakly referenceable.
+    NAVIGATION_SLOTS = ('parent', 'previous', 'next',
+                        'previousSibling', 'nextSibling',
+                        '__dict__', '__weakref__')
+    __slots__ = ()
+
+    def __getstate__(self):
+        "Gathers the slots for pickling, which only does __dict__ itself."
+        state = dict(getattr(self, '__dict__', ()))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name.startswith('__'):
+                    continue
+                try:
+                    state[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def setup(self, parent=None, previous=None):
         """Sets up the initial relations between this element and
         other elements."""
@@ -152,6 +182,10 @@ class PageElement(object):
 
     def extract(self):
         """Destructively rips this element out of the tree."""
+        if isinstance(self, Tag):
+            index = self._findTreeIndex()
+            if index is not None:
+                index.remove(self)
         if self.parent:
             try:
                 del self.parent.contents[self.parent.index(self)]
@@ -179,6 +213,14 @@ class PageElement(object):
         self.previousSibling = self.nextSibling = None
         return self
 
+    def _findTreeIndex(self):
+        """Returns the TreeIndex of the tree this element is in, if it
+        has one."""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        return root.treeIndex
+
     def _lastRecursiveChild(self):
         "Finds the last element beneath this object to be parsed."
         lastChild = self
@@ -190,6 +232,10 @@ class PageElement(object):
         if isinstance(newChild, basestring) \
             and not isinstance(newChild, NavigableString):
             newChild = NavigableString(newChild)
+        if isinstance(newChild, Tag):
+            index = self._findTreeIndex()
+            if index is not None:
+                index.stale = True
 
         position =  min(position, len(self.contents))
         if hasattr(newChild, 'parent') and newChild.parent is not None:
@@ -423,6 +469,8 @@ class PageElement(object):
 
 class NavigableString(unicode, PageElement):
 
+    __slots__ = PageElement.NAVIGATION_SLOTS
+
     def __new__(cls, value):
         """Create a new NavigableString.
 
@@ -458,10 +506,16 @@ class NavigableString(unicode, PageElement):
 
 class CData(NavigableString):
 
+    __slots__ = ()
+
+
     def __str__(self, encoding=DEFAULT_OUTPUT_ENCODING):
         return "<![CDATA[%s]]>" % NavigableString.__str__(self, encoding)
 
 class ProcessingInstruction(NavigableString):
+
+    __slots__ = ()
+
     def __str__(self, encoding=DEFAULT_OUTPUT_ENCODING):
         output = self
         if "%SOUP-ENCODING%" in output:
@@ -469,17 +523,68 @@ class ProcessingInstruction(NavigableString):
         return "<?%s?>" % self.toEncoding(output, encoding)
 
 class Comment(NavigableString):
+
+    __slots__ = ()
+
     def __str__(self, encoding=DEFAULT_OUTPUT_ENCODING):
         return "<!--%s-->" % NavigableString.__str__(self, encoding)
 
 class Declaration(NavigableString):
+
+    __slots__ = ()
+
     def __str__(self, encoding=DEFAULT_OUTPUT_ENCODING):
         return "<!%s>" % NavigableString.__str__(self, encoding)
 
+class _AttrMapView(DictMixin):
+    """The attrMap of a Tag: a dictionary whose items are the tag's
+    attributes, reading and writing them through the tag."""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def __getitem__(self, key):
+        return self.tag[key]
+
+    def __setitem__(self, key, value):
+        self.tag[key] = value
+
+    def __delitem__(self, key):
+        if not self.tag.has_key(key):
+            raise KeyError(key)
+        del self.tag[key]
+
+    def __contains__(self, key):
+        return self.tag.has_key(key)
+
+    has_key = __contains__
+
+    def keys(self):
+        keys = []
+        for key, value in self.tag.attrs:
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
 class Tag(PageElement):
 
     """Represents a found HTML tag with its attributes and contents."""
 
+    __slots__ = PageElement.NAVIGATION_SLOTS + (
+        'parserClass', 'isSelfClosing', 'name', 'attrs', 'contents',
+        'hidden', 'containsSubstitutions', 'convertHTMLEntities',
+        'convertXMLEntities', 'escapeUnrecognizedEntities')
+
+    # The TreeIndex of the tree this tag is the root of, if any. Only
+    # the soup object, which has a __dict__, ever sets it.
+    treeIndex = None
+
     def _invert(h):
         "Cheap function to invert a hash."
         i = {}
@@ -579,7 +684,12 @@ class Tag(PageElement):
         """Returns the value of the 'key' attribute for the tag, or
         the value given for 'default' if it doesn't have that
         attribute."""
-        return self._getAttrMap().get(key, default)
+        # attrs is the only storage, and is short enough to search;
+        # the last of any repeated attributes wins.
+        for k, value in reversed(self.attrs):
+            if k == key:
+                return value
+        return default
 
     def clear(self):
         """Extract all children."""
@@ -593,12 +703,18 @@ class Tag(PageElement):
         raise ValueError("Tag.index: element not in tag")
 
     def has_key(self, key):
-        return self._getAttrMap().has_key(key)
+        for k, value in self.attrs:
+            if k == key:
+                return True
+        return False
 
     def __getitem__(self, key):
         """tag[key] returns the value of the 'key' attribute for the tag,
         and throws an exception if it's not there."""
-        return self._getAttrMap()[key]
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
 
     def __iter__(self):
         "Iterating over a tag iterates over its contents."
@@ -618,8 +734,6 @@ class Tag(PageElement):
     def __setitem__(self, key, value):
         """Setting tag[key] sets the value of the 'key' attribute for the
         tag."""
-        self._getAttrMap()
-        self.attrMap[key] = value
         found = False
         for i in range(0, len(self.attrs)):
             if self.attrs[i][0] == key:
@@ -627,7 +741,9 @@ class Tag(PageElement):
                 found = True
         if not found:
             self.attrs.append((key, value))
-        self._getAttrMap()[key] = value
+        index = self._findTreeIndex()
+        if index is not None:
+            index.update(self, key, value)
 
     def __delitem__(self, key):
         "Deleting tag[key] deletes all 'key' attributes for the tag."
@@ -636,9 +752,6 @@ class Tag(PageElement):
                 self.attrs.remove(item)
                 #We don't break because bad HTML can define the same
                 #attribute multiple times.
-            self._getAttrMap()
-            if self.attrMap.has_key(key):
-                del self.attrMap[key]
 
     def __call__(self, *args, **kwargs):
         """Calling a tag like a function is the same as calling its
@@ -839,10 +952,20 @@ class Tag(PageElement):
         string, a list of strings, a regular expression object, or a
         callable that takes a string and returns whether or not the
         string matches for some custom definition of 'matches'. The
-        same is true of the tag name."""
+        same is true of the tag name.
+
+        If the tree was parsed with indexTree=True, a search for tags
+        by name, by attribute or by CSS class looks only at the tags
+        the TreeIndex has for them."""
         generator = self.recursiveChildGenerator
         if not recursive:
             generator = self.childGenerator
+        elif text is None:
+            index = self._getTreeIndex()
+            if index is not None:
+                found = index.findAll(self, name, attrs, limit, kwargs)
+                if found is not None:
+                    return found
         return self._findAll(name, attrs, text, limit, generator, **kwargs)
     findChildren = findAll
 
@@ -858,14 +981,28 @@ class Tag(PageElement):
 
     #Private methods
 
+    def _getTreeIndex(self):
+        """Returns the up to date TreeIndex of the tree this tag is in,
+        if it has one."""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        index = root.treeIndex
+        if index is not None and index.stale:
+            index.rebuild(root)
+        return index
+
     def _getAttrMap(self):
-        """Initializes a map representation of this tag's attributes,
-        if not already initialized."""
-        if not getattr(self, 'attrMap'):
-            self.attrMap = {}
-            for (key, value) in self.attrs:
-                self.attrMap[key] = value
-        return self.attrMap
+        """Returns a map representation of this tag's attributes: a
+        view of attrs, so changing it changes the tag."""
+        return _AttrMapView(self)
+
+    def _setAttrMap(self, attrMap):
+        self.attrs = []
+        for key, value in attrMap.items():
+            self[key] = value
+
+    attrMap = property(_getAttrMap, _setAttrMap)
 
     #Generator methods
     def childGenerator(self):
@@ -1010,6 +1147,176 @@ class ResultSet(list):
         list.__init__([])
         self.source = source
 
+class TreeIndex:
+    """Keeps, for each tag name, attribute name and CSS class of a
+    tree, the tags which have it in document order, so that findAll()
+    need only look at those tags rather than at every element beneath
+    the tag it was called on.
+
+    A BeautifulStoneSoup given indexTree=True builds one as it parses.
+    The lists may hold more tags than have the name, attribute or
+    class, since every tag found in them is checked again. Setting an
+    attribute files the tag under it, and extract() (and everything
+    built on it) leaves the tag where it is but has the positions of
+    the tags it took out of the tree skipped. Putting a tag into the
+    tree marks the index stale, and it is rebuilt on the next search;
+    other changes to a tree, such as renaming a tag or editing its
+    attrs list, need a call to rebuild() by hand."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # key -> ([tags], [their positions in document order])
+        self.byName = {}
+        self.byAttr = {}
+        self.byClass = {}
+        # id(tag) -> [its position, the position of its last descendant]
+        self.spans = {}
+        # The spans of the tags taken out of the tree, in order
+        self.removedStarts = []
+        self.removedEnds = []
+        self.count = 0
+        self.stale = False
+
+    def add(self, tag):
+        """Adds a tag which comes after all the tags added so far."""
+        position = self.count
+        self.count += 1
+        self.spans[id(tag)] = [position, position]
+        self._file(self.byName, tag.name, tag, position)
+        for key, value in tag.attrs:
+            self._fileAttr(key, value, tag, position)
+
+    def close(self, tag):
+        """Records that none of the tags added from now on are beneath
+        the given tag."""
+        span = self.spans.get(id(tag))
+        if span:
+            span[1] = self.count - 1
+
+    def update(self, tag, key, value):
+        """Records that the given tag now has the given attribute."""
+        if self.stale:
+            return
+        span = self.spans.get(id(tag))
+        if span is None:
+            self.stale = True
+        else:
+            self._fileAttr(key, value, tag, span[0])
+
+    def remove(self, tag):
+        """Records that the given tag is being taken out of the tree."""
+        if self.stale:
+            return
+        span = self.spans.pop(id(tag), None)
+        if span is None:
+            self.stale = True
+            return
+        start, end = span
+        if self._removed(start):
+            return
+        # Any spans already removed from within this one go
+        i = bisect.bisect_left(self.removedStarts, start)
+        j = bisect.bisect_right(self.removedStarts, end)
+        self.removedStarts[i:j] = [start]
+        self.removedEnds[i:j] = [end]
+
+    def rebuild(self, root):
+        """Indexes the tags beneath the given tag all over again."""
+        self.clear()
+        openTags = []
+        for element in root.recursiveChildGenerator():
+            if not isinstance(element, Tag):
+                continue
+            while openTags and openTags[-1] is not element.parent:
+                self.close(openTags.pop())
+            self.add(element)
+            openTags.append(element)
+        while openTags:
+            self.close(openTags.pop())
+
+    def findAll(self, scope, name, attrs, limit, kwargs):
+        """Answers scope.findAll(name, attrs, limit=limit, **kwargs)
+        for a search that has no text criterion, or returns None if the
+        index cannot narrow the search down."""
+        if isinstance(name, SoupStrainer):
+            return None
+        strainer = SoupStrainer(name, attrs, None, **kwargs)
+        # Every choice is a superset of the tags that can match, which
+        # the strainer then checks one by one.
+        choices = []
+        if isinstance(name, basestring):
+            choices.append(self.byName.get(name, self.NONE))
+        if isinstance(attrs, basestring):
+            # The search for a CSS class; see _match_css_class
+            if attrs and re.escape(attrs) == attrs:
+                choices.append(self.byClass.get(attrs, self.NONE))
+        for key, matchAgainst in (strainer.attrs or {}).items():
+            if matchAgainst is True or hasattr(matchAgainst, 'match'):
+                choices.append(self.byAttr.get(key, self.NONE))
+            elif isinstance(matchAgainst, basestring):
+                tokens = matchAgainst.split()
+                if key == 'class' and tokens:
+                    choices.append(self.byClass.get(tokens[0], self.NONE))
+                else:
+                    choices.append(self.byAttr.get(key, self.NONE))
+        if not choices:
+            return None
+        tags, positions = min(choices, key=lambda choice: len(choice[0]))
+        if scope.parent is None:
+            start, end = 0, len(tags)
+        else:
+            span = self.spans.get(id(scope))
+            if span is None:
+                return None
+            # The descendants of the scope, but not the scope itself
+            start = bisect.bisect_right(positions, span[0])
+            end = bisect.bisect_right(positions, span[1])
+        results = ResultSet(strainer)
+        if isinstance(name, basestring) and not (attrs or kwargs) \
+            and not self.removedStarts:
+            # Every tag filed under the name matches.
+            if limit:
+                end = min(end, start + limit)
+            results.extend(tags[start:end])
+            return results
+        for i in xrange(start, end):
+            if self.removedStarts and self._removed(positions[i]):
+                continue
+            if strainer.search(tags[i]):
+                results.append(tags[i])
+                if limit and len(results) >= limit:
+                    break
+        return results
+
+    NONE = ([], [])
+
+    def _removed(self, position):
+        i = bisect.bisect_right(self.removedStarts, position) - 1
+        return i >= 0 and self.removedEnds[i] >= position
+
+    def _fileAttr(self, key, value, tag, position):
+        self._file(self.byAttr, key, tag, position)
+        if key == 'class' and value:
+            for token in value.split():
+                self._file(self.byClass, token, tag, position)
+
+    def _file(self, table, key, tag, position):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = ([tag], [position])
+            return
+        tags, positions = entry
+        if positions[-1] < position:
+            tags.append(tag)
+            positions.append(position)
+            return
+        i = bisect.bisect_left(positions, position)
+        if positions[i] != position:
+            tags.insert(i, tag)
+            positions.insert(i, position)
+
 # Now, some helper functions.
 
 def buildTagMap(default, *args):
@@ -1079,7 +1386,8 @@ class BeautifulStoneSoup(Tag, SGMLParser):
 
     def __init__(self, markup="", parseOnlyThese=None, fromEncoding=None,
                  markupMassage=True, smartQuotesTo=XML_ENTITIES,
-                 convertEntities=None, selfClosingTags=None, isHTML=False):
+                 convertEntities=None, selfClosingTags=None, isHTML=False,
+                 indexTree=False):
         """The Soup object is initialized as the 'root tag', and the
         provided markup (which can be a string or a file-like object)
         is fed into the underlying parser.
@@ -1103,9 +1411,14 @@ class BeautifulStoneSoup(Tag, SGMLParser):
 
         You can pass in a custom list of (RE object, replace method)
         tuples to get Beautiful Soup to scrub your input the way you
-        want."""
+        want.
+
+        Pass in True for indexTree to have the tags indexed as they
+        are parsed, which pays off for documents searched many times;
+        see TreeIndex."""
 
         self.parseOnlyThese = parseOnlyThese
+        self.indexTree = indexTree
         self.fromEncoding = fromEncoding
         self.smartQuotesTo = smartQuotesTo
         self.convertEntities = convertEntities
@@ -1211,6 +1524,9 @@ class BeautifulStoneSoup(Tag, SGMLParser):
     def reset(self):
         Tag.__init__(self, self, self.ROOT_TAG_NAME)
         self.hidden = 1
+        self.treeIndex = None
+        if self.indexTree:
+            self.treeIndex = TreeIndex()
         SGMLParser.reset(self)
         self.currentData = []
         self.currentTag = None
@@ -1220,6 +1536,8 @@ class BeautifulStoneSoup(Tag, SGMLParser):
 
     def popTag(self):
         tag = self.tagStack.pop()
+        if self.treeIndex is not None:
+            self.treeIndex.close(tag)
 
         #print "Pop", tag.name
         if self.tagStack:
@@ -1342,6 +1660,8 @@ class BeautifulStoneSoup(Tag, SGMLParser):
             return
 
         tag = Tag(self, name, attrs, self.currentTag, self.previous)
+        if self.treeIndex is not None:
+            self.treeIndex.add(tag)
         if self.previous:
             self.previous.next = tag
         self.previous = tag
@@ -1693,10 +2013,9 @@ class BeautifulSOAP(BeautifulStoneSoup):
         if len(self.tagStack) > 1:
             tag = self.tagStack[-1]
             parent = self.tagStack[-2]
-            parent._getAttrMap()
             if (isinstance(tag, Tag) and len(tag.contents) == 1 and
                 isinstance(tag.contents[0], NavigableString) and
-                not parent.attrMap.has_key(tag.name)):
+                not parent.has_key(tag.name)):
                 parent[tag.name] = tag.contents[0]
         BeautifulStoneSoup.popTag(self)
 
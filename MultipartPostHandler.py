@@ -28,12 +28,81 @@ Further Example:
 import urllib
 import urllib2
 import mimetools, mimetypes
-import os, stat
+import os, stat, sys
 
 class Callable:
     def __init__(self, anycallable):
         self.__call__ = anycallable
 
+class MultipartStream:
+    """
+    A read()-able multipart/form-data body, assembled on the fly from
+    strings and open files, so the files never have to be in memory all
+    at once. ``len()`` gives the exact size of the body up front, which
+    is what lets httplib send it as-is.
+    """
+    # matches the block size httplib uses when it read()s a body
+    blocksize = 8192
+
+    def __init__(self, parts, progress=None):
+        # each part is either a str or a (file, file_size) tuple
+        self.parts = parts
+        # called as progress(bytes_so_far, total_bytes) after every chunk
+        self.progress = progress
+        self.length = 0
+        for part in parts:
+            if type(part) == str:
+                self.length += len(part)
+            else:
+                self.length += part[1]
+        self._chunks = None
+        self._pending = ''
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        sent = 0
+        for chunk in self._generate():
+            yield chunk
+            if self.progress is not None:
+                sent += len(chunk)
+                self.progress(sent, self.length)
+
+    def _generate(self):
+        for part in self.parts:
+            if type(part) == str:
+                yield part
+                continue
+            fd, remaining = part
+            fd.seek(0)
+            while remaining > 0:
+                chunk = fd.read(min(self.blocksize, remaining))
+                if not chunk:
+                    raise IOError("%s shrank while it was being sent" % fd.name)
+                remaining -= len(chunk)
+                yield chunk
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = iter(self)
+        if size < 0:
+            result = self._pending + ''.join(self._chunks)
+            self._pending = ''
+            return result
+        pieces = [self._pending]
+        available = len(self._pending)
+        while available < size:
+            try:
+                chunk = self._chunks.next()
+            except StopIteration:
+                break
+            pieces.append(chunk)
+            available += len(chunk)
+        data = ''.join(pieces)
+        self._pending = data[size:]
+        return data[:size]
+
 # Controls how sequences are uncoded. If true, elements may be given multiple values by
 #  assigning a sequence.
 doseq = 1
@@ -43,7 +112,8 @@ class MultipartPostHandler(urllib2.BaseHandler):
 
     def http_request(self, request):
         data = request.get_data()
-        if data is not None and type(data) != str:
+        if data is not None and type(data) != str \
+           and not isinstance(data, MultipartStream):
             v_files = []
             v_vars = []
             try:
@@ -59,37 +129,55 @@ class MultipartPostHandler(urllib2.BaseHandler):
             if len(v_files) == 0:
                 data = urllib.urlencode(v_vars, doseq)
             else:
-                boundary, data = self.multipart_encode(v_vars, v_files)
+                boundary, data = self.multipart_stream(v_vars, v_files)
                 contenttype = 'multipart/form-data; boundary=%s' % boundary
                 if(request.has_header('Content-Type')
                    and request.get_header('Content-Type').find('multipart/form-data') != 0):
                     print "Replacing %s with %s" % (request.get_header('content-type'), 'multipart/form-data')
                 request.add_unredirected_header('Content-Type', contenttype)
+                # httplib cannot work out the length of a stream by itself
+                request.add_unredirected_header('Content-Length', str(len(data)))
 
             request.add_data(data)
         return request
 
-    def multipart_encode(vars, files, boundary = None, buffer = None):
+    def multipart_stream(vars, files, boundary = None):
+        """
+        :param vars: a sequence of (name, value) string pairs
+        :param files: a sequence of (name, file) pairs; each whole file
+            is sent, no matter where it is currently positioned
+        :returns: the boundary and a `MultipartStream` of the body
+        """
         if boundary is None:
             boundary = mimetools.choose_boundary()
-        if buffer is None:
-            buffer = ''
+        parts = []
         for(key, value) in vars:
-            buffer += '--%s\r\n' % boundary
-            buffer += 'Content-Disposition: form-data; name="%s"' % key
-            buffer += '\r\n\r\n' + value + '\r\n'
+            parts.append('--%s\r\n' % boundary +
+                'Content-Disposition: form-data; name="%s"' % key +
+                '\r\n\r\n' + value + '\r\n')
         for(key, fd) in files:
             file_size = os.fstat(fd.fileno())[stat.ST_SIZE]
             filename = os.path.basename(fd.name)
             contenttype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
-            buffer += '--%s\r\n' % boundary
-            buffer += 'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename)
-            buffer += 'Content-Type: %s\r\n' % contenttype
-            # buffer += 'Content-Length: %s\r\n' % file_size
-            fd.seek(0)
-            buffer += '\r\n' + fd.read() + '\r\n'
-        buffer += '--%s--\r\n\r\n' % boundary
-        return boundary, buffer
+            parts.append('--%s\r\n' % boundary +
+                'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename) +
+                'Content-Type: %s\r\n' % contenttype +
+                # 'Content-Length: %s\r\n' % file_size +
+                '\r\n')
+            parts.append((fd, file_size))
+            parts.append('\r\n')
+        parts.append('--%s--\r\n\r\n' % boundary)
+        return boundary, MultipartStream(parts)
+    multipart_stream = Callable(multipart_stream)
+
+    def multipart_encode(vars, files, boundary = None, buffer = None):
+        """
+        Like `multipart_stream`, but returns the whole body as one string.
+        """
+        boundary, stream = MultipartPostHandler.multipart_stream(vars, files, boundary)
+        if buffer is None:
+            buffer = ''
+        return boundary, buffer + stream.read()
     multipart_encode = Callable(multipart_encode)
 
     https_request = http_request
\ No newline at end of file
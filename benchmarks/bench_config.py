@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Measures what reading the config costs at startup, parsing config.xml
+with minidom against loading the snapshot ``PythonbitsConfig`` keeps
+of it, and what a pattern costs per call, passing the config string to
+``re`` against using the pattern compiled once by the config.
+
+Usage:
+  ``python benchmarks/bench_config.py [REPEAT]``
+"""
+import os
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import pythonbits
+
+# a made-up results page for the patterns to chew on
+PAGE = ''.join(['<li><a href="http://www.imdb.com/title/tt%07d/" class="l">Title %d</a>'
+	'<a href="http://www.youtube.com/watch?v=abc%d" class="l">Title %d Trailer</a>'
+	'<a href="http://en.wikipedia.org/wiki/Title_%d">wiki</a></li>\n' % (i, i, i, i, i)
+	for i in xrange(100)])
+
+# the patterns as the use sites apply them, with their flags
+CALLS = [
+	('google_imdb_result_re', re.DOTALL),
+	('google_youtube_result_re', 0),
+	('wikipedia_url', 0),
+	('imdb_summary_re', re.MULTILINE),
+]
+
+def read_config(location):
+	# as in a fresh process, nothing compiled yet
+	re.purge()
+	conf = pythonbits.PythonbitsConfig()
+	conf.set_location(location)
+	conf.read()
+	return conf
+
+def main(repeat=5):
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		# PythonbitsConfig looks for config.xml in the temp directory
+		tempfile.tempdir = dirname
+		location = os.path.join(dirname, 'config.xml')
+		shutil.copy(os.path.join(HERE, os.pardir, 'config.xml'), location)
+		snapshot = location + '.snapshot.json'
+
+		def cold():
+			if os.path.exists(snapshot):
+				os.remove(snapshot)
+			read_config(location)
+		number = 20
+		xml = min(timeit.repeat(cold, number=number, repeat=repeat)) / number
+		read_config(location)
+		warm = min(timeit.repeat(lambda: read_config(location),
+			number=number, repeat=repeat)) / number
+		print '%-26s %12s %12s %8s' % ('startup', 'xml (ms)', 'snapshot (ms)', 'speedup')
+		print '%-26s %12.3f %12.3f %7.1fx' % ('PythonbitsConfig.read', xml * 1000, warm * 1000, xml / warm)
+
+		conf = read_config(location)
+		print
+		print '%-26s %12s %12s %13s' % ('pattern', 're (us)', 'uncached (us)', 'compiled (us)')
+		number = 2000
+		for name, flags in CALLS:
+			raw = conf.strings[name]
+			compiled = conf.regex(name)
+			if re.findall(raw, PAGE, flags) != compiled.findall(PAGE):
+				raise AssertionError('%s gives different results' % name)
+			by_string = lambda: re.findall(raw, 'x', flags)
+			# re's own cache is thrown away whole once a run has used more
+			# than a hundred distinct patterns, and the string compiled again
+			def uncached():
+				re.purge()
+				re.findall(raw, 'x', flags)
+			by_pattern = lambda: compiled.findall('x')
+			a, b, c = [min(timeit.repeat(f, number=number, repeat=repeat)) / number
+				for f in (by_string, uncached, by_pattern)]
+			print '%-26s %12.2f %12.2f %13.2f' % (name, a * 1e6, b * 1e6, c * 1e6)
+	finally:
+		shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		main(int(sys.argv[1]))
+	else:
+		main()
+# vim:noexpandtab:
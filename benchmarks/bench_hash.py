@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Compares the block-wise ``opensubtitles.hash_filename`` against the
+original byte-at-a-time ``hash_filename_legacy``.
+
+Usage:
+  ``python benchmarks/bench_hash.py [REPEAT]``
+
+The files are created sparse in a temporary directory, so even the large
+ones cost next to nothing on disk.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import opensubtitles
+
+SIZES = [
+	('128K', 131072),
+	('12M', 12909756),
+	('700M', 700 * 1024 * 1024),
+	('4G', 4295033890),
+]
+
+def make_file(dirname, label, size):
+	"""
+	Writes a file of ``size`` bytes whose head and tail are
+	pseudo-random, leaving the middle as a hole.
+	"""
+	fn = os.path.join(dirname, 'bench-%s.bin' % label)
+	fh = open(fn, 'wb')
+	fh.write(os.urandom(opensubtitles.HASH_CHUNK_SIZE))
+	fh.seek(size - opensubtitles.HASH_CHUNK_SIZE)
+	fh.write(os.urandom(opensubtitles.HASH_CHUNK_SIZE))
+	fh.close()
+	return fn
+
+def main(repeat=3):
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		print '%-6s %12s %12s %8s' % ('size', 'legacy (s)', 'block (s)', 'speedup')
+		for label, size in SIZES:
+			fn = make_file(dirname, label, size)
+			if opensubtitles.hash_filename(fn) != opensubtitles.hash_filename_legacy(fn):
+				raise AssertionError('hash mismatch for %s' % label)
+			legacy = min(timeit.repeat(
+				lambda: opensubtitles.hash_filename_legacy(fn), number=1, repeat=repeat))
+			block = min(timeit.repeat(
+				lambda: opensubtitles.hash_filename(fn), number=1, repeat=repeat))
+			print '%-6s %12.6f %12.6f %7.1fx' % (label, legacy, block, legacy / block)
+			os.remove(fn)
+	finally:
+		shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		main(int(sys.argv[1]))
+	else:
+		main()
+# vim:noexpandtab:
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compares the single-pass ``microdata.walk_scopes`` against the original
+``microdata.run_scopes``, which re-queries the whole tree after every
+item it extracts.
+
+Usage:
+  ``python benchmarks/bench_microdata.py [PAGE.html ...]``
+
+Saved IMDB title pages may be given on the command line; without any, a
+title page is made up with an ever longer cast list, each actor being a
+nested ``Person`` item like on the real thing. Only the extraction is
+timed, not the parsing of the soup.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from BeautifulSoup import BeautifulSoup
+import microdata
+
+CAST_SIZES = [10, 50, 200, 500]
+
+PERSON = '''<td itemprop="actor" itemscope itemtype="http://schema.org/Person">
+<a href="/name/nm%07d/" itemprop="url"><span itemprop="name">Actor Number %d</span></a>
+</td><td class="character"><div>Character &#x27;%d&#x27;</div></td>
+'''
+
+def make_page(cast):
+	"""
+	Makes up an IMDB-like title page with ``cast`` nested actor items.
+	"""
+	rows = ''.join(['<tr>' + PERSON % (i, i, i) + '</tr>' for i in xrange(cast)])
+	return '''<html><head><title>Benchmark (2012)</title></head><body>
+<div id="pagecontent" itemscope itemtype="http://schema.org/Movie">
+<h1 itemprop="name">Benchmark</h1>
+<div itemprop="aggregateRating" itemscope itemtype="http://schema.org/AggregateRating">
+<span itemprop="ratingValue">7.1</span><span itemprop="bestRating">10</span></div>
+<p itemprop="description">A film made up to measure things.</p>
+<div itemprop="director" itemscope itemtype="http://schema.org/Person">
+<span itemprop="name">Some Director</span></div>
+<a itemprop="genre">Drama</a> <a itemprop="genre">Thriller</a>
+<table class="cast_list">%s</table>
+<time itemprop="duration" datetime="PT108M">108 min</time>
+</div></body></html>''' % rows
+
+def measure(func, html, repeat=3):
+	"""
+	Returns the best extraction time of ``func`` and its result.
+	"""
+	best = None
+	for _ in xrange(repeat):
+		soup = BeautifulSoup(html)
+		start = time.time()
+		result = func(soup)
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, result
+
+def main(paths):
+	if paths:
+		pages = [(os.path.basename(p), open(p).read()) for p in paths]
+	else:
+		pages = [('cast-%d' % n, make_page(n)) for n in CAST_SIZES]
+	print '%-16s %8s %6s %14s %13s %8s' % (
+		'page', 'KiB', 'items', 'run_scopes (s)', 'walk (s)', 'speedup')
+	for label, html in pages:
+		legacy, expected = measure(microdata.run_scopes, html)
+		walk, result = measure(microdata.walk_scopes, html)
+		if result != expected:
+			raise AssertionError('walk_scopes differs from run_scopes on %s' % label)
+		items = html.count('itemscope')
+		print '%-16s %8d %6d %14.4f %13.4f %7.1fx' % (
+			label, len(html) / 1024, items, legacy, walk, legacy / max(walk, 1e-6))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
+# vim:noexpandtab:
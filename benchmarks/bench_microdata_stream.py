@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Measures the peak memory and time of pulling the microdata out of an
+IMDB title page, with a ``BeautifulSoup`` tree (``microdata.extract``)
+and with the streaming parser (``microdata.extract_stream``).
+
+Usage:
+  ``python benchmarks/bench_microdata_stream.py [PAGE.html ...]``
+
+Without pages, the made-up title pages of ``bench_microdata.py`` are
+used. Every measurement runs in its own interpreter, since the peak
+resident set size of a process only ever goes up.
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+import microdata
+from bench_microdata import make_page
+
+CAST_SIZES = [50, 500, 2000]
+MODES = ['soup', 'stream']
+
+def child(mode, path):
+	"""
+	Extracts the microdata of ``path`` once, printing the elapsed seconds
+	and the growth of the peak RSS in KiB.
+	"""
+	base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	fh = open(path, 'rb')
+	start = time.time()
+	microdata.extract(fh, streaming='stream' == mode)
+	elapsed = time.time() - start
+	fh.close()
+	print elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+
+def main(paths):
+	made = []
+	if not paths:
+		for n in CAST_SIZES:
+			fd, path = tempfile.mkstemp(prefix='cast-%d-' % n, suffix='.html')
+			os.write(fd, make_page(n))
+			os.close(fd)
+			made.append(path)
+		paths = made
+	try:
+		print '%-24s %8s %-7s %10s %14s' % ('page', 'KiB', 'mode', 'time (s)', 'peak RSS (MiB)')
+		for path in paths:
+			for mode in MODES:
+				out = subprocess.Popen(
+					[sys.executable, os.path.abspath(__file__), '--child', mode, path],
+					stdout=subprocess.PIPE).communicate()[0]
+				elapsed, peak = out.split()
+				print '%-24s %8d %-7s %10.3f %14.1f' % (
+					os.path.basename(path)[:24], os.path.getsize(path) / 1024, mode,
+					float(elapsed), int(peak) / 1024.0)
+	finally:
+		for path in made:
+			os.remove(path)
+
+if __name__ == '__main__':
+	if len(sys.argv) == 4 and '--child' == sys.argv[1]:
+		child(sys.argv[2], sys.argv[3])
+	else:
+		main(sys.argv[1:])
+# vim:noexpandtab:
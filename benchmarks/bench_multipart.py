@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Measures the peak memory (and time) of POSTing screenshots through
+``MultipartPostHandler`` to a local HTTP server, comparing the old
+string-concatenating encoder with the streaming one.
+
+Usage:
+  ``python benchmarks/bench_multipart.py``
+
+Every measurement runs in its own interpreter, since the peak resident
+set size of a process only ever goes up.
+"""
+import BaseHTTPServer
+import mimetools
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import MultipartPostHandler
+
+UPLOADS = [
+	('png-4k', 'screen.png', 25 * 1024 * 1024),
+	('jpeg-full', 'photo.jpg', 8 * 1024 * 1024),
+	('png-huge', 'huge.png', 200 * 1024 * 1024),
+]
+MODES = ['legacy', 'stream']
+
+def legacy_encode(vars, files, boundary=None, buffer=None):
+	"""
+	The encoder as it was, kept here for comparison.
+	"""
+	if boundary is None:
+		boundary = mimetools.choose_boundary()
+	if buffer is None:
+		buffer = ''
+	for(key, value) in vars:
+		buffer += '--%s\r\n' % boundary
+		buffer += 'Content-Disposition: form-data; name="%s"' % key
+		buffer += '\r\n\r\n' + value + '\r\n'
+	for(key, fd) in files:
+		filename = os.path.basename(fd.name)
+		buffer += '--%s\r\n' % boundary
+		buffer += 'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename)
+		buffer += 'Content-Type: %s\r\n' % 'application/octet-stream'
+		fd.seek(0)
+		buffer += '\r\n' + fd.read() + '\r\n'
+	buffer += '--%s--\r\n\r\n' % boundary
+	return boundary, buffer
+
+class _Sink(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_POST(self):
+		remaining = int(self.headers['Content-Length'])
+		while remaining:
+			remaining -= len(self.rfile.read(min(65536, remaining)))
+		self.send_response(200)
+		self.send_header('Content-Length', '2')
+		self.end_headers()
+		self.wfile.write('{}')
+	def log_message(self, *args):
+		pass
+
+def child(mode, path):
+	"""
+	Uploads ``path`` once, printing the elapsed seconds and peak RSS in KiB.
+	"""
+	server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Sink)
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	url = 'http://127.0.0.1:%d/upload' % server.server_address[1]
+	if 'legacy' == mode:
+		MultipartPostHandler.MultipartPostHandler.multipart_stream = \
+			MultipartPostHandler.Callable(lambda v, f: legacy_encode(v, f))
+	opener = urllib2.build_opener(MultipartPostHandler.MultipartPostHandler)
+	start = time.time()
+	fh = opener.open(url, {'key': 'benchmark', 'image': open(path, 'rb')})
+	fh.read()
+	fh.close()
+	elapsed = time.time() - start
+	print elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main():
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		print '%-10s %8s %-7s %10s %14s' % ('upload', 'MiB', 'mode', 'time (s)', 'peak RSS (MiB)')
+		for label, basename, size in UPLOADS:
+			path = os.path.join(dirname, basename)
+			fh = open(path, 'wb')
+			for _ in xrange(size / (1024 * 1024)):
+				fh.write(os.urandom(1024 * 1024))
+			fh.close()
+			for mode in MODES:
+				out = subprocess.Popen(
+					[sys.executable, os.path.abspath(__file__), '--child', mode, path],
+					stdout=subprocess.PIPE).communicate()[0]
+				elapsed, peak = out.split()
+				print '%-10s %8d %-7s %10.3f %14.1f' % (
+					label, size / (1024 * 1024), mode, float(elapsed), int(peak) / 1024.0)
+			os.remove(path)
+	finally:
+		shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+	if len(sys.argv) == 4 and '--child' == sys.argv[1]:
+		child(sys.argv[2], sys.argv[3])
+	else:
+		main()
+# vim:noexpandtab:
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compares the ``ScreenExtractor`` engines: one ffmpeg process per screen
+grab (one at a time, and on every core) against a single ffmpeg process
+for all of them, on a short and a long synthetic video. Besides the
+time, it shows how many ffmpeg processes each run started and how many
+times they opened (and so probed) the video: the single engine saves
+the processes, not the opens.
+
+Usage:
+  ``python benchmarks/bench_screens.py [SHOTS]``
+
+Needs an ``ffmpeg`` with libx264 on the PATH; the test videos are
+generated with its ``testsrc`` source the first time round.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import pythonbits
+
+VIDEOS = [
+	('short', 60),
+	('long', 30 * 60),
+]
+
+def make_video(dirname, label, seconds):
+	fn = os.path.join(dirname, 'bench-%s.mkv' % label)
+	subprocess.check_call(['ffmpeg', '-loglevel', 'error', '-y',
+		'-f', 'lavfi', '-i', 'testsrc=size=1280x720:rate=24',
+		'-t', str(seconds), '-c:v', 'libx264', '-preset', 'ultrafast',
+		'-g', '240', fn])
+	return fn
+
+def main(shots=7):
+	try:
+		subprocess.Popen(['ffmpeg', '-version'], stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT).communicate()
+	except OSError:
+		print >> sys.stderr, 'ffmpeg is not installed; nothing to measure'
+		sys.exit(1)
+	runs = [
+		('per-shot', 1),
+		('per-shot', None),
+		('single', 1),
+	]
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		print '%-6s %-9s %5s %10s %6s %6s' % (
+			'video', 'engine', 'jobs', 'time (s)', 'runs', 'opens')
+		for label, seconds in VIDEOS:
+			fn = make_video(dirname, label, seconds)
+			for engine, jobs in runs:
+				extractor = pythonbits.ScreenExtractor(fn, shots, jobs,
+					engine=engine)
+				commands = []
+				def run_all(batch, on_done, run_all=extractor._run_all):
+					commands.extend(batch)
+					return run_all(batch, on_done)
+				extractor._run_all = run_all
+				start = time.time()
+				for img in extractor.extract():
+					os.remove(img)
+				elapsed = time.time() - start
+				print '%-6s %-9s %5d %10.3f %6d %6d' % (
+					label, engine, extractor.jobs, elapsed, len(commands),
+					sum([command.count('-i') for command in commands]))
+	finally:
+		shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		main(int(sys.argv[1]))
+	else:
+		main()
+# vim:noexpandtab:
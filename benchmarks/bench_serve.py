@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Drives the ``--serve`` job API of pythonbits entirely offline, checking
+every answer it gives, and measures how long jobs take through it one
+at a time and all at once.
+
+Usage:
+  ``python benchmarks/bench_serve.py [JOBS]``
+
+The daemon runs in this process on a UNIX socket in a temporary
+directory: the web pages are replayed from the fixtures by the
+``ReplayCache`` of bench_suite.py, OpenSubtitles is answered by its
+``ReplayTransport`` and the screenshots are kept by ``LocalUploader``.
+Needs an ``ffmpeg`` and a ``mediainfo`` on the PATH; the test video is
+generated with ffmpeg's ``testsrc`` source.
+"""
+import httplib
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xmlrpclib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+import bench_suite
+from bench_suite import pythonbits, opensubtitles
+
+class _UnixConnection(httplib.HTTPConnection):
+	def __init__(self, path):
+		httplib.HTTPConnection.__init__(self, 'localhost')
+		self.path = path
+
+	def connect(self):
+		self.sock = socket.socket(socket.AF_UNIX)
+		self.sock.connect(self.path)
+
+class _LogInTransport(bench_suite.ReplayTransport):
+	"""
+	Answers LogIn with a token, and everything else with the recorded
+	SearchSubtitles response.
+	"""
+	def request(self, url, body, headers):
+		if '<methodName>LogIn</methodName>' in body:
+			return xmlrpclib.dumps(({'status': '200 OK', 'token': 'replay',
+				'seconds': 0.0},), methodresponse=True)
+		return bench_suite.ReplayTransport.request(self, url, body, headers)
+
+def call(path, method, url, body=None):
+	"""
+	:return: the status and the decoded JSON of the answer of the daemon
+		on the socket ``path``
+	"""
+	conn = _UnixConnection(path)
+	try:
+		if body is not None:
+			body = json.dumps(body)
+		conn.request(method, url, body)
+		res = conn.getresponse()
+		return res.status, json.loads(res.read())
+	finally:
+		conn.close()
+
+def expect(what, got, wanted):
+	if got != wanted:
+		raise AssertionError('%s: expected %r, got %r' % (what, wanted, got))
+
+def make_video(dirname):
+	fn = os.path.join(dirname, 'The.Dark.Knight.2008.mkv')
+	subprocess.check_call(['ffmpeg', '-loglevel', 'error', '-y',
+		'-f', 'lavfi', '-i', 'testsrc=size=640x360:rate=24',
+		'-t', '30', '-c:v', 'libx264', '-preset', 'ultrafast', fn])
+	return fn
+
+def make_builder(dirname, uploader_name):
+	builder = pythonbits.PostBuilder(pythonbits.LocalUploader(os.path.join(dirname, 'screens')),
+		pythonbits.ProbeCache(os.path.join(dirname, 'probe.json')),
+		opensubtitles.HashCache(os.path.join(dirname, 'hashes.json')),
+		number_of_screens=2)
+	builder._osub = opensubtitles.OpenSubtitlesClient(opensubtitles.USER_AGENT,
+		_LogInTransport())
+	return builder
+
+def check_addresses(dirname):
+	"""
+	Checks that serveJobs refuses what it must not serve on.
+	"""
+	not_a_socket = os.path.join(dirname, 'not-a-socket')
+	open(not_a_socket, 'w').close()
+	for address in (not_a_socket, '192.0.2.1:0', 'nowhere:x'):
+		try:
+			pythonbits.serveJobs(address, pythonbits.JobQueue(None), ['local'])
+		except ValueError:
+			pass
+		else:
+			raise AssertionError('served jobs on %s' % address)
+	if not os.path.exists(not_a_socket):
+		raise AssertionError('serveJobs removed %s' % not_a_socket)
+
+def drive(path, media, jobs, report):
+	"""
+	Sends the daemon on ``path`` its jobs, checking each answer, then
+	stops it; what went wrong, if anything, goes in ``report``.
+	"""
+	try:
+		for i in xrange(0, 50):
+			if os.path.exists(path):
+				break
+			time.sleep(0.1)
+		expect('socket mode', os.stat(path).st_mode & 0777, 0600)
+		movie = {'name': bench_suite.MOVIE, 'file': media, 'uploader': 'local'}
+
+		start = time.time()
+		status, job = call(path, 'POST', '/jobs', dict(movie, wait=True))
+		report['one job (s)'] = time.time() - start
+		expect('waited job', (status, job['status'], job['error']), (200, 'done', None))
+		if bench_suite.MOVIE not in job['bbcode'] or '[img=file://' not in job['bbcode']:
+			raise AssertionError('unexpected post:\n%s' % job['bbcode'])
+
+		start = time.time()
+		queued = [call(path, 'POST', '/jobs', movie) for i in xrange(0, jobs)]
+		for status, job in queued:
+			expect('queued job', status, 202)
+		for status, job in queued:
+			status, job = call(path, 'GET', '/jobs/%d?wait=600' % job['id'])
+			expect('job %d' % job['id'], (status, job['status']), (200, 'done'))
+		report['%d jobs (s)' % jobs] = time.time() - start
+
+		status, job = call(path, 'POST', '/jobs?wait=60',
+			dict(movie, file=os.path.join(os.path.dirname(media), 'missing.mkv')))
+		expect('job of a missing file', (status, job['status']), (200, 'failed'))
+		for body in ({'name': 'x'}, dict(movie, uploader='nowhere'), [1]):
+			expect('bad job %r' % (body,), call(path, 'POST', '/jobs', body)[0], 400)
+		expect('unknown job', call(path, 'GET', '/jobs/9999')[0], 404)
+		status, stats = call(path, 'GET', '/stats')
+		expect('jobs done', stats.get('done'), jobs + 1)
+		expect('jobs failed', stats.get('failed'), 1)
+	except Exception, ex:
+		report['error'] = '%s: %s' % (ex.__class__.__name__, ex)
+	finally:
+		os.kill(os.getpid(), signal.SIGTERM)
+
+def main(jobs=4):
+	for tool in ('ffmpeg', 'mediainfo'):
+		try:
+			subprocess.Popen([tool, '--version'], stdout=subprocess.PIPE,
+				stderr=subprocess.STDOUT).communicate()
+		except OSError:
+			print >> sys.stderr, '%s is not installed; nothing to measure' % tool
+			sys.exit(1)
+	logging.basicConfig()
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		bench_suite.load_config(dirname)
+		pythonbits._MyOpener.cache = bench_suite.ReplayCache()
+		media = make_video(dirname)
+		check_addresses(dirname)
+		queue = pythonbits.JobQueue(lambda name: make_builder(dirname, name), 2)
+		path = os.path.join(dirname, 'jobs.sock')
+		report = {}
+		client = threading.Thread(target=drive, args=(path, media, jobs, report))
+		client.start()
+		pythonbits.serveJobs(path, queue, ['local'], 'local')
+		client.join()
+		if 'error' in report:
+			print >> sys.stderr, report.pop('error')
+			sys.exit(1)
+		if os.path.exists(path):
+			raise AssertionError('the socket outlived the daemon')
+		for name in sorted(report):
+			print '%-14s %8.3f' % (name, report[name])
+	finally:
+		shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		main(int(sys.argv[1]))
+	else:
+		main()
+# vim:noexpandtab:
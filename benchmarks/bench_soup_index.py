@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Compares ``findAll`` on a ``BeautifulSoup`` tree parsed with
+``indexTree=True`` against the plain scan of every element, on the IMDb
+title page fixture and on pages made of several copies of it.
+
+Usage:
+  ``python benchmarks/bench_soup_index.py [COPIES]``
+
+The index costs extra time while parsing; the break-even column is how
+many searches of the kind timed it takes to earn that back. The last row
+of each page parses it and runs ``microdata.run_scopes``, which takes
+every item out of the tree as it searches.
+"""
+import os
+import re
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+from BeautifulSoup import BeautifulSoup
+import microdata
+
+SEARCHES = [
+	('name', lambda soup: soup.findAll('a')),
+	('name+class', lambda soup: soup.findAll('td', {'class': 'name'})),
+	('id', lambda soup: soup.find('div', {'id': 'titleDetails'})),
+	('attr', lambda soup: soup.findAll(attrs={'itemprop': True})),
+	('attr regex', lambda soup: soup.findAll('a', href=re.compile('^/name/'))),
+	('css class', lambda soup: soup.findAll('div', 'txt-block')),
+	('scoped', lambda soup: soup.find('div', {'id': 'titleCast'}).findAll('a')),
+]
+
+def make_page(copies):
+	"""
+	Repeats the body of the title page ``copies`` times.
+	"""
+	page = open(os.path.join(HERE, 'fixtures', 'imdb_title.html')).read()
+	head, rest = page.split('<body', 1)
+	body, tail = rest.split('</body>', 1)
+	body = body.split('>', 1)[1]
+	return '%s<body>%s</body>%s' % (head, body * copies, tail)
+
+def main(copies=10):
+	print '%-7s %-11s %11s %11s %8s %10s' % (
+		'copies', 'search', 'scan (ms)', 'index (ms)', 'speedup', 'break-even')
+	for n in sorted(set([1, copies])):
+		page = make_page(n)
+		plain = BeautifulSoup(page)
+		indexed = BeautifulSoup(page, indexTree=True)
+		parse = min(timeit.repeat(lambda: BeautifulSoup(page), number=1, repeat=3))
+		parse_indexed = min(timeit.repeat(
+			lambda: BeautifulSoup(page, indexTree=True), number=1, repeat=3))
+		overhead = parse_indexed - parse
+		print '%-7d %-11s %11.1f %11.1f' % (
+			n, 'parse', parse * 1000, parse_indexed * 1000)
+		for label, search in SEARCHES:
+			if search(plain) != search(indexed):
+				raise AssertionError('results differ for %s' % label)
+			scan = min(timeit.repeat(lambda: search(plain), number=1, repeat=5))
+			index = min(timeit.repeat(lambda: search(indexed), number=1, repeat=5))
+			if scan > index:
+				breakeven = '%10d' % max(1, round(overhead / (scan - index)))
+			else:
+				breakeven = '%10s' % '-'
+			print '%-7d %-11s %11.3f %11.3f %7.1fx %s' % (
+				n, label, scan * 1000, index * 1000, scan / index, breakeven)
+		scan = min(timeit.repeat(
+			lambda: microdata.run_scopes(BeautifulSoup(page)), number=1, repeat=3))
+		index = min(timeit.repeat(
+			lambda: microdata.run_scopes(BeautifulSoup(page, indexTree=True)),
+			number=1, repeat=3))
+		print '%-7d %-11s %11.1f %11.1f %7.1fx' % (
+			n, 'run_scopes', scan * 1000, index * 1000, scan / index)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		main(int(sys.argv[1]))
+	else:
+		main()
+# vim:noexpandtab:
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Measures how much memory a ``BeautifulSoup`` tree of the saved pages
+takes: the size of its nodes as ``sys.getsizeof`` has it (with their
+``__dict__``, ``contents`` and ``attrs``), and how far parsing pushes the
+peak resident set size up.
+
+Usage:
+  ``python benchmarks/bench_soup_memory.py [BASELINE]``
+
+``BASELINE`` is another ``BeautifulSoup.py`` to compare with, such as
+one written out by ``git show HEAD~1:BeautifulSoup.py``. Every
+measurement runs in its own interpreter, since the peak resident set
+size of a process only ever goes up.
+"""
+import gc
+import imp
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CURRENT = os.path.join(HERE, os.pardir, 'BeautifulSoup.py')
+
+PAGES = [
+	('imdb_title', 'imdb_title.html', 1),
+	('imdb_plot', 'imdb_plotsummary.html', 1),
+	('google', 'google_search.html', 1),
+	('imdb_title x10', 'imdb_title.html', 10),
+]
+
+def read_page(basename, copies):
+	page = open(os.path.join(HERE, 'fixtures', basename)).read()
+	if copies == 1:
+		return page
+	head, rest = page.split('<body', 1)
+	body, tail = rest.split('</body>', 1)
+	body = body.split('>', 1)[1]
+	return '%s<body>%s</body>%s' % (head, body * copies, tail)
+
+def tree_size(soup, Tag):
+	"""
+	:return: the number of nodes beneath ``soup`` and their size in bytes
+	"""
+	nodes = size = 0
+	for node in soup.recursiveChildGenerator():
+		nodes += 1
+		size += sys.getsizeof(node)
+		# a __dict__ slot only gets a dict once something is set in it,
+		# and asking for it would make one
+		if not hasattr(type(node), '__slots__') and hasattr(node, '__dict__'):
+			size += sys.getsizeof(node.__dict__)
+			attrMap = node.__dict__.get('attrMap')
+			if attrMap is not None:
+				size += sys.getsizeof(attrMap)
+		if isinstance(node, Tag):
+			size += sys.getsizeof(node.contents) + sys.getsizeof(node.attrs)
+			size += sum(sys.getsizeof(attr) for attr in node.attrs)
+	return nodes, size
+
+def child(path, basename, copies):
+	"""
+	Parses a page and searches it the way the scrapers do, printing the
+	node count, tree size, peak RSS growth in KiB and elapsed seconds.
+	"""
+	module = imp.load_source('BeautifulSoup', path)
+	page = read_page(basename, copies)
+	gc.collect()
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.time()
+	soup = module.BeautifulSoup(page)
+	soup.findAll(attrs={'itemprop': True})
+	soup.findAll('a', href=re.compile('^/'))
+	elapsed = time.time() - start
+	after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	nodes, size = tree_size(soup, module.Tag)
+	print nodes, size, after - before, elapsed
+
+def main(baseline=None):
+	versions = [('current', os.path.abspath(CURRENT))]
+	if baseline:
+		versions.insert(0, ('baseline', os.path.abspath(baseline)))
+	print '%-15s %8s %-9s %7s %10s %10s %12s %9s' % ('page', 'HTML KiB',
+		'version', 'nodes', 'B/node', 'tree KiB', 'RSS +KiB', 'time (s)')
+	for label, basename, copies in PAGES:
+		html = len(read_page(basename, copies))
+		for version, path in versions:
+			out = subprocess.Popen(
+				[sys.executable, os.path.abspath(__file__), '--child',
+					path, basename, str(copies)],
+				stdout=subprocess.PIPE).communicate()[0]
+			nodes, size, growth, elapsed = out.split()
+			print '%-15s %8d %-9s %7s %10.1f %10.1f %12s %9.3f' % (label,
+				html / 1024, version, nodes, float(size) / int(nodes),
+				int(size) / 1024.0, growth, float(elapsed))
+
+if __name__ == '__main__':
+	if len(sys.argv) == 5 and '--child' == sys.argv[1]:
+		child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+	elif len(sys.argv) > 1:
+		main(sys.argv[1])
+	else:
+		main()
+# vim:noexpandtab:
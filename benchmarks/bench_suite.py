@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+"""
+Runs every parsing, hashing and encoding benchmark of pythonbits offline,
+replaying the pages and responses kept in ``benchmarks/fixtures``, and
+writes the results as JSON so that runs on different commits can be
+compared.
+
+Usage:
+  ``python benchmarks/bench_suite.py [-o RESULTS.json] [-r REPEAT] [--only NAME]``
+  ``python benchmarks/bench_suite.py --compare BASELINE.json [-o RESULTS.json]``
+  ``python benchmarks/bench_suite.py --record``
+
+The fixtures are a Google results page, an IMDB title page and its plot
+summary, a TVRage quickinfo answer and an OpenSubtitles SearchSubtitles
+response. ``--record`` fetches them again from the live services; the
+media files are made up on the spot, sparse like those of
+bench_hash.py. Each result holds the best, median and worst seconds a
+call took over REPEAT rounds, and the throughput of the best for the
+benchmarks that chew through a known number of bytes.
+"""
+import hashlib
+import json
+import mimetools
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib
+from optparse import OptionParser
+from StringIO import StringIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import pythonbits
+import microdata
+import opensubtitles
+import MultipartPostHandler
+from BeautifulSoup import BeautifulSoup
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+SUITE_VERSION = 1
+
+# what the fixtures hold, and where --record gets them
+MOVIE = 'The Dark Knight'
+IMDB_URL = 'http://www.imdb.com/title/tt0468569'
+SHOW = 'Breaking Bad'
+EPISODE = (1, 1)
+# the example of the OpenSubtitles API documentation
+MEDIA_HASH = '8e245d9679d31e12'
+MEDIA_SIZE = 12909756
+
+# the synthetic media: label -> size in bytes
+MEDIA = [
+	('12M', MEDIA_SIZE),
+	('700M', 700 * 1024 * 1024),
+]
+UPLOAD_SIZE = 4 * 1024 * 1024
+
+def fixture(name):
+	fh = open(os.path.join(FIXTURES, name), 'rb')
+	try:
+		return fh.read()
+	finally:
+		fh.close()
+
+def fixtures_digest():
+	"""
+	:return: the SHA-1 of every fixture, so that results measured on
+		different fixtures are not mistaken for comparable
+	"""
+	digest = hashlib.sha1()
+	for name in sorted(os.listdir(FIXTURES)):
+		digest.update(name)
+		digest.update(fixture(name))
+	return digest.hexdigest()
+
+class ReplayCache(object):
+	"""
+	Stands in for the ``HTTPCache`` of ``_MyOpener``, answering every GET
+	with the fixture its URL maps to, so the scrapers run through their
+	real code path without a network.
+	"""
+	ROUTES = [
+		('google.com/search', 'google_search.html'),
+		('/plotsummary', 'imdb_plotsummary.html'),
+		('imdb.com/title/', 'imdb_title.html'),
+		('tvrage.com/tools/quickinfo', 'tvrage_quickinfo.txt'),
+	]
+	def __init__(self):
+		self.pages = dict([(name, fixture(name)) for part, name in ReplayCache.ROUTES])
+
+	def open(self, opener, url):
+		for part, name in ReplayCache.ROUTES:
+			if part in url:
+				headers = mimetools.Message(StringIO('Content-Type: text/html\r\n\r\n'))
+				return urllib.addinfourl(StringIO(self.pages[name]), headers, url, 200)
+		raise IOError('no fixture for %s' % url)
+
+class ReplayTransport(object):
+	"""
+	An OpenSubtitles transport answering every call with the recorded
+	SearchSubtitles response.
+	"""
+	def __init__(self):
+		self.response = fixture('opensubtitles_search.xml')
+
+	def request(self, url, body, headers):
+		return self.response
+
+	def close(self):
+		pass
+
+	def stats(self):
+		return 'replay transport'
+
+class RecordingTransport(opensubtitles.UrllibTransport):
+	"""
+	Keeps the last response it carried, for --record.
+	"""
+	last = None
+	def request(self, url, body, headers):
+		self.last = opensubtitles.UrllibTransport.request(self, url, body, headers)
+		return self.last
+
+def load_config(dirname):
+	"""
+	Reads the config.xml of the tree, from a copy in ``dirname`` so that
+	its snapshot stays out of the tree, into ``pythonbits.conf``.
+	"""
+	# PythonbitsConfig looks for config.xml in the temp directory
+	tempfile.tempdir = dirname
+	location = os.path.join(dirname, 'config.xml')
+	shutil.copy(os.path.join(HERE, os.pardir, 'config.xml'), location)
+	conf = pythonbits.PythonbitsConfig()
+	conf.set_location(location)
+	conf.read()
+	pythonbits.conf = conf
+	return conf
+
+def make_media(dirname, label, size):
+	"""
+	Writes a file of ``size`` bytes whose head and tail are
+	pseudo-random, leaving the middle as a hole.
+	"""
+	fn = os.path.join(dirname, 'bench-%s.mkv' % label)
+	fh = open(fn, 'wb')
+	fh.write(os.urandom(opensubtitles.HASH_CHUNK_SIZE))
+	fh.seek(size - opensubtitles.HASH_CHUNK_SIZE)
+	fh.write(os.urandom(opensubtitles.HASH_CHUNK_SIZE))
+	fh.close()
+	return fn
+
+def benchmarks(dirname):
+	"""
+	:return: a list of (name, func, bytes) tuples, ``bytes`` being how
+		much input each call of ``func`` goes through, or None
+	"""
+	title_page = fixture('imdb_title.html')
+	google_page = fixture('google_search.html')
+	quickinfo = fixture('tvrage_quickinfo.txt').replace('<pre>', '', 1)
+	osub_response = fixture('opensubtitles_search.xml')
+	result = []
+
+	def search_movie():
+		return pythonbits.SearchMovie(MOVIE).results
+	if search_movie()[0][1] != IMDB_URL + '/':
+		raise AssertionError('SearchMovie did not find %s' % IMDB_URL)
+	result.append(('SearchMovie', search_movie, len(google_page)))
+
+	for streaming in (False, True):
+		def parse_page(streaming=streaming):
+			imdb = pythonbits.SearchImdb.__new__(pythonbits.SearchImdb)
+			imdb.STREAM_MICRODATA = streaming
+			imdb._SearchImdb__parsePage(title_page)
+			return imdb
+		if parse_page().title != MOVIE:
+			raise AssertionError('SearchImdb did not parse %s' % IMDB_URL)
+		result.append(('SearchImdb.__parsePage[%s]' % (streaming and 'stream' or 'soup'),
+			parse_page, len(title_page)))
+
+	def get_summary():
+		imdb = pythonbits.SearchImdb.__new__(pythonbits.SearchImdb)
+		imdb.url = IMDB_URL
+		imdb.opener = pythonbits._MyOpener()
+		imdb.summary = []
+		imdb.shortdescription = ''
+		imdb.getSummary()
+		return imdb.summary
+	if not get_summary():
+		raise AssertionError('getSummary found no summary')
+	result.append(('SearchImdb.getSummary', get_summary,
+		len(fixture('imdb_plotsummary.html'))))
+
+	if microdata.extract(title_page) != microdata.extract(title_page, streaming=True):
+		raise AssertionError('the microdata extractors disagree')
+	result.append(('microdata.extract[soup]',
+		lambda: microdata.extract(title_page), len(title_page)))
+	result.append(('microdata.extract[stream]',
+		lambda: microdata.extract(title_page, streaming=True), len(title_page)))
+
+	tv = pythonbits.SearchTV.__new__(pythonbits.SearchTV)
+	if tv._parse_tvrage_quickinfo(quickinfo).get('Show Name') != SHOW:
+		raise AssertionError('_parse_tvrage_quickinfo did not find %s' % SHOW)
+	result.append(('SearchTV._parse_tvrage_quickinfo',
+		lambda: tv._parse_tvrage_quickinfo(quickinfo), len(quickinfo)))
+
+	client = opensubtitles.OpenSubtitlesClient(opensubtitles.USER_AGENT, ReplayTransport())
+	client.token = 'replay'
+	def search_subtitles():
+		return client.SearchSubtitlesBatch([(MEDIA_SIZE, MEDIA_HASH)])
+	if not search_subtitles()[0]:
+		raise AssertionError('SearchSubtitlesBatch found no subtitles')
+	result.append(('OpenSubtitles.SearchSubtitlesBatch', search_subtitles,
+		len(osub_response)))
+
+	for label, size in MEDIA:
+		fn = make_media(dirname, label, size)
+		result.append(('hash_filename[%s]' % label,
+			lambda fn=fn: opensubtitles.hash_filename(fn), 2 * opensubtitles.HASH_CHUNK_SIZE))
+
+	upload = make_media(dirname, 'upload', UPLOAD_SIZE)
+	def encode():
+		fh = open(upload, 'rb')
+		try:
+			return MultipartPostHandler.MultipartPostHandler.multipart_encode(
+				[('key', 'benchmark')], [('image', fh)], 'BENCHMARK')
+		finally:
+			fh.close()
+	result.append(('MultipartPostHandler.multipart_encode', encode, UPLOAD_SIZE))
+
+	for name, page in (('imdb_title', title_page), ('google_search', google_page)):
+		result.append(('BeautifulSoup.parse[%s]' % name,
+			lambda page=page: BeautifulSoup(page), len(page)))
+	result.append(('BeautifulSoup.parse[imdb_title,indexed]',
+		lambda: BeautifulSoup(title_page, indexTree=True), len(title_page)))
+	def search_soup(soup):
+		# the kinds of lookups the scrapers make
+		return (soup.findAll('a'),
+			soup.findAll('td', {'class': 'name'}),
+			soup.find('div', {'id': 'titleDetails'}),
+			soup.findAll(attrs={'itemprop': True}),
+			soup.find('h1').findNextSibling('div'),
+			soup.find('div', {'class': 'show_synopsis'}))
+	soup = BeautifulSoup(title_page)
+	indexed = BeautifulSoup(title_page, indexTree=True)
+	if search_soup(soup) != search_soup(indexed):
+		raise AssertionError('the tree index changes what findAll finds')
+	result.append(('BeautifulSoup.findAll',
+		lambda: search_soup(soup), None))
+	result.append(('BeautifulSoup.findAll[indexed]',
+		lambda: search_soup(indexed), None))
+	return result
+
+def measure(func, repeat, min_time=0.2):
+	"""
+	Times ``func`` over ``repeat`` rounds of as many calls as it takes
+	for a round to last ``min_time`` seconds.
+
+	:return: the number of calls per round, and the seconds per call of
+		each round
+	"""
+	number = 1
+	while True:
+		start = time.time()
+		for _ in xrange(number):
+			func()
+		elapsed = time.time() - start
+		if elapsed >= min_time:
+			break
+		number *= 2
+	rounds = [elapsed / number]
+	for _ in xrange(repeat - 1):
+		start = time.time()
+		for _ in xrange(number):
+			func()
+		rounds.append((time.time() - start) / number)
+	return number, rounds
+
+def git_describe():
+	try:
+		out = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+			cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0]
+	except OSError:
+		return None
+	return out.strip() or None
+
+def run(repeat, only=None):
+	"""
+	:return: the results, ready for JSON
+	"""
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	saved_cache = pythonbits._MyOpener.cache
+	try:
+		load_config(dirname)
+		pythonbits._MyOpener.cache = ReplayCache()
+		results = []
+		for name, func, size in benchmarks(dirname):
+			if only and not [part for part in only if part in name]:
+				continue
+			number, rounds = measure(func, repeat)
+			rounds.sort()
+			best = rounds[0]
+			entry = {
+				'name': name,
+				'number': number,
+				'repeat': repeat,
+				'best': best,
+				'median': rounds[len(rounds) // 2],
+				'worst': rounds[-1],
+				'bytes': size,
+				'bytes_per_second': size and best and size / best or None,
+			}
+			results.append(entry)
+			print >> sys.stderr, '%-40s %12.6f s %10s' % (name, best,
+				size and '%.1f MB/s' % (size / best / 1e6) or '')
+	finally:
+		pythonbits._MyOpener.cache = saved_cache
+		tempfile.tempdir = None
+		shutil.rmtree(dirname)
+	return {
+		'suite': SUITE_VERSION,
+		'created_at': time.time(),
+		'commit': git_describe(),
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'platform': platform.platform(),
+		'fixtures': fixtures_digest(),
+		'results': results,
+	}
+
+def compare(baseline, current, out=sys.stderr):
+	"""
+	Prints how the best time of each benchmark moved since ``baseline``.
+	"""
+	if baseline.get('fixtures') != current.get('fixtures'):
+		print >> out, 'warning: the baseline was measured on other fixtures'
+	before = dict([(r['name'], r) for r in baseline['results']])
+	print >> out, '%-40s %12s %12s %8s' % ('benchmark', 'baseline (s)', 'now (s)', 'change')
+	for r in current['results']:
+		if r['name'] not in before:
+			print >> out, '%-40s %12s %12.6f %8s' % (r['name'], '-', r['best'], 'new')
+			continue
+		old = before[r['name']]['best']
+		print >> out, '%-40s %12.6f %12.6f %+7.1f%%' % (r['name'], old, r['best'],
+			(r['best'] - old) / old * 100)
+
+def record():
+	"""
+	Fetches the fixtures again from the live services.
+	"""
+	dirname = tempfile.mkdtemp(prefix='pythonbits-bench-')
+	try:
+		conf = load_config(dirname)
+		pythonbits._MyOpener.cache = None
+		opener = pythonbits._MyOpener()
+		pages = [
+			('google_search.html', conf.string('google_url') % urllib.quote_plus(MOVIE)),
+			('imdb_title.html', IMDB_URL + '/'),
+			('imdb_plotsummary.html', IMDB_URL + '/plotsummary'),
+			('tvrage_quickinfo.txt', conf.string('tvrage_quickinfo') % {
+				'query': urllib.quote(SHOW), 'episode_cross': '%sx%s' % EPISODE}),
+		]
+		for name, url in pages:
+			fh = opener.open(url)
+			save_fixture(name, fh.read())
+			fh.close()
+		transport = RecordingTransport()
+		client = opensubtitles.OpenSubtitlesClient(opensubtitles.USER_AGENT, transport)
+		client.LogIn('', '')
+		try:
+			client.SearchSubtitlesBatch([(MEDIA_SIZE, MEDIA_HASH)])
+			save_fixture('opensubtitles_search.xml', transport.last)
+		finally:
+			client.LogOut()
+	finally:
+		tempfile.tempdir = None
+		shutil.rmtree(dirname)
+
+def save_fixture(name, data):
+	fh = open(os.path.join(FIXTURES, name), 'wb')
+	try:
+		fh.write(data)
+	finally:
+		fh.close()
+	print >> sys.stderr, 'recorded %s (%d bytes)' % (name, len(data))
+
+def main():
+	parser = OptionParser(usage='%prog [-o RESULTS.json] [-r REPEAT] [--only NAME] '
+		'[--compare BASELINE.json] | --record')
+	parser.add_option('-o', '--output', dest='output', metavar='FILE',
+		help='write the JSON results to FILE rather than stdout')
+	parser.add_option('-r', '--repeat', dest='repeat', type='int', default=5,
+		help='how many rounds to time each benchmark over (default: 5)')
+	parser.add_option('--only', dest='only', action='append', metavar='NAME',
+		help='only run the benchmarks whose name contains NAME; may be repeated')
+	parser.add_option('--compare', dest='compare', metavar='FILE',
+		help='compare the results with those of an earlier run saved in FILE')
+	parser.add_option('--record', dest='record', action='store_true',
+		help='fetch the fixtures again from the live services, and stop')
+	options, args = parser.parse_args()
+	if options.record:
+		record()
+		return
+	results = run(options.repeat, options.only)
+	if options.compare:
+		fh = open(options.compare)
+		try:
+			compare(json.load(fh), results)
+		finally:
+			fh.close()
+	data = json.dumps(results, indent=1, sort_keys=True)
+	if options.output:
+		fh = open(options.output, 'w')
+		try:
+			fh.write(data + '\n')
+		finally:
+			fh.close()
+	else:
+		print data
+
+if __name__ == '__main__':
+	main()
+# vim:noexpandtab:
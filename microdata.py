@@ -2,6 +2,46 @@
 Tries to extract the information described by the
 http://schema.org/ microdata attributes.
 """
+import re
+from sgmllib import SGMLParser, SGMLParseError
+
+HEX_CHAR_RE = re.compile(r'\&#(x?[0-9A-Fa-f]+);')
+
+def _unescape( text ):
+	"""
+	Replaces the numeric character references left in a property value.
+	:param text: the property value as rendered by the soup
+	:returns: ``text`` with every ``&#...;`` turned into its character
+	"""
+	def unescaper( ma ):
+		txt = ma.group(1)
+		if 'x' == txt[0]:
+			val = int(txt[1:], 16)
+		else:
+			val = int(txt)
+		return chr( val )
+	return HEX_CHAR_RE.sub( unescaper, text )
+
+def _add_property( result, result_key, p_value ):
+	"""
+	Stores a property value, turning repeated properties into a list.
+	:param result: the item map being built
+	:param result_key: the namespace-qualified property name
+	:param p_value: the property value
+	"""
+	if result_key in result:
+		# a multi-value
+		old_value = result[ result_key ]
+		if isinstance(old_value, str) \
+		or isinstance(old_value, unicode):
+			new_value = [ old_value, p_value ]
+			result[ result_key ] = new_value
+		elif isinstance(old_value, list):
+			old_value.append( p_value )
+		else:
+			raise ValueError("What is %s?" % type(old_value))
+	else:
+		result[ result_key ] = p_value
 
 def run_scope( item_type ):
 	"""
@@ -12,8 +52,6 @@ def run_scope( item_type ):
 	:returns: a map containing the namespace-qualified item properties
 	"""
 	DEBUG = False
-	import re
-	HEX_CHAR_RE = re.compile(r'\&#(x?[0-9A-Fa-f]+);')
 	result = {}
 	i_type = item_type['itemtype']
 	if DEBUG:
@@ -36,31 +74,8 @@ def run_scope( item_type ):
 			p_value = ''
 		elif len(p_value) > 0:
 			p_value = str(p_value[0]).strip()
-		def unescaper( ma ):
-			txt = ma.group(1)
-			if 'x' == txt[0]:
-				val = int(txt[1:], 16)
-			else:
-				val = int(txt)
-			result = chr( val )
-			if DEBUG:
-				print "UNESC(%s)=>(%s)" % (txt, result)
-			return result
-		p_value = HEX_CHAR_RE.sub( unescaper, p_value )
-		result_key = '%s/%s' % (i_type, p_name)
-		if result_key in result:
-			# a multi-value
-			old_value = result[ result_key ]
-			if isinstance(old_value, str) \
-			or isinstance(old_value, unicode):
-				new_value = [ old_value, p_value ]
-				result[ result_key ] = new_value
-			elif isinstance(old_value, list):
-				old_value.append( p_value )
-			else:
-				raise ValueError("What is %s?" % type(old_value))
-		else:
-			result[ result_key ] = p_value
+		p_value = _unescape( p_value )
+		_add_property( result, '%s/%s' % (i_type, p_name), p_value )
 	# remove this item from the 'Soup tree
 	item_type.extract()
 	if not len(result):
@@ -93,19 +108,370 @@ def run_scopes( starting_with ):
 		t.extract()
 	return results
 
-def extract( text_or_file ):
+def walk_scopes( starting_with ):
+	"""
+	Finds the same microdata items as ``run_scopes``, but in a single
+	pass over the tree and without removing anything from it.
+	A stack of the open item scopes tells which item each ``itemprop``
+	belongs to, so no element is visited more than once.
+	:param starting_with: the node from which to begin our search
+	:returns: a list of microdata items, the format of which is described
+	by ``run_scope``
+	"""
+	from BeautifulSoup import Tag
+	results = []
+	# each open scope is [itemtype, properties, children]
+	scopes = []
+	# each frame is (iterator over the contents, scope closed on exhaustion)
+	frames = [ (iter(starting_with.contents), None) ]
+	while frames:
+		contents, scope = frames[-1]
+		node = next(contents, None)
+		if node is None:
+			frames.pop()
+			if scope is not None:
+				i_type, result, children = scopes.pop()
+				if children:
+					# don't qualify this so it isn't mistaken for a microdata attribute
+					result[ 'children' ] = children
+				if result:
+					if scopes:
+						scopes[-1][2].append( result )
+					else:
+						results.append( result )
+			continue
+		if not isinstance(node, Tag):
+			continue
+		i_type = node.get('itemtype')
+		if i_type is not None:
+			scopes.append( [i_type, {}, []] )
+			frames.append( (iter(node.contents), i_type) )
+			continue
+		p_name = node.get('itemprop')
+		if p_name is not None and scopes:
+			p_value = ''
+			for child in node.contents:
+				# nested items don't count towards the value of a property
+				if not isinstance(child, Tag) or child.get('itemtype') is None:
+					p_value = _unescape( str(child).strip() )
+					break
+			_add_property( scopes[-1][1], '%s/%s' % (scopes[-1][0], p_name), p_value )
+		if node.contents:
+			frames.append( (iter(node.contents), None) )
+	return results
+
+class _Capture(object):
+	"""
+	The value of one ``itemprop``, filled in while the page streams past.
+	"""
+	__slots__ = ('key', 'value', 'markup', 'depth')
+
+	def __init__( self, key ):
+		self.key = key
+		self.value = None
+		# the markup of the first child, when that child is a tag
+		self.markup = None
+		# how deep in the tag stack that first child sits
+		self.depth = None
+
+class _StreamParser(SGMLParser):
+	"""
+	Builds the microdata items straight from the parser events, without
+	keeping the document around. It opens and closes tags by the same
+	rules ``BeautifulSoup`` uses, so the scopes come out the same as in
+	the soup, but all it remembers is the stack of open tag names and
+	the items that are still being filled in.
+	"""
+	ASCII_SPACES = '\t\n\x0c\r '
+
+	def __init__( self ):
+		from BeautifulSoup import BeautifulSoup
+		self.SELF_CLOSING_TAGS = BeautifulSoup.SELF_CLOSING_TAGS
+		self.NESTABLE_TAGS = BeautifulSoup.NESTABLE_TAGS
+		self.RESET_NESTING_TAGS = BeautifulSoup.RESET_NESTING_TAGS
+		self.QUOTE_TAGS = BeautifulSoup.QUOTE_TAGS
+		self.PRESERVE_WHITESPACE_TAGS = BeautifulSoup.PRESERVE_WHITESPACE_TAGS
+		self.BARE_AMPERSAND_OR_BRACKET = BeautifulSoup.BARE_AMPERSAND_OR_BRACKET
+		self.XML_SPECIAL_CHARS_TO_ENTITIES = BeautifulSoup.XML_SPECIAL_CHARS_TO_ENTITIES
+		SGMLParser.__init__( self )
+
+	def reset( self ):
+		SGMLParser.reset( self )
+		self.results = []
+		# each open tag is [name, opened a scope, its itemprop capture]
+		self.tags = []
+		# each open scope is [itemtype, captures, children]
+		self.scopes = []
+		# captures whose first child is a tag being rendered right now
+		self.recording = []
+		self.currentData = []
+		self.quoteStack = []
+
+	# -- what the soup would have done with the tree
+
+	def _node( self, markup, tag=False, i_type=None ):
+		"""
+		Hands a new child of the current tag to whoever wants it: the
+		capture of the current tag if it has no value yet, and any
+		capture that is rendering one of our ancestors.
+		"""
+		for capture in self.recording:
+			capture.markup.append( markup )
+		if not self.tags:
+			return
+		capture = self.tags[-1][2]
+		if capture is None or capture.value is not None \
+		or capture.markup is not None:
+			return
+		if not tag:
+			capture.value = markup
+		elif i_type is None:
+			# rendered until this child is closed again
+			capture.markup = [ markup ]
+			capture.depth = len(self.tags) + 1
+			self.recording.append( capture )
+
+	def _push( self, name, attrs, self_closing ):
+		attr_map = dict(attrs)
+		i_type = attr_map.get('itemtype')
+		p_name = attr_map.get('itemprop')
+		self._node( self._render_start(name, attrs, self_closing),
+			True, i_type )
+		capture = None
+		if i_type is not None:
+			self.scopes.append( [i_type, [], []] )
+		elif p_name is not None and self.scopes:
+			scope = self.scopes[-1]
+			capture = _Capture( '%s/%s' % (scope[0], p_name) )
+			scope[1].append( capture )
+		self.tags.append( [name, i_type is not None, capture, self_closing] )
+		if self_closing:
+			self._pop()
+
+	def _pop( self ):
+		depth = len(self.tags)
+		name, is_scope, capture, self_closing = self.tags.pop()
+		if not self_closing:
+			for rec in self.recording:
+				rec.markup.append( '</%s>' % name )
+		while self.recording and self.recording[-1].depth == depth:
+			rec = self.recording.pop()
+			rec.value = ''.join( rec.markup )
+			rec.markup = None
+		if capture is not None and capture.value is None:
+			capture.value = ''
+		if is_scope:
+			i_type, captures, children = self.scopes.pop()
+			result = {}
+			if children:
+				# don't qualify this so it isn't mistaken for a microdata attribute
+				result[ 'children' ] = children
+			for capture in captures:
+				_add_property( result, capture.key,
+					_unescape( capture.value.strip() ) )
+			if result:
+				if self.scopes:
+					self.scopes[-1][2].append( result )
+				else:
+					self.results.append( result )
+
+	def _render_start( self, name, attrs, self_closing ):
+		rendered = []
+		for key, val in attrs:
+			fmt = '%s="%s"'
+			if '"' in val:
+				fmt = "%s='%s'"
+				if "'" in val:
+					val = val.replace("'", "&squot;")
+			val = self.BARE_AMPERSAND_OR_BRACKET.sub( self._sub_entity, val )
+			rendered.append( fmt % (key, val) )
+		close = ''
+		if self_closing:
+			close = ' /'
+		if rendered:
+			return '<%s %s%s>' % (name, ' '.join(rendered), close)
+		return '<%s%s>' % (name, close)
+
+	def _sub_entity( self, x ):
+		return "&" + self.XML_SPECIAL_CHARS_TO_ENTITIES[x.group(0)[0]] + ";"
+
+	def _popToTag( self, name, inclusivePop=True ):
+		numPops = 0
+		for i in range(len(self.tags)-1, -1, -1):
+			if name == self.tags[i][0]:
+				numPops = len(self.tags)-i
+				break
+		if not inclusivePop:
+			numPops = numPops - 1
+		for i in range(0, numPops):
+			self._pop()
+
+	def _smartPop( self, name ):
+		nestingResetTriggers = self.NESTABLE_TAGS.get(name)
+		isNestable = nestingResetTriggers != None
+		isResetNesting = name in self.RESET_NESTING_TAGS
+		popTo = None
+		inclusive = True
+		for i in range(len(self.tags)-1, -1, -1):
+			p_name = self.tags[i][0]
+			if p_name == name and not isNestable:
+				popTo = name
+				break
+			if (nestingResetTriggers is not None
+				and p_name in nestingResetTriggers) \
+				or (nestingResetTriggers is None and isResetNesting
+					and p_name in self.RESET_NESTING_TAGS):
+				popTo = p_name
+				inclusive = False
+				break
+		if popTo:
+			self._popToTag( popTo, inclusive )
+
+	def endData( self, fmt='%s' ):
+		if self.currentData:
+			currentData = ''.join(self.currentData)
+			self.currentData = []
+			if not currentData.strip(self.ASCII_SPACES) \
+			and not [t for t in self.tags if t[0] in self.PRESERVE_WHITESPACE_TAGS]:
+				if '\n' in currentData:
+					currentData = '\n'
+				else:
+					currentData = ' '
+			self._node( fmt % currentData )
+
+	# -- SGMLParser events
+
+	def unknown_starttag( self, name, attrs ):
+		if self.quoteStack:
+			attrs = ''.join([' %s="%s"' % (x, y) for x, y in attrs])
+			self.handle_data('<%s%s>' % (name, attrs))
+			return
+		self.endData()
+		self_closing = name in self.SELF_CLOSING_TAGS
+		if not self_closing:
+			self._smartPop( name )
+		self._push( name, attrs, self_closing )
+		if name in self.QUOTE_TAGS:
+			self.quoteStack.append(name)
+			self.literal = 1
+
+	def unknown_endtag( self, name ):
+		if self.quoteStack and self.quoteStack[-1] != name:
+			self.handle_data('</%s>' % name)
+			return
+		self.endData()
+		self._popToTag( name )
+		if self.quoteStack and self.quoteStack[-1] == name:
+			self.quoteStack.pop()
+			self.literal = (len(self.quoteStack) > 0)
+
+	def handle_data( self, data ):
+		self.currentData.append( data )
+
+	def _special( self, text, fmt ):
+		self.endData()
+		self.handle_data( text )
+		self.endData( fmt )
+
+	def handle_pi( self, text ):
+		self._special( text, '<?%s?>' )
+
+	def handle_comment( self, text ):
+		self._special( text, '<!--%s-->' )
+
+	def handle_decl( self, data ):
+		self._special( data, '<!%s>' )
+
+	def handle_charref( self, ref ):
+		self.handle_data( '&#%s;' % ref )
+
+	def handle_entityref( self, ref ):
+		self.handle_data( '&%s;' % ref )
+
+	def convert_charref( self, name ):
+		try:
+			n = int(name)
+		except ValueError:
+			return
+		if not 0 <= n <= 127:
+			return
+		return self.convert_codepoint(n)
+
+	def parse_declaration( self, i ):
+		if self.rawdata[i:i+9] == '<![CDATA[':
+			k = self.rawdata.find(']]>', i)
+			if k == -1:
+				k = len(self.rawdata)
+			self._special( self.rawdata[i+9:k], '<![CDATA[%s]]>' )
+			return k+3
+		try:
+			return SGMLParser.parse_declaration( self, i )
+		except SGMLParseError:
+			toHandle = self.rawdata[i:]
+			self.handle_data( toHandle )
+			return i + len(toHandle)
+
+	def close( self ):
+		SGMLParser.close( self )
+		self.endData()
+		while self.tags:
+			self._pop()
+
+CHUNK_SIZE = 64 * 1024
+
+def extract_stream( text_or_file, chunk_size=CHUNK_SIZE ):
+	"""
+	Extracts any microdata found in the provided text without building a
+	``BeautifulSoup`` tree of it; files are read ``chunk_size`` bytes at a
+	time and only the microdata items are kept.
+	The values are left in the encoding of the page instead of being
+	re-encoded as UTF-8 like the soup does, which makes no difference for
+	UTF-8 pages such as IMDB's.
+	:param text_or_file: either the HTML text or a ``file``-esque object
+	that I can ``read`` from.
+	:param chunk_size: how much to ``read`` at a time
+	:returns: the same list of microdata items as ``extract``
+	"""
+	from BeautifulSoup import BeautifulSoup
+	massage = BeautifulSoup.MARKUP_MASSAGE
+	parser = _StreamParser()
+	if hasattr(text_or_file, 'read'):
+		chunks = iter(lambda: text_or_file.read(chunk_size), '')
+	else:
+		chunks = [ text_or_file ]
+	pending = ''
+	for chunk in chunks:
+		pending += chunk
+		# only ever massage whole tags, so keep what follows the last one
+		cut = pending.rfind('>') + 1
+		if not cut:
+			continue
+		txt, pending = pending[:cut], pending[cut:]
+		for fix, m in massage:
+			txt = fix.sub(m, txt)
+		parser.feed(txt)
+	for fix, m in massage:
+		pending = fix.sub(m, pending)
+	parser.feed(pending)
+	parser.close()
+	return parser.results
+
+def extract( text_or_file, streaming=False ):
 	"""
 	Extracts any microdata found in the provided text.
 	:param text_or_file: either the HTML text or a ``file``-esque object
 	that I can ``read`` from.
-	:returns: the output of running ``run_scopes`` upon the HTML you provide
+	:param streaming: use ``extract_stream`` instead of building a soup
+	:returns: the output of running ``walk_scopes`` upon the HTML you provide
 	"""
+	if streaming:
+		return extract_stream( text_or_file )
 	from BeautifulSoup import BeautifulSoup
 	txt = text_or_file
 	if hasattr(text_or_file,'read'):
 		txt = text_or_file.read()
 	soup = BeautifulSoup( txt )
-	return run_scopes( soup )
+	return walk_scopes( soup )
 
 if __name__ == '__main__':
 	print extract("""<html>
@@ -8,6 +8,7 @@ import logging
 import os.path
 from urllib import urlencode
 import urllib2
+from MultipartPostHandler import MultipartStream
 
 class MinUsAPI(object):
 	_MIN_US_API_PREFIX = 'http://min.us/api/'
@@ -98,14 +99,17 @@ class MinUsAPI(object):
 			raise ValueError("Expected to find 'reader_id' in %s but no" % obj)
 		return editor_id, reader_id
 
-	def upload_item(self, gallery_id, local_path ):
+	def upload_item(self, gallery_id, local_path, progress=None ):
 		"""
 		Uploads the specified local file into the specified gallery.
+		The file is streamed from disk, so it is never held in memory.
 
 		You must already be logged in to use this method.
 
 		:param gallery_id: the editor-id for the target gallery
 		:param local_path: the file system path you wish to send.
+		:param progress: if provided, called as ``progress(sent, total)``
+				with the number of bytes of the request body sent so far
 		:returns: a tuple containing the newly created file's id and
 				the ``i.minus.com`` URL for that file
 		:raises ValueError: if the server does not respond with the newly
@@ -116,8 +120,7 @@ class MinUsAPI(object):
 		basename = os.path.basename( local_path )
 		file_ext = os.path.splitext( basename )[1]
 		fh = open( local_path, 'rb' )
-		bytes = fh.read()
-		fh.close()
+		file_size = os.fstat( fh.fileno() ).st_size
 
 		boundary = md5(local_path).hexdigest()
 		header = ('--%(bound)s\r\n' +
@@ -125,19 +128,23 @@ class MinUsAPI(object):
 			'Content-type: application/octet-stream\r\n'+
 			'\r\n') % {'bound':boundary, 'fn':basename }
 		footer = "\r\n--%s--\r\n" % boundary
-		clen = len(header) + len(bytes) + len(footer)
+		clen = len(header) + file_size + len(footer)
 		ctype = 'multipart/form-data; boundary="%s"' % boundary
 
 		params = {'code':'OK', 'editor_id':gallery_id, 'filename':basename}
 		qstring = urlencode( params )
 		url = '%s?%s' % (MinUsAPI.MIN_US_API_UPLOAD_ITEM, qstring )
-		self._log.debug("UploadURL:", url)
+		self._log.debug("UploadURL: %s", url)
 		req = urllib2.Request( url )
 		# be careful; urllib is case sensitive about this stuff
 		req.add_header( 'Content-type', ctype )
 		req.add_header( 'Content-length', str(clen) )
-		req.add_data( header + bytes + footer )
-		res = self._opener.open( req )
+		req.add_data( MultipartStream(
+			[ header, (fh, file_size), footer ], progress ) )
+		try:
+			res = self._opener.open( req )
+		finally:
+			fh.close()
 		self._check_result( res, url )
 		res_content = res.read()
 		res.close()
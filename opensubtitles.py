@@ -1,9 +1,25 @@
 __docformat__ = 'restructuredtext en'
+import gzip
+import httplib
+import json
 import logging
 import os
+import Queue
+import socket
 import stat
+from StringIO import StringIO
+import struct
+import tempfile
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    # not on Windows, where the token store goes unlocked
+    fcntl = None
 # we *must* use urllib2 otherwise sending data uses x-www-form-urlencoded
 import urllib2
+import urlparse
 import xmlrpclib
 
 USER_AGENT = 'Pythonbits 1'
@@ -66,18 +82,359 @@ class NoTokenKey( Exception ):
     def __repr__(self):
         return 'The server responded with %s' % self.result
 
+class UrllibTransport(object):
+    """
+    Sends each request over a brand new ``urllib2`` connection.
+    """
+    def request(self, url, body, headers):
+        """
+        POSTs ``body`` to ``url``.
+
+        :param url: the absolute URL to send to
+        :param body: the request entity
+        :param headers: a map of extra HTTP request headers
+        :returns: the response entity
+        """
+        http_req = urllib2.Request( url, body, headers )
+        http_res = urllib2.urlopen( http_req )
+        result = http_res.read()
+        http_res.close()
+        return result
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return 'urllib2 transport'
+
+class KeepAliveTransport(object):
+    """
+    Sends requests over persistent HTTP/1.1 connections, keeping up to
+    ``max_connections`` idle sockets per host around for reuse, and
+    asking the server to gzip its responses.
+
+    It is safe to share one instance between threads; the
+    ``requests``, ``connections`` and ``reused`` counters record how
+    many requests were sent, how many sockets were opened to send them,
+    and how many requests went out over an already open socket.
+
+    :param max_connections: the number of idle connections kept per host
+    :param use_gzip: whether to accept gzip encoded responses
+    :param timeout: the socket timeout, in seconds, or None for the default
+    """
+    def __init__(self, max_connections=2, use_gzip=True, timeout=None):
+        self.LOG = logging.getLogger('KeepAliveTransport')
+        self.max_connections = max_connections
+        self.use_gzip = use_gzip
+        self.timeout = timeout
+        self.requests = 0
+        self.connections = 0
+        self.reused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, url, body, headers):
+        """
+        POSTs ``body`` to ``url``, on an idle connection if one is
+        available. A request that fails on a reused connection (because
+        the server quietly dropped it) is retried once on a fresh one.
+
+        :param url: the absolute URL to send to
+        :param body: the request entity
+        :param headers: a map of extra HTTP request headers
+        :returns: the (decompressed) response entity
+        :raise IOError: if the server does not reply 200
+        """
+        scheme, netloc, path, query, _ = urlparse.urlsplit( url )
+        if query:
+            path = '%s?%s' % (path, query)
+        key = (scheme, netloc)
+        headers = dict( headers )
+        headers['Connection'] = 'keep-alive'
+        if self.use_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        conn, reused = self._acquire( key )
+        try:
+            res = self._send( conn, path, body, headers )
+        except (httplib.HTTPException, socket.error), ex:
+            conn.close()
+            if not reused:
+                raise
+            self.LOG.debug( 'Reused connection to %s failed (%s), retrying',
+                netloc, ex )
+            conn, reused = self._new_connection( key ), False
+            res = self._send( conn, path, body, headers )
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            if reused:
+                self.reused += 1
+        finally:
+            self._lock.release()
+        content = res.read()
+        if res.will_close:
+            conn.close()
+        else:
+            self._release( key, conn )
+        if res.status != 200:
+            raise IOError("Unable to POST %s: %s %s" %
+                          (url, res.status, res.reason))
+        if 'gzip' == res.getheader( 'Content-Encoding', '' ).lower():
+            content = gzip.GzipFile( fileobj=StringIO( content ) ).read()
+        return content
+
+    def close(self):
+        """
+        Closes all the idle connections.
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = {}
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def stats(self):
+        """
+        :return: a short, human readable account of the connection reuse
+        """
+        return 'keep-alive transport: %d requests, %d connections, %d reused' % (
+            self.requests, self.connections, self.reused )
+
+    def _send(self, conn, path, body, headers):
+        conn.request( 'POST', path, body, headers )
+        return conn.getresponse()
+
+    def _acquire(self, key):
+        self._lock.acquire()
+        try:
+            conns = self._idle.get( key )
+            if conns:
+                return conns.pop(), True
+        finally:
+            self._lock.release()
+        return self._new_connection( key ), False
+
+    def _release(self, key, conn):
+        self._lock.acquire()
+        try:
+            conns = self._idle.setdefault( key, [] )
+            if len(conns) < self.max_connections:
+                conns.append( conn )
+                conn = None
+        finally:
+            self._lock.release()
+        if conn is not None:
+            conn.close()
+
+    def _new_connection(self, key):
+        scheme, netloc = key
+        if 'https' == scheme:
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        if self.timeout is None:
+            conn = conn_class( netloc )
+        else:
+            conn = conn_class( netloc, timeout=self.timeout )
+        self._lock.acquire()
+        try:
+            self.connections += 1
+        finally:
+            self._lock.release()
+        return conn
+
+def dump_json( filename, data, **options ):
+    """
+    Writes ``data`` out as JSON to ``filename``, by way of a temp file
+    beside it which is then renamed over it: rename is atomic, so
+    concurrent readers never see half a file. The temp file is created
+    readable by its owner only, as `tempfile.mkstemp` makes it, and so
+    is the file it becomes.
+
+    :param filename: the file to (re)place
+    :param data: anything `json.dump` takes
+    :param options: the keyword arguments of `json.dump`, such as
+        ``indent``
+    """
+    fd, tmp_fn = tempfile.mkstemp( '.tmp', os.path.basename( filename ) + '.',
+        os.path.dirname( os.path.abspath( filename ) ) )
+    try:
+        fh = os.fdopen( fd, 'wb' )
+        try:
+            json.dump( data, fh, **options )
+        finally:
+            fh.close()
+        os.rename( tmp_fn, filename )
+    except:
+        if os.path.exists( tmp_fn ):
+            os.remove( tmp_fn )
+        raise
+
+class TokenStore(object):
+    """
+    Keeps OpenSubtitles session tokens on disk, along with when they
+    expire, so that separate runs (and processes) can share one session
+    instead of each paying for a LogIn and LogOut. Changes are made
+    holding a lock on ``filename + '.lock'``, so that two processes
+    storing tokens at once do not lose one of them.
+
+    :param filename: where to keep the tokens; defaults to
+        ``pythonbits-osub-session.json`` in the temp directory.
+    """
+    DEFAULT_FILENAME = os.path.join(
+        tempfile.gettempdir(), 'pythonbits-osub-session.json' )
+
+    def __init__(self, filename=None):
+        self.LOG = logging.getLogger('TokenStore')
+        if filename is None:
+            filename = TokenStore.DEFAULT_FILENAME
+        self.filename = filename
+
+    def get(self, key):
+        """
+        :param key: identifies the session, see `OpenSubtitlesClient`
+        :returns: the unexpired token stored under ``key``, or None
+        """
+        entry = self._read().get( key )
+        if not entry:
+            return None
+        token, expires = entry
+        if expires <= time.time():
+            self.LOG.debug( 'Stored token for %s has expired', key )
+            return None
+        return token
+
+    def put(self, key, token, expires):
+        """
+        :param key: identifies the session, see `OpenSubtitlesClient`
+        :param token: the session token
+        :param expires: when the server will forget the session, in
+            seconds since the epoch
+        """
+        lock = self._lock()
+        try:
+            entries = self._read()
+            entries[ key ] = [ token, expires ]
+            self._write( entries )
+        finally:
+            self._unlock( lock )
+
+    def discard(self, key):
+        lock = self._lock()
+        try:
+            entries = self._read()
+            if key in entries:
+                del entries[ key ]
+                self._write( entries )
+        finally:
+            self._unlock( lock )
+
+    def _lock(self):
+        """
+        Takes the lock on the store, waiting for any other process (or
+        thread) holding it.
+
+        :return: what to hand `_unlock`
+        """
+        if fcntl is None:
+            return None
+        fd = os.open( self.filename + '.lock', os.O_RDWR | os.O_CREAT, 0600 )
+        try:
+            fcntl.flock( fd, fcntl.LOCK_EX )
+        except:
+            os.close( fd )
+            raise
+        return fd
+
+    def _unlock(self, fd):
+        if fd is not None:
+            # closing the file releases the lock
+            os.close( fd )
+
+    def _read(self):
+        if not os.path.exists( self.filename ):
+            return {}
+        try:
+            fh = open( self.filename, 'rb' )
+            try:
+                return json.load( fh )
+            finally:
+                fh.close()
+        except (IOError, ValueError), ex:
+            self.LOG.warning(
+                'Ignoring unreadable token store %s: %s', self.filename, ex )
+            return {}
+
+    def _write(self, entries):
+        # the tokens are credentials; dump_json creates the file 0600, so
+        # nobody else can read them, not even for a moment
+        dump_json( self.filename, entries )
+
 class OpenSubtitlesClient(object):
     ENDPOINT_URL = 'http://api.opensubtitles.org/xml-rpc'
     # ENDPOINT_URL = 'http://localhost:8000/xml-rpc'
-    def __init__(self, user_agent ):
+    # the server refuses SearchSubtitles calls with more queries than this
+    SEARCH_BATCH_SIZE = 20
+    # the server forgets a session after this many idle seconds
+    SESSION_LIFETIME = 15 * 60
+    # the statuses with which the server rejects an unknown or expired token
+    INVALID_TOKEN_STATUSES = ('401 Unauthorized', '406 No session')
+    def __init__(self, user_agent, transport=None, token_store=None ):
+        """
+        :param user_agent: the registered OpenSubtitles user agent
+        :param transport: what carries the XML-RPC calls, such as a
+            `KeepAliveTransport`; defaults to a `UrllibTransport`
+        :param token_store: the `TokenStore` in which to share the session
+            token with other runs; without one, every client needs its
+            own LogIn
+        """
         self.LOG = logging.getLogger('OpenSubtitlesClient')
         self.endpoint = OpenSubtitlesClient.ENDPOINT_URL
+        if transport is None:
+            transport = UrllibTransport()
+        self.transport = transport
+        self.token_store = token_store
         self.lang_code = 'eng'
         self.token = None
         self.user_agent = user_agent
+        self.last_used = None
+        self._login = None
+        self._password = None
+
+    def EnsureSession(self, login, password ):
+        """
+        Picks up the session stored in the `TokenStore` for ``login``, only
+        calling `LogIn` if there is none or it has expired. Should the
+        server later reject the token, we will quietly log in again.
+        """
+        if not self.ResumeSession( login, password ):
+            self.LogIn( login, password )
+    def ResumeSession(self, login, password ):
+        """
+        Picks up the session stored in the `TokenStore` for ``login``
+        without talking to the server.
+
+        :returns: True if there was an unexpired session to resume
+        """
+        self._login = login
+        self._password = password
+        if self.token_store is None:
+            return False
+        token = self.token_store.get( self._session_key() )
+        if not token:
+            return False
+        self.LOG.debug( "ResumeSession.Token=%s", token )
+        self.token = token
+        return True
 
     def LogIn(self, login, password ):
         methodname = 'LogIn'
+        self._login = login
+        self._password = password
         params = (login, password, self.lang_code, self.user_agent )
         res = self._invoke( params, methodname )
         if 'status' not in res:
@@ -91,6 +448,7 @@ class OpenSubtitlesClient(object):
             raise NoTokenKey( res )
         self.token = res['token']
         self.LOG.debug( "LogIn.Token=%s", self.token )
+        self._touch_session()
     def SearchSubtitles(self, file_size, file_hash):
         """
         Searches for all the known subtitles that match
@@ -98,33 +456,76 @@ class OpenSubtitlesClient(object):
 
         :param file_size: the exact size in bytes of your file.
         :param file_hash: the hash code as computed by `hash_filename`
-        :returns: a list of maps containing the query results
+        :returns: a list of maps containing the query results, or None
         :raise ValueError: if the ``file_size`` is not positive or
                             if the ``file_hash`` is empty
         :raise NoStatusKey: if the result did not contain a 'status' key
         :raise BadStatus: the server responded with a non-200 status
         :raise NoDataKey: if the response did not contain a 'data' key
         """
+        result = self.SearchSubtitlesBatch( [ (file_size, file_hash) ] )[0]
+        if not result:
+            return None
+        return result
+    def SearchSubtitlesBatch(self, size_hash_list):
+        """
+        Searches for the subtitles of many files at once, packing up to
+        `SEARCH_BATCH_SIZE` queries into each request.
+
+        :param size_hash_list: a sequence of ``(file_size, file_hash)``
+            tuples, as returned by `hash_filename`
+        :returns: a list, in the same order as ``size_hash_list``, of the
+            lists of maps containing each file's query results; files
+            without any subtitles get an empty list.
+        :raise ValueError: if any ``file_size`` is not positive or
+                            if any ``file_hash`` is empty
+        :raise NoStatusKey: if the result did not contain a 'status' key
+        :raise BadStatus: the server responded with a non-200 status
+        :raise NoDataKey: if the response did not contain a 'data' key
+        """
         methodname = 'SearchSubtitles'
-        if not file_size:
-            raise ValueError('file_size is required')
-        if not file_hash:
-            raise ValueError('file_hash is required')
-        query_map = {}
-        # and it has to be of XML-RPC type "double"
-        file_size = float(file_size)
-        query_map['moviebytesize']=file_size
-        query_map['moviehash']=file_hash
-        # this is actually a CSV, so tack on more if you want
-        query_map['sublanguageid']='all'
-        query_list = [ query_map ]
-        params = ( self.token, query_list )
-        res = self._invoke( params, methodname )
+        size_hash_list = list( size_hash_list )
+        query_list = []
+        for file_size, file_hash in size_hash_list:
+            if not file_size:
+                raise ValueError('file_size is required')
+            if not file_hash:
+                raise ValueError('file_hash is required')
+            query_map = {}
+            # and it has to be of XML-RPC type "double"
+            query_map['moviebytesize']=float(file_size)
+            query_map['moviehash']=file_hash
+            # this is actually a CSV, so tack on more if you want
+            query_map['sublanguageid']='all'
+            query_list.append( query_map )
+        by_hash = {}
+        batch_size = OpenSubtitlesClient.SEARCH_BATCH_SIZE
+        for offset in xrange(0, len(query_list), batch_size):
+            params = ( query_list[offset:offset + batch_size], )
+            data = self._invoke_with_token( params, methodname,
+                self._search_data )
+            for item in data:
+                key = item.get('MovieHash', '').lower()
+                by_hash.setdefault( key, [] ).append( item )
+        results = []
+        for file_size, file_hash in size_hash_list:
+            items = by_hash.get( file_hash.lower(), [] )
+            # two files may share a hash but not also their size
+            results.append( [ it for it in items
+                if long(it.get('MovieByteSize', file_size)) == long(file_size) ] )
+        return results
+    def _search_data(self, res):
+        """
+        Unwraps the ``data`` of one SearchSubtitles response.
+
+        :param res: the decoded response from the server
+        :returns: the (possibly empty) list of result maps
+        """
         if not res:
-            return None
+            return []
         if len(res) < 1:
             self.LOG.debug('result := %s', repr(res))
-            return None
+            return []
         if 'status' not in res:
             self.LOG.error(
                 'Result did not contain status: %s', repr(res))
@@ -134,16 +535,73 @@ class OpenSubtitlesClient(object):
             raise BadStatus( item_status )
         if 'data' not in res:
             raise NoDataKey( res )
-        result = res['data']
-        return result
+        # the server answers "data":false when nothing matched
+        return res['data'] or []
     def LogOut(self):
         """
-        Kindly releases your server-side session.
+        Kindly releases your server-side session, and forgets it in the
+        `TokenStore` so no other run tries to use it.
         """
         methodname = 'LogOut'
         params = (self.token, )
         # we don't care about the result
         self._invoke( params, methodname )
+        if self.token_store is not None:
+            self.token_store.discard( self._session_key() )
+        self.token = None
+        self.last_used = None
+    def LogOutIfIdle(self, max_idle):
+        """
+        For long-running callers: releases the session once it has not
+        been used for ``max_idle`` seconds.
+
+        :returns: True if we logged out
+        """
+        if self.token is None or self.last_used is None:
+            return False
+        if time.time() - self.last_used < max_idle:
+            return False
+        self.LogOut()
+        return True
+
+    def _session_key(self):
+        return '%s|%s|%s' % (self.endpoint, self.user_agent, self._login)
+    def _touch_session(self):
+        """
+        Records that the session was just used, which pushes back the
+        moment the server will expire it.
+        """
+        self.last_used = time.time()
+        if self.token_store is not None and self.token:
+            self.token_store.put( self._session_key(), self.token,
+                self.last_used + OpenSubtitlesClient.SESSION_LIFETIME )
+    def _invoke_with_token(self, params, methodname, check ):
+        """
+        Invokes ``methodname`` with the session token in front of
+        ``params``, logging in again (once) if the server says our token
+        is no good.
+
+        :param params: the *tuple* of your method's parameters, minus
+            the token
+        :param methodname: the name of your XML-RPC method to invoke
+        :param check: called with the decoded response, it should raise
+            `BadStatus` for a non-200 status and return the result
+        :returns: whatever ``check`` returns
+        """
+        res = self._invoke( (self.token, ) + params, methodname )
+        try:
+            result = check( res )
+        except BadStatus, bs:
+            if bs.status not in OpenSubtitlesClient.INVALID_TOKEN_STATUSES \
+                    or self._login is None:
+                raise
+            self.LOG.debug( "[%s] token rejected with %s, logging in again",
+                methodname, bs.status )
+            self.LogIn( self._login, self._password )
+            res = self._invoke( (self.token, ) + params, methodname )
+            result = check( res )
+        self._touch_session()
+        return result
 
     def _invoke(self, params, methodname ):
         """
@@ -161,10 +619,7 @@ class OpenSubtitlesClient(object):
             "[%s]::REQ=%s", methodname, req )
         http_headers = { 'User-Agent':self.user_agent,
                          'Content-Type':'text/xml; charset="UTF-8"'}
-        http_req = urllib2.Request( self.endpoint, req, http_headers )
-        http_res = urllib2.urlopen( http_req )
-        res_xml = http_res.read()
-        http_res.close()
+        res_xml = self.transport.request( self.endpoint, req, http_headers )
         self.LOG.debug(
             "[%s]::RES.xml=%s", methodname, repr(res_xml) )
         res = xmlrpclib.loads( res_xml )
@@ -185,6 +640,9 @@ class OpenSubtitlesClient(object):
             log_level = logging.INFO
         self.LOG.setLevel( log_level )
 
+HASH_CHUNK_SIZE = 65536
+"""The number of bytes summed from each end of the file."""
+
 def read_uint64( f ):
     tmp = long(0)
     for i in xrange(0, 8):
@@ -194,27 +652,35 @@ def read_uint64( f ):
         tmp |= k
     return tmp & 0xFFFFFFFFFFFFFFFFL
 
-def hash_filename( fn ):
+def _check_hashable( fn ):
     """
-    Constructs the hash according to the algorithm described
-    at http://trac.opensubtitles.org/projects/opensubtitles/wiki/HashSourceCodes
-
-    This is a fresh implementation using the Public Domain C source,
-    and thus not subject to the GPL.
-
     :param fn: the filename
-    :return: the tuple (size, hash-string)
+    :return: the size of ``fn`` in bytes
+    :raise IOError: if ``fn`` does not exist
+    :raise SizeError: if ``fn`` is too small to be hashed
     """
     if not os.path.exists( fn ):
         raise IOError("Unable to find your file: %s'" % fn)
     st = os.stat( fn )
     siz = st[stat.ST_SIZE]
-    if siz < 131072:
+    if siz < HASH_CHUNK_SIZE * 2:
         # the specification for the hash claims it will only accept
         # files in the range (131072, 9000000000)
         raise SizeError( siz )
-    chunk_size = 8192
-    chunk_offset = -(chunk_size * 8)
+    return siz
+
+def hash_filename_legacy( fn ):
+    """
+    The original, one-byte-at-a-time implementation of `hash_filename`.
+    It is kept around as the reference the block-wise engine is measured
+    (and verified) against; please do not use it for real work.
+
+    :param fn: the filename
+    :return: the tuple (size, hash-string)
+    """
+    siz = _check_hashable( fn )
+    chunk_size = HASH_CHUNK_SIZE / 8
+    chunk_offset = -HASH_CHUNK_SIZE
 
     cksum = long(siz)
     f = open( fn, 'rb' )
@@ -227,6 +693,206 @@ def hash_filename( fn ):
     the_hash = '%016x' % cksum
     return siz, the_hash
 
+# little-endian, so the result does not depend upon the host byte order
+_HASH_CHUNK_FORMAT = '<%dQ' % (HASH_CHUNK_SIZE / 8)
+
+def hash_filename( fn ):
+    """
+    Constructs the hash according to the algorithm described
+    at http://trac.opensubtitles.org/projects/opensubtitles/wiki/HashSourceCodes
+
+    This is a fresh implementation using the Public Domain C source,
+    and thus not subject to the GPL.
+
+    The head and tail of the file are each read in one go and summed
+    with a single ``struct.unpack``; the output is identical to
+    `hash_filename_legacy`.
+
+    :param fn: the filename
+    :return: the tuple (size, hash-string)
+    """
+    siz = _check_hashable( fn )
+    f = open( fn, 'rb' )
+    try:
+        head = f.read( HASH_CHUNK_SIZE )
+        f.seek( -HASH_CHUNK_SIZE, 2 )
+        tail = f.read( HASH_CHUNK_SIZE )
+    finally:
+        f.close()
+    cksum = long(siz)
+    cksum += sum( struct.unpack( _HASH_CHUNK_FORMAT, head ) )
+    cksum += sum( struct.unpack( _HASH_CHUNK_FORMAT, tail ) )
+    the_hash = '%016x' % (cksum & 0xFFFFFFFFFFFFFFFFL)
+    return siz, the_hash
+
+class HashCache(object):
+    """
+    Remembers the results of `hash_filename` on disk, keyed by the
+    (inode, size, mtime) of the file, so unchanged files are never
+    re-read. It is safe to share one instance between threads.
+
+    :param filename: where to keep the cache; defaults to
+        ``pythonbits-hashes.json`` in the temp directory.
+    """
+    DEFAULT_FILENAME = os.path.join(
+        tempfile.gettempdir(), 'pythonbits-hashes.json' )
+
+    def __init__(self, filename=None):
+        self.LOG = logging.getLogger('HashCache')
+        if filename is None:
+            filename = HashCache.DEFAULT_FILENAME
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        (Re-)reads the cache file, quietly starting over if it is
+        missing or unreadable.
+        """
+        entries = {}
+        if os.path.exists( self.filename ):
+            try:
+                fh = open( self.filename, 'rb' )
+                try:
+                    entries = json.load( fh )
+                finally:
+                    fh.close()
+            except (IOError, ValueError), ex:
+                self.LOG.warning(
+                    'Ignoring unreadable hash cache %s: %s', self.filename, ex )
+                entries = {}
+        self._lock.acquire()
+        try:
+            self._entries = entries
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+    def save(self):
+        """
+        Writes the cache back to disk, if anything changed since it was
+        last loaded or saved.
+        """
+        self._lock.acquire()
+        try:
+            if not self._dirty:
+                return
+            dump_json( self.filename, self._entries )
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+    def hash_filename(self, fn):
+        """
+        Just like the module level `hash_filename`, but answers from the
+        cache when the file has not changed since it was last hashed.
+
+        :param fn: the filename
+        :return: the tuple (size, hash-string)
+        """
+        if not os.path.exists( fn ):
+            raise IOError("Unable to find your file: %s'" % fn)
+        key = self._key( os.stat( fn ) )
+        self._lock.acquire()
+        try:
+            entry = self._entries.get( key )
+            if entry is not None:
+                self.hits += 1
+                return long( entry[0] ), str( entry[1] )
+            self.misses += 1
+        finally:
+            self._lock.release()
+        siz, the_hash = hash_filename( fn )
+        self._lock.acquire()
+        try:
+            self._entries[ key ] = [ siz, the_hash ]
+            self._dirty = True
+        finally:
+            self._lock.release()
+        return siz, the_hash
+
+    def stats(self):
+        """
+        :return: a short, human readable account of the hits and misses
+        """
+        return 'hash cache: %d hits, %d misses, %d entries' % (
+            self.hits, self.misses, len(self._entries) )
+
+    def _key(self, st):
+        return '%d:%d:%r' % (
+            st[stat.ST_INO], st[stat.ST_SIZE], st.st_mtime )
+
+def hash_many( paths, workers=4, cache=None ):
+    """
+    Hashes many files at once on a pool of ``workers`` threads,
+    yielding the results in the order they finish (*not* the order
+    of ``paths``).
+
+    Files which cannot be hashed (missing, or too small according to
+    `SizeError`) are yielded as ``(path, None, None)`` so that every
+    path is accounted for.
+
+    :param paths: the sequence of filenames to hash
+    :param workers: the maximum number of files hashed at the same time
+    :param cache: the `HashCache` to consult and fill; a fresh one
+        over the default cache file is used if not provided, and it is
+        saved once all the paths have been yielded.
+    :return: a generator of ``(path, size, hash-string)`` tuples
+    """
+    log = logging.getLogger('hash_many')
+    paths = list( paths )
+    if cache is None:
+        cache = HashCache()
+    todo = Queue.Queue()
+    done = Queue.Queue()
+    for path in paths:
+        todo.put( path )
+
+    def hash_one( path ):
+        try:
+            siz, the_hash = cache.hash_filename( path )
+        except SizeError, se:
+            log.debug( 'Too small to hash (%s bytes): %s', se.size, path )
+            return path, None, None
+        except Exception, ex:
+            log.warning( 'Unable to hash %s: %s', path, ex )
+            return path, None, None
+        return path, siz, the_hash
+
+    def worker():
+        while True:
+            try:
+                path = todo.get_nowait()
+            except Queue.Empty:
+                return
+            done.put( hash_one( path ) )
+
+    threads = []
+    for i in xrange(0, min( max( workers, 1 ), len( paths ) )):
+        t = threading.Thread( target=worker, name='hash_many-%d' % i )
+        t.daemon = True
+        t.start()
+        threads.append( t )
+    try:
+        for i in xrange(0, len( paths )):
+            yield done.get()
+    finally:
+        # if the caller stopped early, let the workers finish the file
+        # they are on but do not start any more
+        while True:
+            try:
+                todo.get_nowait()
+            except Queue.Empty:
+                break
+        for t in threads:
+            t.join()
+        cache.save()
+
 if __name__ == '__main__':
     __doc__ = """
 AVI file (12 909 756 bytes)
@@ -238,29 +904,39 @@ hash: 61f7751fc2a72bfb
     import sys
     TEST_USER_AGENT = 'OS Test User Agent'
     logging.basicConfig()
-    fn = sys.argv[1]
-    res = hash_filename( fn )
-    fs = res[0]
-    h = res[1]
+    file_names = sys.argv[1:]
+    hashes = {}
+    for fn, fs, h in hash_many( file_names ):
+        if h:
+            hashes[ fn ] = (fs, h)
+            print "FILE(%s)=%s %s" % ( fn, fs, h )
+    file_names = [ fn for fn in file_names if fn in hashes ]
     username = ''
     password = ''
-    print "FILE(%s)=%s %s" % ( fn, fs, h )
-    client = OpenSubtitlesClient( USER_AGENT )
+    client = OpenSubtitlesClient( USER_AGENT, KeepAliveTransport(),
+        TokenStore() )
     client.set_debug( os.getenv('OSC_DEBUG') is not None )
-    client.LogIn( username, password )
-    results = client.SearchSubtitles( fs, h )
-    client.LogOut()
-    if not results:
-        print >> sys.stderr, "Sorry, no results"
+    client.EnsureSession( username, password )
+    all_results = client.SearchSubtitlesBatch(
+        [ hashes[ fn ] for fn in file_names ] )
+    client.LOG.debug( client.transport.stats() )
+    client.transport.close()
+    found = False
+    for fn, results in zip( file_names, all_results ):
+        if not results:
+            print >> sys.stderr, "Sorry, no results for %s" % fn
+            continue
+        found = True
+        print "== %s" % fn
+        for x in results:
+            for k in x.keys():
+                v = x[k]
+                print "  [%s]=%s"% (k, v)
+            print "--\n"
+        links = []
+        for it in results:
+            links.append( '[url=%s]%s[/url]' % (
+                    it['SubDownloadLink'], it['ISO639'], ) )
+        print ' | '.join( links )
+    if not found:
         sys.exit( 1 )
-    for x in results:
-        for k in x.keys():
-            v = x[k]
-            print "  [%s]=%s"% (k, v)
-        print "--\n"
-    links = []
-    for it in results:
-        links.append( '[url=%s]%s[/url]' % (
-                it['SubDownloadLink'], it['ISO639'], ) )
-    print ' | '.join( links )
-
@@ -33,30 +33,66 @@ __version__ = (0, 2)
 __version_str__ = '.'.join(str(x) for x in __version__)
 __author__ = "Apollo"
 
+import sys
+import time
+
+def _trace_imports():
+	"""
+	Times every module imported from here on and prints what each one
+	cost when the program exits, much like ``python -X importtime`` does
+	on newer Pythons: the time spent in the module itself, the time
+	including the modules it imported in turn, and its name, indented by
+	how deep it was imported.
+	"""
+	import __builtin__
+	import atexit
+	real_import = __builtin__.__import__
+	# seconds spent importing the children of each import in progress
+	children = [ [0.0] ]
+	report = []
+	def timed_import(name, *args, **kwargs):
+		if name in sys.modules:
+			return real_import(name, *args, **kwargs)
+		loaded = len(sys.modules)
+		children.append( [0.0] )
+		start = time.time()
+		try:
+			return real_import(name, *args, **kwargs)
+		finally:
+			elapsed = time.time() - start
+			nested = children.pop()[0]
+			if len(sys.modules) > loaded:
+				children[-1][0] += elapsed
+				report.append( (elapsed - nested, elapsed, len(children) - 1, name) )
+	def show():
+		print >> sys.stderr, "import time: self [us] | cumulative | imported package"
+		for own, total, depth, name in report:
+			print >> sys.stderr, "import time: %9d | %10d | %s%s" % \
+				(own * 1e6, total * 1e6, '  ' * depth, name)
+		print >> sys.stderr, "import time: %d modules, %d us at top level" % \
+			(len(report), sum([r[1] for r in report if not r[2]]) * 1e6)
+	__builtin__.__import__ = timed_import
+	atexit.register(show)
+
+if __name__ == '__main__' and '--import-times' in sys.argv:
+	_trace_imports()
+
+# Modules that only some runs need (the uploaders, scrapers, parsers and
+# the tools they drive) are imported where they are used, so that runs
+# like --update do not pay for loading them.
 import urllib
-import urllib2
 import urlparse
-import sys
 import re
-import subprocess
+import logging
 import tempfile
-import microdata
+import threading
+import Queue
 import os
+import functools
 import json
-from BeautifulSoup import BeautifulSoup
-from minus_api import MinUsAPI
-import MultipartPostHandler
-from opensubtitles import OpenSubtitlesClient, USER_AGENT, hash_filename
-from xml.dom.minidom import Document, parse
-from hashlib import md5 # for user error feedback reports
+from hashlib import sha1
 
 __converter = None
-try:
-	from HTMLParser import HTMLParser
-	__converter = HTMLParser()
-except ImportError:
-	HTMLParser = None # please, PyCharm, shut up
-	pass
 
 def __logerror(msg):
 	sys.stderr.write(msg)
@@ -70,6 +106,12 @@ def decode(text):
 	counterparts.
 	"""
 	global __converter
+	if __converter is None:
+		try:
+			from HTMLParser import HTMLParser
+			__converter = HTMLParser()
+		except ImportError:
+			__converter = False
 	if __converter:
 	## HACK, HTMLParser() sucks @ utf-8
 		return __converter.unescape(text.decode('utf-8')).encode('utf-8')
@@ -114,18 +156,530 @@ class Error404(Exception):
 	def __str__(self):
 		return repr(self.parameter)
 
+class ConfigError(Exception):
+	def __init__(self, value):
+		Exception.__init__(self)
+		self.parameter = value
+	def __str__(self):
+		return repr(self.parameter)
+
+class Instrumentation(object):
+	"""
+	Times the stages of a run (the searches, the scraping, hashing,
+	ffmpeg, mediainfo, the uploads) and counts the requests made and
+	bytes read by ``_MyOpener``, host by host, for ``--profile``.
+
+	The stages are the functions wrapped by `timedStage` or run through
+	`timedCall`; one may call another, in which case both are timed.
+	Nothing is measured unless an instance is made ``active``. It is safe
+	to share one instance between threads.
+
+	:param profile_stage: the name of a stage to run under cProfile every
+		time it is called; only the thread calling it is profiled
+	:param profile_rows: how many functions the profile reports, the most
+		expensive (cumulatively) first
+	"""
+	# the instance measuring this run, if any
+	active = None
+
+	def __init__(self, profile_stage=None, profile_rows=40):
+		self.profile_stage = profile_stage
+		self.profile_rows = profile_rows
+		self.started_at = time.time()
+		self._stages = {}
+		self._hosts = {}
+		self._profiles = []
+		self._lock = threading.Lock()
+
+	def call(self, stage, func, *args, **kwargs):
+		"""
+		:return: what ``func(*args, **kwargs)`` returns, having timed it
+			as ``stage``
+		"""
+		profile = None
+		if stage == self.profile_stage:
+			import cProfile
+			profile = cProfile.Profile()
+		failed = True
+		started = time.time()
+		try:
+			if profile is not None:
+				result = profile.runcall(func, *args, **kwargs)
+			else:
+				result = func(*args, **kwargs)
+			failed = False
+			return result
+		finally:
+			self.add(stage, time.time() - started, errors=int(failed))
+			if profile is not None:
+				self._lock.acquire()
+				self._profiles.append(profile)
+				self._lock.release()
+
+	def add(self, stage, seconds=None, **counters):
+		"""
+		Adds a call of ``stage`` which took ``seconds``, or if None, only
+		adds ``counters`` (bytes, files and the like) to those of ``stage``.
+		"""
+		self._lock.acquire()
+		try:
+			totals = self._stages.setdefault(stage, {'calls': 0, 'seconds': 0.0,
+				'min': None, 'max': None, 'errors': 0})
+			if seconds is not None:
+				totals['calls'] += 1
+				totals['seconds'] += seconds
+				if totals['min'] is None or seconds < totals['min']:
+					totals['min'] = seconds
+				if totals['max'] is None or seconds > totals['max']:
+					totals['max'] = seconds
+			for name, value in counters.items():
+				totals[name] = totals.get(name, 0) + value
+		finally:
+			self._lock.release()
+
+	def http(self, host, **counters):
+		"""
+		Adds ``counters`` (``requests``, ``bytes``, ``seconds``,
+		``errors``) to those of ``host``.
+		"""
+		self._lock.acquire()
+		try:
+			totals = self._hosts.setdefault(host, {'requests': 0, 'bytes': 0,
+				'seconds': 0.0, 'errors': 0})
+			for name, value in counters.items():
+				totals[name] += value
+		finally:
+			self._lock.release()
+
+	def report(self):
+		"""
+		:return: a map, ready for JSON, of the time since I was made, the
+			totals of every stage and host, and the profile of
+			``profile_stage`` if there is one
+		"""
+		self._lock.acquire()
+		try:
+			report = {
+				'version': __version_str__,
+				'started_at': self.started_at,
+				'elapsed': time.time() - self.started_at,
+				'stages': dict([(stage, dict(totals))
+					for stage, totals in self._stages.items()]),
+				'http': dict([(host, dict(totals))
+					for host, totals in self._hosts.items()]),
+			}
+			profiles = list(self._profiles)
+		finally:
+			self._lock.release()
+		if self.profile_stage:
+			report['profile'] = self._profile_report(profiles)
+		return report
+
+	def write(self, filename):
+		"""
+		Writes the `report` as JSON to ``filename``, or to stderr if it is
+		``-``; stdout has the post.
+		"""
+		if '-' == filename:
+			print >> sys.stderr, json.dumps(self.report(), indent=1, sort_keys=True)
+			return
+		from opensubtitles import dump_json
+		dump_json(filename, self.report(), indent=1, sort_keys=True)
+
+	def _profile_report(self, profiles):
+		result = {'stage': self.profile_stage, 'calls': len(profiles), 'functions': []}
+		if not profiles:
+			return result
+		import pstats
+		stats = pstats.Stats(profiles[0])
+		for profile in profiles[1:]:
+			stats.add(profile)
+		rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])
+		for (filename, line, name), (prim_calls, calls, own, total, callers) \
+				in rows[:self.profile_rows]:
+			result['functions'].append({
+				'function': '%s:%d(%s)' % (filename, line, name),
+				'calls': calls,
+				'primitive_calls': prim_calls,
+				'own': own,
+				'cumulative': total,
+			})
+		return result
+
+def timedCall( stage, func, *args, **kwargs ):
+	"""
+	:return: what ``func(*args, **kwargs)`` returns, timed as ``stage`` if
+		there is an active `Instrumentation`
+	"""
+	instruments = Instrumentation.active
+	if instruments is None:
+		return func(*args, **kwargs)
+	return instruments.call(stage, func, *args, **kwargs)
+
+def timedStage( stage ):
+	"""
+	:return: a decorator timing every call of the function it wraps as
+		``stage``, see `timedCall`
+	"""
+	def decorate(func):
+		def timed(*args, **kwargs):
+			return timedCall(stage, func, *args, **kwargs)
+		return functools.wraps(func)(timed)
+	return decorate
+
+def countStage( stage, **counters ):
+	"""
+	Adds ``counters`` to those of ``stage``, if there is an active
+	`Instrumentation`.
+	"""
+	instruments = Instrumentation.active
+	if instruments is not None:
+		instruments.add(stage, **counters)
+
+class _MeteredResponse(object):
+	"""
+	Wraps a response of ``_MyOpener``, adding the bytes read from it and
+	the time spent reading them to its host.
+	"""
+	def __init__(self, response, host, instruments):
+		self._response = response
+		self._host = host
+		self._instruments = instruments
+
+	def read(self, *args):
+		return self._metered(self._response.read, *args)
+
+	def readline(self, *args):
+		return self._metered(self._response.readline, *args)
+
+	def readlines(self, *args):
+		return self._metered(self._response.readlines, *args)
+
+	def __iter__(self):
+		return iter(self.readline, '')
+
+	def __getattr__(self, name):
+		return getattr(self._response, name)
+
+	def _metered(self, func, *args):
+		started = time.time()
+		data = func(*args)
+		if isinstance(data, list):
+			size = sum([len(line) for line in data])
+		else:
+			size = len(data)
+		self._instruments.http(self._host, bytes=size, seconds=time.time() - started)
+		return data
+
+class HTTPCache(object):
+	"""
+	Keeps the pages fetched by ``_MyOpener`` on disk, so that re-running
+	a post for the same title does not fetch the same pages again.
+
+	Every page is fresh for the TTL of its host, after which it is
+	revalidated with its ETag or Last-Modified date, if the server sent
+	either, or fetched again. When the cache grows past ``max_bytes`` the
+	least recently used pages are dropped. It is safe to share one
+	instance between threads, and one directory between processes.
+
+	:param directory: where to keep the pages; defaults to
+		``pythonbits-http-cache`` in the temp directory.
+	:param default_ttl: the seconds a page stays fresh, for hosts not in
+		``host_ttls``
+	:param host_ttls: a map of host name to the seconds its pages stay
+		fresh, on top of ``HOST_TTLS``
+	:param max_bytes: how big the cache may grow
+	"""
+	DEFAULT_TTL = 60 * 60
+	HOST_TTLS = {
+		'www.google.com': 6 * 60 * 60,
+		'www.imdb.com': 24 * 60 * 60,
+		'services.tvrage.com': 60 * 60,
+		'www.tvrage.com': 24 * 60 * 60,
+		# always check for a new config.xml
+		'github.com': 0,
+		'raw.github.com': 0,
+	}
+	# the request headers which change what the server sends back
+	KEY_HEADERS = ('user-agent', 'accept-language')
+	def __init__(self, directory=None, default_ttl=None, host_ttls=None,
+			max_bytes=64 * 1024 * 1024):
+		self._log = logging.getLogger('HTTPCache')
+		if directory is None:
+			directory = tempdir()+"pythonbits-http-cache"
+		self.directory = directory
+		if default_ttl is None:
+			default_ttl = HTTPCache.DEFAULT_TTL
+		self.default_ttl = default_ttl
+		self.host_ttls = dict(HTTPCache.HOST_TTLS)
+		if host_ttls:
+			self.host_ttls.update(host_ttls)
+		self.max_bytes = max_bytes
+		# how many bytes the cache holds, as far as this process knows;
+		# counted by the first _evict
+		self._size = None
+		self.hits = 0
+		self.misses = 0
+		self.revalidated = 0
+		self._lock = threading.Lock()
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def open(self, opener, url):
+		"""
+		Answers a GET of ``url`` by ``opener`` from the cache if possible,
+		otherwise fetches (and caches) it with that opener.
+
+		:return: a file-like response, just like ``opener.open`` would
+		"""
+		key = self._key(url, opener.addheaders)
+		meta, body = self._load(key)
+		if meta is not None and time.time() - meta['stored'] < self._ttl(url):
+			self._count('hits')
+			self._touch(key)
+			return self._response(url, meta, body)
+		validators = []
+		if meta is not None and meta.get('etag'):
+			validators.append(('If-None-Match', meta['etag']))
+		if meta is not None and meta.get('last-modified'):
+			validators.append(('If-Modified-Since', meta['last-modified']))
+		res = opener._request(url, headers=validators)
+		code = res.getcode()
+		if 304 == code and meta is not None:
+			res.close()
+			self._count('revalidated')
+			meta['stored'] = time.time()
+			self._store(key, meta, body)
+			return self._response(url, meta, body)
+		self._count('misses')
+		if 200 != code or 'no-store' in res.info().get('Cache-Control', ''):
+			return res
+		body = res.read()
+		res.close()
+		headers = res.info()
+		meta = {
+			'url': url,
+			'code': code,
+			'headers': str(headers),
+			'stored': time.time(),
+			'etag': headers.get('ETag'),
+			'last-modified': headers.get('Last-Modified'),
+		}
+		self._store(key, meta, body)
+		self._evict()
+		return self._response(url, meta, body)
+
+	def stats(self):
+		"""
+		:return: a short, human readable account of the hits and misses
+		"""
+		return "http cache: %d hits, %d revalidated, %d misses" % \
+			(self.hits, self.revalidated, self.misses)
+
+	def _ttl(self, url):
+		host = urlparse.urlparse(url).hostname
+		return self.host_ttls.get(host, self.default_ttl)
+
+	def _key(self, url, headers):
+		parts = [url]
+		for name, value in headers:
+			if name.lower() in HTTPCache.KEY_HEADERS:
+				parts.append('%s: %s' % (name.lower(), value))
+		return sha1('\n'.join(parts)).hexdigest()
+
+	def _path(self, key, suffix):
+		return os.path.join(self.directory, key + suffix)
+
+	def _load(self, key):
+		try:
+			fh = open(self._path(key, '.meta'), 'rb')
+			try:
+				meta = json.load(fh)
+			finally:
+				fh.close()
+			fh = open(self._path(key, '.body'), 'rb')
+			try:
+				body = fh.read()
+			finally:
+				fh.close()
+		except (IOError, ValueError):
+			return None, None
+		return meta, body
+
+	def _store(self, key, meta, body):
+		data = json.dumps(meta)
+		replaced = self._entry_size(key)
+		# the body goes first, so a reader never finds a .meta without it
+		for suffix, content in (('.body', body), ('.meta', data)):
+			fn = self._path(key, suffix)
+			fd, tmp_fn = tempfile.mkstemp('.tmp', os.path.basename(fn) + '.',
+				self.directory)
+			try:
+				fh = os.fdopen(fd, 'wb')
+				try:
+					fh.write(content)
+				finally:
+					fh.close()
+				os.rename(tmp_fn, fn)
+			except:
+				os.remove(tmp_fn)
+				raise
+		self._lock.acquire()
+		try:
+			if self._size is not None:
+				self._size += len(body) + len(data) - replaced
+		finally:
+			self._lock.release()
+
+	def _entry_size(self, key):
+		try:
+			return os.path.getsize(self._path(key, '.meta')) + \
+				os.path.getsize(self._path(key, '.body'))
+		except OSError:
+			return 0
+
+	def _touch(self, key):
+		try:
+			os.utime(self._path(key, '.meta'), None)
+		except OSError:
+			pass
+
+	def _evict(self):
+		"""
+		Drops the least recently used pages once we no longer fit in
+		``max_bytes``, until we are down to three quarters of it. The
+		cache directory is only gone through the first time, and when
+		what we have stored since makes it look too big; other processes
+		sharing it are only noticed then.
+		"""
+		self._lock.acquire()
+		try:
+			if self._size is not None and self._size <= self.max_bytes:
+				return
+			entries = []
+			total = 0
+			for fn in os.listdir(self.directory):
+				if not fn.endswith('.meta'):
+					continue
+				key = fn[:-len('.meta')]
+				try:
+					used = os.path.getmtime(self._path(key, '.meta'))
+					size = os.path.getsize(self._path(key, '.meta')) + \
+						os.path.getsize(self._path(key, '.body'))
+				except OSError:
+					continue
+				entries.append((used, key, size))
+				total += size
+			entries.sort()
+			if total > self.max_bytes:
+				# leave room, so as not to go through it all again next time
+				while total > self.max_bytes * 3 / 4 and entries:
+					used, key, size = entries.pop(0)
+					for suffix in ('.meta', '.body'):
+						try:
+							os.remove(self._path(key, suffix))
+						except OSError:
+							pass
+					total -= size
+					self._log.debug("Evicted %s", key)
+			self._size = total
+		finally:
+			self._lock.release()
+
+	def _response(self, url, meta, body):
+		import mimetools
+		from StringIO import StringIO
+		headers = mimetools.Message(StringIO(meta['headers']))
+		return urllib.addinfourl(StringIO(body), headers, url, meta['code'])
+
+	def _count(self, counter):
+		self._lock.acquire()
+		try:
+			setattr(self, counter, getattr(self, counter) + 1)
+		finally:
+			self._lock.release()
+
 class _MyOpener(urllib.FancyURLopener):
 	version = 'Opera/9.80 (fX11; Linux i686; U; en) Presto/2.2.15 Version/10.00'
+	# the HTTPCache all openers share, if any
+	cache = None
+	# how many seconds to wait on the server before giving up, if at all
+	timeout = None
 	def __init__(self, *args, **kwargs):
 		urllib.FancyURLopener.__init__(self, *args, **kwargs)
 		# force the results into English even if the GeoIP says otherwise
 		self.addheader('Accept-Language','en-us, en')
 
+	def open(self, fullurl, data=None):
+		instruments = Instrumentation.active
+		if instruments is None:
+			return self._fetch(fullurl, data)
+		host = urlparse.urlparse(fullurl).hostname or fullurl
+		started = time.time()
+		try:
+			res = self._fetch(fullurl, data)
+		except:
+			instruments.http(host, requests=1, errors=1, seconds=time.time() - started)
+			raise
+		instruments.http(host, requests=1, seconds=time.time() - started)
+		return _MeteredResponse(res, host, instruments)
+
+	def _fetch(self, fullurl, data=None):
+		cache = _MyOpener.cache
+		if cache is None or data is not None \
+				or urlparse.urlparse(fullurl).scheme not in ('http', 'https'):
+			return self._request(fullurl, data)
+		return cache.open(self, fullurl)
+
+	def _request(self, fullurl, data=None, headers=()):
+		"""
+		Asks the server, sending ``headers`` on top of our own. urllib
+		cannot give up on a server which stops answering, so with a
+		``timeout`` the request goes through urllib2 instead, the error
+		pages coming back as responses all the same.
+		"""
+		if self.timeout is None \
+				or urlparse.urlparse(fullurl).scheme not in ('http', 'https'):
+			if not headers:
+				return urllib.FancyURLopener.open(self, fullurl, data)
+			fetcher = urllib.FancyURLopener()
+			fetcher.addheaders = list(self.addheaders) + list(headers)
+			return urllib.FancyURLopener.open(fetcher, fullurl, data)
+		import urllib2
+		request = urllib2.Request(fullurl, data)
+		for name, value in list(self.addheaders) + list(headers):
+			request.add_header(name, value)
+		try:
+			return urllib2.urlopen(request, timeout=self.timeout)
+		except urllib2.HTTPError, ex:
+			return ex
+
 class PythonbitsConfig:
-	"""Class for holding pythonbits config strings. read() or create_dom() must be called before first use. Access strings through obj.strings[key]"""
+	"""Class for holding pythonbits config strings. read() or create_dom() must be called before first use. Access strings through obj.strings[key],
+	or better through obj.string(key) and, for the patterns, obj.regex(key), which compiles each pattern only once.
+
+	read() checks the strings and keeps a snapshot of them next to config.xml, and loads that instead of parsing the XML again for as long as
+	config.xml keeps the same size and modification time.
+	"""
+	# names the code cannot do without; read() refuses a config lacking any of them
+	REQUIRED = ("google_url", "google_imdb_result_re", "imdb_url_re", "imdb_summary_re", "google_youtube_url",
+		"google_youtube_result_re", "youtube_trailer_re", "google_wikipedia_url", "wikipedia_url", "tvrage_quickinfo")
+	# patterns not named *_re, and the flags the patterns are used with
+	PATTERNS = ("wikipedia_url",)
+	REGEX_FLAGS = {
+		"google_imdb_result_re": re.DOTALL,
+		"imdb_summary_re": re.MULTILINE,
+		"youtube_trailer_re": re.IGNORECASE,
+	}
+	SNAPSHOT_VERSION = 1
+
 	def __init__(self):
 		global __logerror
 		self.strings={}
+		self.patterns={}
+		# parsed by read(), or by load_xml() when read() took the snapshot
+		self.xml = None
+		self._source = None
 		self.file=tempdir()+"config.xml"
 		if not os.path.exists(self.file):
 			update_url = "https://github.com/Ichabond/Pythonbits/raw/master/config.xml"
@@ -143,15 +697,69 @@ class PythonbitsConfig:
 	def __del__(self):
 		self.file.close()
 
+	@timedStage('PythonbitsConfig.read')
 	def read(self, file=0):
 		if not file:
 			file=self.file
-		self.xml = parse(file)
+		location = getattr(file, "name", file)
+		self._source = file
+		self.xml = None
+		snapshot = self.read_snapshot(location)
+		if snapshot is not None:
+			# the patterns compiled when the snapshot was written, so
+			# leave compiling them to their first use
+			self.strings = snapshot
+			self.patterns = {}
+			self.validate()
+			return
+		self.load_xml()
 		self.load_strings()
+		self.validate()
+		self.write_snapshot(location)
+
+	def load_xml(self):
+		"""Parses the config.xml read() last read, if read() loaded its snapshot instead; the XML is only needed to change the config."""
+		if self.xml is not None:
+			return
+		file = self._source
+		if hasattr(file, "seek"):
+			file.seek(0)
+		from xml.dom.minidom import parse
+		self.xml = parse(file)
+
+	def snapshot_file(self, location):
+		return location + ".snapshot.json"
+
+	def _stamp(self, location):
+		st = os.stat(location)
+		return [st.st_size, repr(st.st_mtime)]
+
+	def read_snapshot(self, location):
+		"""Returns the strings saved by write_snapshot() if config.xml has not changed since, None otherwise."""
+		try:
+			fh = open(self.snapshot_file(location), "rb")
+			try:
+				snapshot = json.load(fh)
+			finally:
+				fh.close()
+			if snapshot.get("version") != self.SNAPSHOT_VERSION or snapshot.get("stamp") != self._stamp(location):
+				return None
+			return snapshot["strings"]
+		except (IOError, OSError, ValueError, KeyError, AttributeError):
+			return None
+
+	def write_snapshot(self, location):
+		try:
+			snapshot = {"version": self.SNAPSHOT_VERSION, "stamp": self._stamp(location), "strings": self.strings}
+			from opensubtitles import dump_json
+			dump_json(self.snapshot_file(location), snapshot)
+		except (IOError, OSError), ex:
+			logging.info("Unable to save the config snapshot: %s", ex)
 
 	def write(self, file=0):
 		if not file:
 			file=self.file
+		self.load_xml()
 		location = self.file.name
 		file.close()
 		file = open(location, "w")
@@ -168,8 +776,36 @@ class PythonbitsConfig:
 	def load_strings(self):
 		for node in self.xml.getElementsByTagName("string"):
 			self.strings[node.getAttribute("name")]=node.firstChild.data.replace('\n','').replace('\t','')
+		self.compile_patterns()
+
+	def validate(self):
+		missing = [name for name in self.REQUIRED if name not in self.strings]
+		if missing:
+			raise ConfigError("Missing config strings: %s" % ", ".join(missing))
+
+	def compile_patterns(self):
+		"""Compiles every pattern among the strings, raising ConfigError if one does not compile."""
+		patterns = {}
+		for name, data in self.strings.items():
+			if name.endswith("_re") or name in self.PATTERNS:
+				try:
+					patterns[name] = re.compile(data, self.REGEX_FLAGS.get(name, 0))
+				except re.error, ex:
+					raise ConfigError("Bad pattern %s: %s" % (name, ex))
+		self.patterns = patterns
+
+	def string(self, name):
+		return self.strings[name].strip()
+
+	def regex(self, name):
+		pattern = self.patterns.get(name)
+		if pattern is None:
+			pattern = re.compile(self.strings[name], self.REGEX_FLAGS.get(name, 0))
+			self.patterns[name] = pattern
+		return pattern
 
 	def add_string(self, name, data):
+		self.load_xml()
 		container = self.xml.getElementsByTagName("pythonbits")[0]
 		stringtag = self.xml.createElement("string")
 		stringtag.setAttribute("name", name)
@@ -183,12 +819,14 @@ class PythonbitsConfig:
 		for (name, entry) in self.strings.items():
 			self.add_string(name, entry)
 	def create_dom(self):
+		from xml.dom.minidom import Document
 		self.xml = Document()
 		self.xml.appendChild(self.xml.createElement("pythonbits"))
 
 class SearchTV(object):
 	"""Searches for the specified show name with a given season,show tuple.
 	"""
+	@timedStage('SearchTV')
 	def __init__(self, searchString, episode_tuple):
 		"""
 		Searches for the provided show name and the given episode information.
@@ -196,7 +834,7 @@ class SearchTV(object):
 		:param episode_tuple: the (season, show-number) tuple of that show
 		"""
 		try:
-			template = conf.strings['tvrage_quickinfo'].strip()
+			template = conf.string('tvrage_quickinfo')
 		except KeyError, ke:
 			print >> sys.stderr, "Unable to look up the quickinfo template", ke
 			print >> sys.stderr, "Keys: ", conf.strings.keys()
@@ -317,17 +955,18 @@ class SearchMovie(object):
 	It save's the results as a list of tuples of title and url.
 	"""
 
+	@timedStage('SearchMovie')
 	def __init__(self, searchString):
 
 		self.searchString = searchString
 		self.results = []
 		self.opener = _MyOpener()
 		quoted_query = urllib.quote_plus(searchString.strip())
-		search_url = conf.strings["google_url"] % quoted_query
+		search_url = conf.string("google_url") % quoted_query
 		fh = self.opener.open( search_url )
 		self.feed = fh.read()
 		fh.close()
-		templist = re.findall(conf.strings["google_imdb_result_re"], self.feed, re.DOTALL)
+		templist = conf.regex("google_imdb_result_re").findall(self.feed)
 		for i in templist:
 			if len(i) > 1:
 				self.results.append((re.sub(r"<[^>]+>","",decode(i[1])),i[0]))
@@ -359,6 +998,13 @@ class SearchImdb(object):
 	from the imdb page.
 	"""
 
+	# read the microdata straight off the response instead of building a
+	# soup (--stream-microdata); off until it is shown to give the same
+	# values, which it leaves in the page's encoding where the soup gives
+	# UTF-8
+	STREAM_MICRODATA = False
+
+	@timedStage('SearchImdb')
 	def __init__(self,url):
 
 		self.url = url
@@ -393,7 +1039,7 @@ class SearchImdb(object):
 		self.mediainfo = ''
 		self.trivia = ''
 
-		if not re.match(conf.strings["imdb_url_re"] ,self.url):
+		if not conf.regex("imdb_url_re").match(self.url):
 			raise URLError("Invalid URL")
 
 		if self.url.endswith("/"):
@@ -408,16 +1054,19 @@ class SearchImdb(object):
 		except:
 			raise FetchError("Error connecting to IMDB")
 
-		code = None
-		if hasattr(self.feed, 'getcode'):
-			# python 2.5 does not have getcode
-			code = self.feed.getcode()
-		if not code or code != 404:
-			self.feed = self.feed.read()
-		else:
-			raise Error404("IMDB returned 404")
-
-		self.__parsePage(self.feed)
+		response = self.feed
+		try:
+			code = None
+			if hasattr(response, 'getcode'):
+				# python 2.5 does not have getcode
+				code = response.getcode()
+			if code == 404:
+				raise Error404("IMDB returned 404")
+			if not self.STREAM_MICRODATA:
+				self.feed = response.read()
+			self.__parsePage(self.feed)
+		finally:
+			response.close()
 
 	def __str__(self):
 		return self.title
@@ -472,11 +1121,14 @@ class SearchImdb(object):
 				overview += "\n%sCountry:%s " % format + " | ".join(self.country)
 		return overview
 
+	@timedStage('SearchImdb.parse')
 	def __parsePage(self, page):
 
 		"""Scrapes html from IMDB for information."""
 
-		mdata = microdata.extract( page )
+		import microdata
+		mdata = timedCall( 'microdata.extract', microdata.extract, page,
+			streaming=self.STREAM_MICRODATA )
 		if not mdata:
 			raise ValueError("Unable to find any microdata in IMDB result")
 		mitem = mdata[0]
@@ -531,6 +1183,69 @@ class SearchImdb(object):
 			else:
 				self.rating = rateValue
 
+	# the lookups enrich() makes, and the attribute each one fills in
+	ENRICHMENTS = (
+		('summary', 'getSummary', 'summary'),
+		('wiki', 'findWiki', 'wikiurl'),
+		('trailer', 'findTrailer', 'trailerurl'),
+	)
+	def enrich(self, concurrency=3, timeout=30):
+		"""
+		Fetches the plot summary, the Wikipedia search and the YouTube
+		search at the same time, filling in ``summary``, ``wikiurl`` and
+		``trailerurl`` in one call. A lookup which fails or is not done
+		``timeout`` seconds after the call is simply reported as
+		unsuccessful, without holding up the others.
+
+		Each lookup works on a copy of this object, with an opener of its
+		own whose requests give up once the time is up, and only what the
+		lookups which finish in time found is copied back; one left behind
+		cannot change this object later on.
+
+		:param concurrency: how many lookups may run at the same time
+		:param timeout: how many seconds the lookups may take altogether
+		:returns: a map from ``summary``, ``wiki`` and ``trailer`` to
+			whether that lookup succeeded
+		"""
+		import copy
+		deadline = time.time() + timeout
+		results = {}
+		slots = threading.Semaphore(max(1, concurrency))
+		def lookup(key, method, search):
+			slots.acquire()
+			try:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					return
+				search.opener.timeout = remaining
+				try:
+					results[key] = bool(getattr(search, method)())
+				except Exception, ex:
+					print >> sys.stderr, "Unable to look up the %s: %s" % (key, ex)
+					results[key] = False
+			finally:
+				slots.release()
+		lookups = []
+		for key, method, attribute in SearchImdb.ENRICHMENTS:
+			search = copy.copy(self)
+			search.opener = _MyOpener()
+			t = threading.Thread(target=lookup, args=(key, method, search))
+			t.daemon = True
+			t.start()
+			lookups.append((key, attribute, search, t))
+		outcome = {}
+		for key, attribute, search, t in lookups:
+			t.join(max(0, deadline - time.time()))
+			if t.isAlive():
+				print >> sys.stderr, "Gave up on the %s after %ds" % (key, timeout)
+				outcome[key] = False
+				continue
+			outcome[key] = results.get(key, False)
+			if outcome[key]:
+				setattr(self, attribute, getattr(search, attribute))
+		return outcome
+
+	@timedStage('SearchImdb.getSummary')
 	def getSummary(self):
 
 		"""returns the full summary for the movie"""
@@ -544,7 +1259,7 @@ class SearchImdb(object):
 		except Exception, ex:
 			print >> sys.stderr, "Unable to read /plotsummary: ", ex
 			return False
-		match = re.findall(conf.strings["imdb_summary_re"], synopsisPage, re.MULTILINE)
+		match = conf.regex("imdb_summary_re").findall(synopsisPage)
 		result = False
 		# prefer the microdata description, falling back to the regex one
 		if self.shortdescription:
@@ -555,6 +1270,7 @@ class SearchImdb(object):
 			result = True
 		return result
 
+	@timedStage('SearchImdb.findTrailer')
 	def findTrailer(self):
 
 		"""searches for the trailer on youtube"""
@@ -562,18 +1278,19 @@ class SearchImdb(object):
 		if not self.title:
 			return False
 		quoted_query = urllib.quote_plus(self.title.strip())
-		the_url = conf.strings["google_youtube_url"] % quoted_query
+		the_url = conf.string("google_youtube_url") % quoted_query
 		fh = self.opener.open( the_url )
 		results = fh.read()
 		fh.close()
-		results = re.findall(conf.strings["google_youtube_result_re"], results)
+		results = conf.regex("google_youtube_result_re").findall(results)
 		if results:
 			for result in results:
-				if re.search(self.title, result[1], re.IGNORECASE) and re.search(conf.strings["youtube_trailer_re"], result[1], re.IGNORECASE ):
+				if re.search(self.title, result[1], re.IGNORECASE) and conf.regex("youtube_trailer_re").search(result[1]):
 					self.trailerurl = result[0]
 					return True
 			return False
 
+	@timedStage('SearchImdb.findWiki')
 	def findWiki(self):
 
 		"""Tries in a somewhat rudimentary way to find the wikipedia url. If successful, it sets the attribute
@@ -590,20 +1307,195 @@ class SearchImdb(object):
 			if match:
 				searchstring += "+" + match[0]
 		if searchstring:
-			the_url = conf.strings["google_wikipedia_url"] % searchstring
+			the_url = conf.string("google_wikipedia_url") % searchstring
 			fh = self.opener.open( the_url )
 			results = fh.read()
 			fh.close()
-			links = re.findall(conf.strings["wikipedia_url"], results)
+			links = conf.regex("wikipedia_url").findall(results)
 			if links:
 				self.wikiurl = urlparse.urljoin(links[0], urllib.quote(urlparse.urlparse(links[0]).path))
 				return True
 		return False
 
-def findMediaInfo( path ):
+class ProbeCache(object):
+	"""
+	Remembers what ffmpeg and mediainfo had to say about a media file,
+	keyed by its (path, size, mtime, inode), so that regenerating a post
+	does not probe the same unchanged file all over again. The hit and
+	miss counts are kept in the cache file too, so they add up across
+	runs; they are written out along with the entries, so a run which
+	only reads the cache leaves the file alone. It is safe to share one
+	instance between threads.
+
+	Text is stored as latin-1, which maps every byte to a character and
+	back, so that what comes out is byte for byte what went in whatever
+	the encoding of the tool's output.
+
+	:param filename: where to keep the cache; defaults to
+		``pythonbits-probe.json`` in the temp directory.
+	:param max_entries: how many files to remember; past that, the ones
+		stored longest ago are forgotten until a quarter of the room is
+		free again
+	"""
+	# bumped whenever what is stored changes meaning, dropping older entries
+	VERSION = 2
+
+	def __init__(self, filename=None, max_entries=1000):
+		if filename is None:
+			filename = tempdir()+"pythonbits-probe.json"
+		self.filename = filename
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._data = self._read()
+		self._dirty = False
+
+	def get(self, path, field):
+		"""
+		:param path: the media file
+		:param field: what to look up, such as ``duration`` or ``mediainfo``
+		:return: the cached value, or None if there is none for the file
+			as it is now, or the file cannot be looked at
+		"""
+		key = self._key(path)
+		if key is None:
+			return None
+		self._lock.acquire()
+		try:
+			entry = self._data['entries'].get(key, {})
+			if field in entry:
+				self.hits += 1
+				self._data['hits'] += 1
+				return entry[field]
+			self.misses += 1
+			self._data['misses'] += 1
+			return None
+		finally:
+			self._lock.release()
+
+	def put(self, path, **fields):
+		"""
+		Caches the ``fields`` about ``path`` as it is now, unless the file
+		cannot be looked at.
+		"""
+		key = self._key(path)
+		if key is None:
+			return
+		self._lock.acquire()
+		try:
+			entries = self._data['entries']
+			entry = entries.setdefault(key, {'path': os.path.abspath(path)})
+			entry.update(fields)
+			entry['stored'] = time.time()
+			self._dirty = True
+			if len(entries) > self.max_entries:
+				self._evict(self.max_entries * 3 / 4)
+		finally:
+			self._lock.release()
+
+	def _evict(self, keep):
+		"""
+		Forgets all but the ``keep`` entries stored last; the lock must
+		be held.
+		"""
+		entries = self._data['entries']
+		by_age = sorted(entries, key=lambda key: entries[key].get('stored', 0))
+		for key in by_age[:len(entries) - keep]:
+			del entries[key]
+
+	def invalidate(self, path):
+		"""
+		Forgets everything about ``path`` or, if it is a directory, about
+		every file below it, whether they have changed or not.
+
+		:return: how many entries were dropped
+		"""
+		path = os.path.abspath(path)
+		self._lock.acquire()
+		try:
+			entries = self._data['entries']
+			doomed = [key for (key, entry) in entries.items()
+				if entry['path'] == path
+				or entry['path'].startswith(path.rstrip(os.sep) + os.sep)]
+			for key in doomed:
+				del entries[key]
+			if doomed:
+				self._dirty = True
+			return len(doomed)
+		finally:
+			self._lock.release()
+
+	def save(self):
+		"""
+		Writes the cache back to disk, if its entries changed since it
+		was read or last saved.
+		"""
+		from opensubtitles import dump_json
+		self._lock.acquire()
+		try:
+			if not self._dirty:
+				return
+			dump_json(self.filename, self._data)
+			self._dirty = False
+		finally:
+			self._lock.release()
+
+	def stats(self):
+		"""
+		:return: a short, human readable account of the hits and misses
+		"""
+		return "probe cache: %d hits, %d misses this run; " \
+			"%d hits, %d misses, %d files in all" % (
+			self.hits, self.misses, self._data['hits'], self._data['misses'],
+			len(self._data['entries']))
+
+	def _key(self, path):
+		"""
+		:return: the key of ``path`` as it is now, or None if it cannot
+			be looked at
+		"""
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		return '%s|%d|%r|%d' % (os.path.abspath(path), st.st_size,
+			st.st_mtime, st.st_ino)
+
+	def _read(self):
+		data = {'entries': {}, 'hits': 0, 'misses': 0, 'version': self.VERSION}
+		if not os.path.exists(self.filename):
+			return data
+		try:
+			fh = open(self.filename, 'rb')
+			try:
+				stored = json.load(fh)
+			finally:
+				fh.close()
+		except (IOError, ValueError), ex:
+			print >> sys.stderr, "Ignoring unreadable probe cache %s: %s" % \
+				(self.filename, ex)
+			return data
+		if stored.get('version') != self.VERSION:
+			# keep the counts, but not what the entries used to mean
+			stored['entries'] = {}
+			stored['version'] = self.VERSION
+		data.update(stored)
+		return data
+
+@timedStage('findMediaInfo')
+def findMediaInfo( path, probe_cache=None ):
 	"""Returns the mediainfo text if possible, or None otherwise.
 	BE AWARE that I will sys.exit upon ``OSError``.
+
+	:param probe_cache: the `ProbeCache` to consult before running
+		mediainfo, and to fill afterwards
 	"""
+	if probe_cache is not None:
+		mediainfo = probe_cache.get(path, 'mediainfo')
+		if mediainfo is not None:
+			return mediainfo.encode('latin-1')
+	import subprocess
 	mediainfo = None
 	try:
 		if os.name=="nt":
@@ -614,26 +1506,178 @@ def findMediaInfo( path ):
 	except OSError:
 		sys.stderr.write("Error: Media Info not installed, refer to http://mediainfo.sourceforge.net/en for installation")
 		exit(1)
+	if probe_cache is not None and mediainfo:
+		probe_cache.put(path, mediainfo=mediainfo.decode('latin-1'))
 	return mediainfo
 
 class ImageUploader(object):
 	"""
 	Superclass (how /does/ one define an interface in Python?) for all of
 	the image uploading services.
+
+	Every subclass has an ``_upload_one(filename)`` returning the URL
+	where it has uploaded that file, and raising ``urllib2.URLError`` if
+	it is worth trying again; ``get_urls`` (or ``begin``, ``submit`` and
+	``finish``, for files which are not all ready yet) takes care of
+	uploading several files at once and retrying each one on its own.
 	"""
+	# at most how many files are uploaded at the same time; enough for
+	# every screenshot ScreenExtractor will take
+	max_workers = 7
+	# how many times each file is attempted before giving up on it
+	max_tries = 3
+	# seconds to wait before the first retry, doubling after that
+	retry_delay = 1
+
 	def __init__(self):
-		pass
+		self._todo = None
+		self._results = None
+		self._errors = None
+		self._threads = None
 
 	def get_urls(self, files):
 		"""
 		:param files: the sequence of local filenames to upload.
-		:return: a sequence (hopefully in the same order as `files`) of
-			URLs where I have uploaded your files.
+		:return: a sequence, in the same order as `files`, of the URLs
+			where I have uploaded your files, with None in the place of
+			any file which could not be uploaded.
 		"""
-		pass
+		self.begin()
+		index = 0
+		for fn in files:
+			self.submit(index, fn)
+			index += 1
+		return self.finish()
+
+	def begin(self):
+		"""
+		Gets ready for files to be handed to ``submit`` as soon as they
+		are ready. Every ``begin`` must be matched by a ``finish``.
+		"""
+		self._todo = Queue.Queue()
+		self._results = {}
+		self._errors = []
+		self._threads = []
+
+	def submit(self, index, filename):
+		"""
+		Queues ``filename`` for upload, starting another upload worker
+		for it unless ``max_workers`` are running already.
+
+		:param index: the position of its URL in what ``finish`` returns
+		:param filename: the local file to upload.
+		"""
+		self._todo.put((index, filename))
+		if len(self._threads) < self.max_workers:
+			t = threading.Thread(target=self._worker)
+			t.daemon = True
+			t.start()
+			self._threads.append(t)
+
+	def finish(self):
+		"""
+		Waits for every submitted file to be uploaded.
+
+		:return: a sequence with the URL of each submitted file at its
+			``index``, and None at the index of any file which could not
+			be uploaded (or was never submitted).
+		"""
+		for t in self._threads:
+			self._todo.put(None)
+		for t in self._threads:
+			t.join()
+		if self._errors:
+			err_type, err_value, err_tb = self._errors[0]
+			raise err_type, err_value, err_tb
+		if not self._results:
+			return []
+		return [self._results.get(index)
+			for index in xrange(0, max(self._results.keys()) + 1)]
+
+	def _worker(self):
+		while True:
+			item = self._todo.get()
+			if item is None:
+				return
+			index, filename = item
+			try:
+				self._results[index] = self._upload_with_retries(filename)
+			except Exception:
+				self._errors.append(sys.exc_info())
+
+	@timedStage('ImageUploader.upload')
+	def _upload_with_retries(self, filename):
+		"""
+		:return: the URL of the uploaded ``filename``, or None if every
+			try failed.
+		"""
+		import urllib2
+		if os.path.exists(filename):
+			# the uploaders remove the file once it is up
+			countStage('ImageUploader.upload', bytes=os.path.getsize(filename))
+		delay = self.retry_delay
+		for tries in xrange(1, self.max_tries + 1):
+			try:
+				return self._upload_one(filename)
+			except urllib2.URLError, s:
+				countStage('ImageUploader.upload', retries=1)
+				print >> sys.stderr, \
+					'Connection problem uploading %s to %s.\n' \
+					'This was try %d of %d:\n%s' % \
+					(filename, self.__class__.__name__, tries, self.max_tries, s)
+			if tries < self.max_tries:
+				time.sleep(delay)
+				delay *= 2
+		return None
+
+	def _decode_json(self, json_str):
+		if hasattr(json,'loads'):
+			return json.loads( json_str )
+		elif hasattr(json,'read'):
+			return json.read( json_str )
+		err_msg = "I cannot decipher your `json`;\n" + \
+			"please report the following output to the bB forum:\n" + \
+			("%s" % dir(json))
+		raise Exception( err_msg )
 
 class ScreenExtractor(object):
-	def __init__(self, media, number_of_screens=2):
+	# how the grabs seek to their stop:
+	# 'input' seeks the input only, which older ffmpegs do by decoding
+	#     every frame up to the stop;
+	# 'fast' seeks the input to a keyframe shortly before the stop and
+	#     then decodes only the last FAST_SEEK_MARGIN seconds.
+	SEEK_MODES = ('fast', 'input')
+	FAST_SEEK_MARGIN = 10.0
+	# image format -> (file extension, ffmpeg option setting its quality)
+	IMAGE_FORMATS = {
+		'png': ('png', '-compression_level'),
+		'jpg': ('jpg', '-q:v'),
+	}
+	# 'per-shot' runs one ffmpeg process per screen grab, 'single' runs
+	# one ffmpeg process for all of them; either way the media is opened
+	# and probed once per grab, since an ffmpeg input can only be seeked
+	# once
+	ENGINES = ('per-shot', 'single')
+	def __init__(self, media, number_of_screens=2, jobs=None, seek='fast',
+			image_format='png', quality=None, engine='per-shot',
+			probe_cache=None, directory=None):
+		"""
+		:param media: the media file to take the screen grabs from
+		:param number_of_screens: how many screen grabs to take, 2 to 7
+		:param jobs: how many ffmpeg processes may run at once; defaults
+			to the number of available cores
+		:param seek: one of ``SEEK_MODES``
+		:param image_format: one of ``IMAGE_FORMATS``
+		:param quality: handed to ffmpeg as the PNG compression level
+			(0-9, higher is smaller) or JPEG quality scale (2-31, lower is
+			better); ffmpeg's default if not provided
+		:param engine: one of ``ENGINES``
+		:param probe_cache: the `ProbeCache` to consult before asking
+			ffmpeg for the duration, and to fill afterwards
+		:param directory: where to write the screen grabs; the temp
+			directory if not provided
+		"""
+		self._log = logging.getLogger('ScreenExtractor')
 		self.media = media
 		self.duration = 0
 		shots = number_of_screens
@@ -645,7 +1689,40 @@ class ScreenExtractor(object):
 			print >> sys.stderr, 'Number of screenshots limited to 7'
 		else:
 			self.shots = shots
+		if not jobs:
+			import multiprocessing
+			try:
+				jobs = multiprocessing.cpu_count()
+			except NotImplementedError:
+				jobs = 1
+		self.jobs = max(1, jobs)
+		if seek not in ScreenExtractor.SEEK_MODES:
+			raise ValueError("Unknown seek mode: %s" % seek)
+		self.seek = seek
+		if image_format not in ScreenExtractor.IMAGE_FORMATS:
+			raise ValueError("Unknown image format: %s" % image_format)
+		self.image_format = image_format
+		self.quality = quality
+		if engine not in ScreenExtractor.ENGINES:
+			raise ValueError("Unknown screenshot engine: %s" % engine)
+		self.engine = engine
+		self.probe_cache = probe_cache
+		if directory is None:
+			directory = tempdir()
+		self.directory = os.path.join(directory, '')
+		# (filename, seconds, bytes) of every grab made by extract()
+		self.timings = []
+	@timedStage('ScreenExtractor.getDuration')
 	def getDuration(self):
+		"""
+		:return: the duration of the media, in (fractional) seconds
+		"""
+		if self.probe_cache is not None:
+			duration = self.probe_cache.get(self.media, 'duration')
+			if duration is not None:
+				self.duration = duration
+				return self.duration
+		import subprocess
 		try:
 			ffmpeg = subprocess.Popen(
 				["ffmpeg", "-i", self.media],
@@ -654,53 +1731,196 @@ class ScreenExtractor(object):
 			raise Exception("Error: Ffmpeg not installed,\n" + \
 				" refer to http://www.ffmpeg.org/download.html for installation")
 		ffmpeg_out = ffmpeg.stdout.read()
-		ffmpeg_duration = re.findall(r'Duration:\D(\d{2}):(\d{2}):(\d{2})', ffmpeg_out)
+		ffmpeg_duration = re.findall(r'Duration:\D(\d{2}):(\d{2}):(\d{2}(?:\.\d+)?)', ffmpeg_out)
 		if not ffmpeg_duration:
 			self._report_error( "Expecting to find 'Duration' but did not", ffmpeg_out )
 		dur = ffmpeg_duration[0]
 		dur_hh = int(dur[0])
 		dur_mm = int(dur[1])
-		dur_ss = int(dur[2])
+		dur_ss = float(dur[2])
 		self.duration = dur_hh * 3600 + dur_mm * 60 + dur_ss
+		if self.probe_cache is not None:
+			streams = [line.strip() for line in ffmpeg_out.splitlines()
+				if line.strip().startswith('Stream #')]
+			self.probe_cache.put(self.media, duration=self.duration,
+				streams=[line.decode('latin-1') for line in streams])
 		return self.duration
 
-	def extract(self):
+	@timedStage('ScreenExtractor.extract')
+	def extract(self, on_grab=None):
 		"""
-		Extract the screen grabs from the provided media file.
+		Extract the screen grabs from the provided media file, either
+		running up to ``jobs`` ffmpeg processes at the same time or, with
+		the 'single' engine, one ffmpeg process grabbing every frame.
 
+		:param on_grab: if provided, called as ``on_grab(index, filename)``
+			as soon as each screen grab has been written, possibly from
+			another thread and not necessarily in ``index`` order
 		:return: a sequence of local file paths containing the screen grabs.
 		"""
 		self.getDuration()
 		# Take screenshots at even increments between 20% and 80% of the duration
 		stops = range(20,81,60/(self.shots-1))
 		imgs = [ ]
-		try:
-			count=0
-			for stop in stops:
-				fn = tempdir()+"screen%d.png" % count
-				imgs.append( fn )
-				proc = subprocess.Popen([r"ffmpeg",
-								  "-ss", str((self.duration * stop)/100),
-								  "-vframes", "1", "-i", self.media,
-								  "-y", "-sameq",
-								  "-f", "image2",
-								  fn ],
-					stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		positions = [ ]
+		count=0
+		for stop in stops:
+			fn = self.directory+"screen%d.%s" % (count,
+				ScreenExtractor.IMAGE_FORMATS[self.image_format][0])
+			imgs.append( fn )
+			positions.append( (self.duration * stop)/100 )
+			count+=1
+		on_done = None
+		if 'single' == self.engine:
+			commands = [ self._single_pass_command( positions, imgs ) ]
+			if on_grab is not None:
+				def on_done(index):
+					for img_index in xrange(0, len(imgs)):
+						on_grab(img_index, imgs[img_index])
+		else:
+			commands = [ self._grab_command( position, fn )
+				for position, fn in zip(positions, imgs) ]
+			if on_grab is not None:
+				def on_done(index):
+					on_grab(index, imgs[index])
+		failures, elapsed = self._run_all( commands, on_done )
+		if failures:
+			failure = failures[0]
+			if isinstance(failure, OSError):
+				print >> sys.stderr, \
+					"Error: Ffmpeg not installed,\n" \
+					"refer to http://www.ffmpeg.org/download.html for installation"
+				exit(1)
+			_sout, _serr = failure
+			self._report_error("FFmpeg exploded",
+				"STDOUT:%s\nSTDERR:%s" % (_sout, _serr))
+		if 'single' == self.engine:
+			# every grab took as long as the one process did
+			elapsed = elapsed * len(imgs)
+		self.timings = []
+		for fn, seconds in zip(imgs, elapsed):
+			size = 0
+			if os.path.exists(fn):
+				size = os.path.getsize(fn)
+			self.timings.append( (fn, seconds, size) )
+			self._log.info( "%s engine, %s seek: %.3fs %d bytes %s",
+				self.engine, self.seek, seconds, size, fn )
+			countStage( 'ScreenExtractor.extract', files=1, bytes=size )
+		return imgs
+
+	def _grab_command(self, position, fn):
+		"""
+		:param position: the offset into the media, in seconds
+		:param fn: where the screen grab should be written
+		:return: the ffmpeg command line grabbing that one frame
+		"""
+		input_args, output_args = self._seek_args( position )
+		return [r"ffmpeg", "-y"] + input_args + ["-i", self.media] + \
+			output_args + self._image_args( fn )
+
+	def _single_pass_command(self, positions, imgs):
+		"""
+		Opens the media once per position, each input already seeked to
+		its frame, and writes each input's first frame to its own output,
+		so that all the grabs cost a single ffmpeg process.
+
+		That saves the process startups, but ffmpeg still opens and probes
+		the media for every input: an input is seeked once, before it is
+		read, and the alternatives (a select filter or trim and split
+		over a single input) decode everything up to the last position,
+		which on a long file costs far more than the probes.
+		benchmarks/bench_screens.py times both engines and counts the
+		processes and opens of each.
+
+		:param positions: the offsets into the media, in seconds
+		:param imgs: where each screen grab should be written
+		:return: the ffmpeg command line grabbing all those frames
+		"""
+		command = [r"ffmpeg", "-y"]
+		outputs = []
+		index = 0
+		for position, fn in zip(positions, imgs):
+			input_args, output_args = self._seek_args( position )
+			command.extend( input_args + ["-i", self.media] )
+			outputs.extend( ["-map", "%d:v:0" % index] + output_args +
+				self._image_args( fn ) )
+			index += 1
+		return command + outputs
+
+	def _seek_args(self, position):
+		"""
+		:param position: the offset into the media, in seconds
+		:return: the ffmpeg input and output options, as two lists, that
+			seek to ``position`` according to our ``seek`` mode
+		"""
+		if 'fast' == self.seek:
+			coarse = max(0.0, position - ScreenExtractor.FAST_SEEK_MARGIN)
+			return (["-ss", "%.3f" % coarse],
+				["-ss", "%.3f" % (position - coarse), "-an", "-sn"])
+		return ["-ss", "%.3f" % position], ["-sameq"]
+
+	def _image_args(self, fn):
+		"""
+		:param fn: where the screen grab should be written
+		:return: the ffmpeg output options writing one frame to ``fn``
+		"""
+		args = ["-vframes", "1"]
+		if self.quality is not None:
+			args.extend([
+				ScreenExtractor.IMAGE_FORMATS[self.image_format][1],
+				str(self.quality)])
+		return args + ["-f", "image2", fn]
+
+	def _run_all(self, commands, on_done=None):
+		"""
+		Runs every command, no more than ``jobs`` at a time, calling
+		``on_done(index)`` (if provided) as each one succeeds.
+
+		:return: a tuple of two lists. The first holds, in the order of
+			``commands``, the (stdout, stderr) of each command that failed
+			or the ``OSError`` raised trying to start it, and is empty if
+			all went well. The second holds how many seconds each
+			command took.
+		"""
+		import subprocess
+		outcomes = [None] * len(commands)
+		elapsed = [0.0] * len(commands)
+		todo = Queue.Queue()
+		for index in xrange(0, len(commands)):
+			todo.put(index)
+		def worker():
+			while True:
+				try:
+					index = todo.get_nowait()
+				except Queue.Empty:
+					return
+				started = time.time()
+				try:
+					proc = subprocess.Popen(commands[index],
+						stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+				except OSError, ex:
+					outcomes[index] = ex
+					continue
 				_sout, _serr = proc.communicate()
 				rc = proc.wait()
+				elapsed[index] = time.time() - started
 				if rc:
-					self._report_error("FFmpeg exploded",
-						"STDOUT:%s\nSTDERR:%s" % (_sout, _serr))
-				count+=1
-		except OSError:
-			print >> sys.stderr, \
-				"Error: Ffmpeg not installed,\n" \
-				"refer to http://www.ffmpeg.org/download.html for installation"
-			exit(1)
-		return imgs
+					outcomes[index] = (_sout, _serr)
+				elif on_done is not None:
+					on_done(index)
+		threads = []
+		for i in xrange(0, min(self.jobs, len(commands))):
+			t = threading.Thread(target=worker)
+			t.daemon = True
+			t.start()
+			threads.append(t)
+		for t in threads:
+			t.join()
+		return [outcome for outcome in outcomes if outcome is not None], elapsed
 
 	def _report_error(self, msg, text ):
 		# the odds of a filename collision on an md5 digest are very small
+		from hashlib import md5
 		out_fn = '%s.txt' % md5(text).hexdigest()
 		err_f = open(out_fn, 'wb')
 		err_f.write( text )
@@ -715,109 +1935,97 @@ class MinUs(ImageUploader):
 	def __init__(self):
 		ImageUploader.__init__(self)
 		global conf
-		self._username = conf.strings["min.us.username"]
-		self._password = conf.strings["min.us.password"]
-	def get_urls(self, files):
-		api = MinUsAPI()
-		api.login(self._username, self._password)
-		gallery, _ = api.create_gallery()
-		results = []
-		for fn in files:
-			fid, url = api.upload_item( gallery, fn )
-			results.append( url )
-		api.logout()
+		self._username = conf.string("min.us.username")
+		self._password = conf.string("min.us.password")
+		self._api = None
+		self._gallery = None
+	def begin(self):
+		from minus_api import MinUsAPI
+		self._api = MinUsAPI()
+		self._api.login(self._username, self._password)
+		self._gallery, _ = self._api.create_gallery()
+		ImageUploader.begin(self)
+	def finish(self):
+		try:
+			results = ImageUploader.finish(self)
+		finally:
+			self._api.logout()
 		return results
+	def _upload_one(self, fn):
+		fid, url = self._api.upload_item( self._gallery, fn )
+		return url
 
 class BaconBits(ImageUploader):
 	def __init__(self):
 		ImageUploader.__init__(self)
 		global conf
-		self.imageurl = []
 		self.api_url = "https://images.baconbits.org/upload.php"
 		self.img_template = "https://images.baconbits.org/images/%s"
-	def get_urls(self, files):
-		results = []
-		if self._upload( files ):
-			results = self.imageurl
-		return results
-	def _upload(self, files):
-		opener = urllib2.build_opener(MultipartPostHandler.MultipartPostHandler)
-		tries = 0
-		max_tries = 3
-		result = False
-		while tries < max_tries:
-			tries += 1
-			try:
-				for img in files:
-					params = ({'ImageUp' : open(img, "rb")})
-					socket = opener.open(self.api_url, params)
-					json_str = socket.read()
-					if hasattr(json,'loads'):
-						read = json.loads( json_str )
-					elif hasattr(json,'read'):
-						read = json.read( json_str )
-					else:
-						err_msg = "I cannot decipher your `json`;\n" + \
-							"please report the following output to the bB forum:\n" + \
-							("%s" % dir(json))
-						raise Exception( err_msg )
-					socket.close()
-					the_url = self.img_template % read['ImgName']
-					self.imageurl.append( the_url )
-					os.remove(img)
-				result = True
-				break
-			except urllib2.URLError, s:
-				print >> sys.stderr, \
-					'Connection timed out, retrying to upload screenshots to imgur.\n' \
-					'This is try %d of %d:\n%s' % ( tries, max_tries, s )
-		return result
+		import urllib2
+		import MultipartPostHandler
+		self._opener = urllib2.build_opener(MultipartPostHandler.MultipartPostHandler)
+	def _upload_one(self, img):
+		fh = open(img, "rb")
+		try:
+			socket = self._opener.open(self.api_url, {'ImageUp' : fh})
+			json_str = socket.read()
+			socket.close()
+		finally:
+			fh.close()
+		read = self._decode_json( json_str )
+		the_url = self.img_template % read['ImgName']
+		os.remove(img)
+		return the_url
 
 class Imgur(ImageUploader):
 	def __init__(self):
 		ImageUploader.__init__(self)
 		global conf
-		self.imageurl = []
-		self.key = conf.strings["imgur_key"]
+		self.key = conf.string("imgur_key")
+		import urllib2
+		import MultipartPostHandler
+		self._opener = urllib2.build_opener(MultipartPostHandler.MultipartPostHandler)
 
-	def get_urls(self, files):
-		result = []
-		if self._upload( files ):
-			result = self.imageurl
-		return result
+	def _upload_one(self, img):
+		fh = open(img, "rb")
+		try:
+			params = ({'key' : self.key.decode('utf-8').encode('utf-8'), 'image' : fh})
+			socket = self._opener.open("http://api.imgur.com/2/upload.json", params)
+			json_str = socket.read()
+			socket.close()
+		finally:
+			fh.close()
+		read = self._decode_json( json_str )
+		os.remove(img)
+		return read['upload']['links']['original']
 
-	def _upload(self, files):
-		opener = urllib2.build_opener(MultipartPostHandler.MultipartPostHandler)
-		tries = 0
-		max_tries = 3
-		result = False
-		while tries < max_tries:
-			tries += 1
-			try:
-				for img in files:
-					params = ({'key' : self.key.decode('utf-8').encode('utf-8'), 'image' : open(img, "rb")})
-					socket = opener.open("http://api.imgur.com/2/upload.json", params)
-					json_str = socket.read()
-					if hasattr(json,'loads'):
-						read = json.loads( json_str )
-					elif hasattr(json,'read'):
-						read = json.read( json_str )
-					else:
-						err_msg = "I cannot decipher your `json`;\n" + \
-							"please report the following output to the bB forum:\n" + \
-							("%s" % dir(json))
-						raise Exception( err_msg )
-					self.imageurl.append(read['upload']['links']['original'])
-					socket.close()
-					os.remove(img)
-				result = True
-				break
-			except urllib2.URLError, s:
-				print >> sys.stderr, \
-					'Connection timed out, retrying to upload screenshots to imgur.\n' \
-					'This is try %d of %d:\n%s' % ( tries, max_tries, s )
-		return result
+class LocalUploader(ImageUploader):
+	"""
+	Keeps the screenshots on this machine rather than uploading them,
+	moving each one into ``directory`` and handing back its ``file://``
+	URL; for runs without a network, such as trying out ``--serve``.
 
+	:param directory: where to keep them; defaults to
+		``pythonbits-screens`` in the temp directory.
+	"""
+	def __init__(self, directory=None):
+		ImageUploader.__init__(self)
+		if directory is None:
+			directory = tempdir()+"pythonbits-screens"
+		self.directory = directory
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+	def _upload_one(self, img):
+		import shutil
+		# every post has its screen0.png, so each one kept gets a name of
+		# its own
+		base, ext = os.path.splitext(os.path.basename(img))
+		fd, kept = tempfile.mkstemp(ext, base + '-', self.directory)
+		os.close(fd)
+		shutil.move(img, kept)
+		return 'file://' + urllib.pathname2url(os.path.abspath(kept))
+
+@timedStage('get_tv_rage_episode_summary')
 def get_tv_rage_episode_summary( episode_url ):
 	"""
 	:param episode_url: the tvrage.com URL that points to the target episode
@@ -837,6 +2045,7 @@ def get_tv_rage_episode_summary( episode_url ):
 		return result
 	opener = _MyOpener()
 	ep_html = opener.open( episode_url)
+	from BeautifulSoup import BeautifulSoup
 	soup = BeautifulSoup( ep_html )
 	# the easy botton?
 	synop = soup.find('div',{'class':'show_synopsis'})
@@ -877,19 +2086,999 @@ def updateConfig():
 	newconf.close()
 	os.chmod(tempdir()+"config.xml", 0777)
 
+def logoutOpenSubtitles():
+	"""
+	Releases the OpenSubtitles session that runs have been sharing, if any.
+	"""
+	from opensubtitles import OpenSubtitlesClient, USER_AGENT, TokenStore
+	osub = OpenSubtitlesClient( USER_AGENT, token_store=TokenStore() )
+	if osub.ResumeSession( '', '' ):
+		osub.LogOut()
+
+def prewarmHashCache( top ):
+	"""
+	Hashes every file below ``top`` into the OpenSubtitles hash cache,
+	so later runs against those files do not need to read them again.
+	"""
+	from opensubtitles import HashCache, hash_many
+	paths = []
+	for dirpath, dirnames, filenames in os.walk( top ):
+		for fn in filenames:
+			paths.append( os.path.join( dirpath, fn ) )
+	cache = HashCache()
+	hashed = 0
+	for path, file_size, file_hash in hash_many( paths, cache=cache ):
+		if file_hash:
+			hashed += 1
+			print "%s %s %s" % (file_hash, file_size, path)
+	print >> sys.stderr, "Hashed %d of %d files; %s" % \
+		(hashed, len(paths), cache.stats())
+
+def parseEpisode( text ):
+	"""
+	:param text: a TV episode identifier, like 1x2 or S01E02
+	:return: the (season, episode) tuple, or None if ``text`` is neither
+	"""
+	matchers = [
+			re.compile(r'(\d+)x(\d+)'),
+			re.compile(r'(?i)s(\d+)e(\d+)')
+			]
+	for matcher in matchers:
+		ma = matcher.match(text)
+		if ma:
+			return ( int(ma.group(1)), int(ma.group(2)) )
+	return None
+
+class PostBuilder(object):
+	"""
+	Writes the BBCode post of one release after another, sharing the
+	image uploader, the probe and hash caches and the OpenSubtitles
+	connection between them, so that a batch of releases only pays for
+	setting those up once.
+
+	:param uploader: the `ImageUploader` the screenshots go to
+	:param probe_cache: the `ProbeCache` to hand to ffmpeg and mediainfo
+	:param hash_cache: the OpenSubtitles `HashCache`; one over the default
+		cache file is made when first needed if not provided
+	:param screens: the keyword arguments of every `ScreenExtractor`,
+		besides the media file and probe cache
+	"""
+	def __init__(self, uploader, probe_cache=None, hash_cache=None, **screens):
+		self.uploader = uploader
+		self.probe_cache = probe_cache
+		self.screens = screens
+		self._hash_cache = hash_cache
+		self._osub = None
+
+	@timedStage('PostBuilder.search_subtitles')
+	def search_subtitles(self, filenames):
+		"""
+		Hashes ``filenames`` and looks them all up on OpenSubtitles at
+		once.
+
+		:return: a map of each filename to the list of its subtitles;
+			files which could not be hashed have none.
+		"""
+		from opensubtitles import OpenSubtitlesClient, USER_AGENT, HashCache, \
+			KeepAliveTransport, TokenStore, hash_many
+		if self._hash_cache is None:
+			self._hash_cache = HashCache()
+		results = dict([(fn, []) for fn in filenames])
+		hashed = [(path, file_size, file_hash) for path, file_size, file_hash
+			in timedCall( 'hash_many', list, hash_many( filenames, cache=self._hash_cache ) )
+			if file_hash]
+		countStage( 'hash_many', files=len(filenames) )
+		if not hashed:
+			return results
+		if self._osub is None:
+			self._osub = OpenSubtitlesClient( USER_AGENT, KeepAliveTransport(), TokenStore() )
+		# the session outlives us, for the next run to pick up
+		timedCall( 'OpenSubtitles.session', self._osub.EnsureSession, '', '' )
+		found = timedCall( 'OpenSubtitles.search', self._osub.SearchSubtitlesBatch,
+			[ (file_size, file_hash) for path, file_size, file_hash in hashed ] )
+		for (path, file_size, file_hash), sub_results in zip( hashed, found ):
+			results[ path ] = sub_results
+		return results
+
+	@timedStage('PostBuilder.build')
+	def build(self, out, search_string, filename, tv_episode=None, sub_results=None,
+			screen_dir=None):
+		"""
+		Looks the release up, takes and uploads its screenshots and
+		writes its post to ``out``. Whatever happens, every stage has
+		finished by the time this returns.
+
+		:param out: the file to write the post to
+		:param tv_episode: the (season, episode) tuple of a TV episode,
+			or None for a movie
+		:param sub_results: the subtitles of ``filename``, if they have
+			been looked up already with `search_subtitles`
+		:param screen_dir: where to write the screenshots, see
+			`ScreenExtractor`
+		:return: a map of the name of each stage to the seconds it took
+		"""
+		uploader = self.uploader
+		extractor = ScreenExtractor(filename, probe_cache=self.probe_cache,
+			directory=screen_dir, **self.screens)
+
+		def find_movie():
+			results = SearchMovie(search_string).results
+			if not results:
+				sys.stderr.write("No films found.\n")
+				sys.exit(1)
+			return SearchImdb(results[0][1])
+		def find_subtitles():
+			if sub_results is not None:
+				return sub_results
+			return self.search_subtitles( [ filename ] )[ filename ]
+		def find_tv_episode():
+			results = SearchTV(search_string, tv_episode).result
+			if 'Episode URL' in results:
+				ep_url = results[ 'Episode URL' ]
+				ep_summary = get_tv_rage_episode_summary( ep_url )
+				if ep_summary:
+					results['Summary'] = ep_summary
+			return results
+		# each screenshot is uploaded as soon as ffmpeg has written it, but
+		# not before we know there is a post to put it in
+		grabbed = Queue.Queue()
+		def take_screenshots():
+			try:
+				image_filenames = extractor.extract(
+					lambda index, fn: grabbed.put( (index, fn) ) )
+			finally:
+				grabbed.put( None )
+			if not image_filenames:
+				raise ValueError("Expected to have image files but found none")
+			return image_filenames
+		def upload_screenshots(*found):
+			uploader.begin()
+			try:
+				for item in iter(grabbed.get, None):
+					uploader.submit(*item)
+			finally:
+				image_urls = uploader.finish()
+			tasks.result('screenshots')
+			return image_urls
+
+		tasks = TaskGraph()
+		try:
+			tasks.add('screenshots', take_screenshots)
+			tasks.add('mediainfo', lambda: findMediaInfo(filename, self.probe_cache))
+			if tv_episode:
+				tasks.add('tv', find_tv_episode)
+				tasks.add('uploads', upload_screenshots)
+			else:
+				tasks.add('movie', find_movie)
+				tasks.add('uploads', upload_screenshots, 'movie')
+				tasks.add('enrich', lambda movie: movie.enrich(), 'movie')
+				tasks.add('subtitles', find_subtitles)
+			self._write_post(out, tasks, tv_episode)
+		finally:
+			# the uploader must be idle before the next release uses it
+			tasks.wait()
+			# nor are the screenshots of a post given up on kept around
+			while True:
+				try:
+					item = grabbed.get_nowait()
+				except Queue.Empty:
+					break
+				if item is not None and os.path.exists(item[1]):
+					os.remove(item[1])
+		return tasks.timings()
+
+	def _write_post(self, out, tasks, tv_episode):
+		movie = None
+		found = {}
+		if not tv_episode:
+			movie = tasks.result('movie')
+			found = tasks.result('enrich')
+		if movie and found['summary']:
+			print >> out, "[b]Description:[/b]"
+			print >> out, "[quote]%s[/quote]\n" % movie.summary[0]
+		print >> out, "[b]Information:[/b]"
+		print >> out, "[quote]"
+		if movie:
+			if found['wiki']:
+				print >> out, "Wikipedia url: %s" % movie.wikiurl
+			if found['trailer']:
+				print >> out, "Trailer: %s" % movie.trailerurl
+			sub_results = tasks.result('subtitles')
+			if sub_results:
+				links = []
+				for it in sub_results:
+					links.append(
+						'[url=%s]%s[/url]' % (
+						it['SubDownloadLink'], it['ISO639'], ) )
+				print >> out, 'Subtitles: %s' % ' | '.join( links )
+			print >> out, movie.overview()
+		elif tv_episode:
+			interesting_fields = [
+				'Classification',
+				'Country',
+				'Ended',
+				'Episode URL',
+				'Genres',
+				'Network',
+				'Premiered',
+				'Runtime',
+				'Episode Description',
+				'Show Name',
+				'Show URL',
+				'Started',
+				'Status',
+				'Summary' # this is added by find_tv_episode, not from the API :-(
+			]
+			results = tasks.result('tv')
+			for field_name in interesting_fields:
+				if not field_name in results:
+					continue
+				v = results[ field_name ]
+				print >> out, "[b]%s[/b]: %s" % (field_name, v)
+		print >> out, "[/quote]"
+		print >> out, "[b]Screenshots:[/b]"
+		image_urls = tasks.result('uploads')
+		for index, url in enumerate(image_urls):
+			if not url:
+				print >> sys.stderr, "Screenshot %d could not be uploaded; " \
+					"it is left out of the post" % (index + 1)
+		image_urls = [url for url in image_urls if url]
+		if image_urls:
+			print >> out, "[quote][align=center]" 
+			for url in image_urls:
+				print >> out, "[img=%s]" % url
+			print >> out, "[/align][/quote]"
+		mediainfo = tasks.result('mediainfo')
+		if mediainfo:
+			print >> out, "[mediainfo]\n%s\n[/mediainfo]" % mediainfo
+
+	def save(self):
+		"""
+		Saves the hash and probe caches.
+		"""
+		if self._hash_cache is not None:
+			self._hash_cache.save()
+		if self.probe_cache is not None:
+			self.probe_cache.save()
+
+	def close(self):
+		"""
+		Saves the caches and closes the OpenSubtitles connection.
+		"""
+		self.save()
+		if self._osub is not None:
+			self._osub.transport.close()
+
+# what walkMediaFiles takes for a release
+MEDIA_EXTENSIONS = ('.avi', '.m2ts', '.m4v', '.mkv', '.mov', '.mp4', '.mpeg',
+	'.mpg', '.ts', '.vob', '.wmv')
+
+def readManifest( path ):
+	"""
+	Reads the releases of a batch from ``path``, one per line: either a
+	JSON object with a ``name``, a ``file`` and maybe an ``episode``, or
+	a CSV row of those in that order. Blank lines and lines starting with
+	``#`` are skipped, and files are relative to the manifest.
+
+	:return: a list of (name, file, (season, episode) or None) tuples
+	:raise ValueError: if a line is neither, or its episode makes no sense
+	"""
+	import csv
+	items = []
+	base = os.path.dirname( os.path.abspath( path ) )
+	fh = open( path, 'rb' )
+	try:
+		for line_no, line in enumerate( fh ):
+			line = line.strip()
+			if not line or line.startswith( '#' ):
+				continue
+			if line.startswith( '{' ):
+				entry = json.loads( line )
+				fields = [ entry.get('name'), entry.get('file'), entry.get('episode') ]
+				fields = [ f is not None and unicode(f).encode('utf-8') or f for f in fields ]
+			else:
+				fields = ( list( csv.reader( [ line ] ) )[0] + [ None ] )[:3]
+			name, filename, episode = [ f and f.strip() for f in fields ]
+			if not name or not filename:
+				raise ValueError( "%s:%d: expected a name and a file" % (path, line_no + 1) )
+			tv_episode = None
+			if episode:
+				tv_episode = parseEpisode( episode )
+				if not tv_episode:
+					raise ValueError( "%s:%d: unable to decipher the tv-episode \"%s\"" %
+						(path, line_no + 1, episode) )
+			items.append( ( name, os.path.join( base, filename ), tv_episode ) )
+	finally:
+		fh.close()
+	return items
+
+def walkMediaFiles( top ):
+	"""
+	Finds the media files below ``top``, guessing the name of each
+	release from its filename: what comes before an S01E02 or 1x02 style
+	episode (which makes it a TV episode) or a year, with dots and
+	underscores taken for spaces.
+
+	:return: a list of (name, file, (season, episode) or None) tuples,
+		sorted by file
+	"""
+	episode_re = re.compile( r'(?i)(?:^|[\s._-])(?:s(\d+)e(\d+)|(\d+)x(\d+))(?:$|[\s._-])' )
+	year_re = re.compile( r'(?:^|[\s._(\[-])(?:19|20)\d\d(?:$|[\s._)\]-])' )
+	items = []
+	for dirpath, dirnames, filenames in os.walk( top ):
+		dirnames.sort()
+		for fn in sorted( filenames ):
+			stem, ext = os.path.splitext( fn )
+			if ext.lower() not in MEDIA_EXTENSIONS:
+				continue
+			tv_episode = None
+			ma = episode_re.search( stem )
+			if ma:
+				season, episode = [ g for g in ma.groups() if g is not None ]
+				tv_episode = ( int(season), int(episode) )
+				name = stem[:ma.start()]
+			else:
+				ma = year_re.search( stem )
+				name = ma and ma.start() and stem[:ma.start()] or stem
+			name = re.sub( r'[._]+', ' ', name ).strip( ' -' ) or stem
+			items.append( ( name, os.path.join( dirpath, fn ), tv_episode ) )
+	return items
+
+def runBatch( builder, items, output_dir, report=sys.stdout ):
+	"""
+	Writes the post of each of ``items`` to its own file in
+	``output_dir``, named after its media file, and a summary of how long
+	each stage of each release took to ``summary.txt`` there and to
+	``report``. A release which fails does not stop the others.
+
+	The subtitles of all the movies are looked up at once, up front.
+
+	:param builder: the `PostBuilder` to write the posts with
+	:param items: (name, file, (season, episode) or None) tuples, as
+		returned by `readManifest` or `walkMediaFiles`
+	:return: how many releases failed
+	"""
+	from StringIO import StringIO
+	log = logging.getLogger('batch')
+	if not os.path.isdir( output_dir ):
+		os.makedirs( output_dir )
+	batch_timings = {}
+	started = time.time()
+	subtitles = {}
+	movies = [ filename for name, filename, tv_episode in items if not tv_episode ]
+	if movies:
+		try:
+			subtitles = builder.search_subtitles( movies )
+		except Exception, ex:
+			log.warning( 'Unable to look up the subtitles of the batch: %s', ex )
+	batch_timings[ 'subtitle search' ] = time.time() - started
+
+	used = set()
+	rows = []
+	failures = 0
+	for name, filename, tv_episode in items:
+		out_name = os.path.splitext( os.path.basename( filename ) )[0]
+		candidate = out_name
+		n = 1
+		while candidate in used:
+			n += 1
+			candidate = '%s-%d' % (out_name, n)
+		used.add( candidate )
+		out_fn = os.path.join( output_dir, candidate + '.txt' )
+		log.info( 'Writing the post of %s to %s', filename, out_fn )
+		buf = StringIO()
+		item_started = time.time()
+		status = 'ok'
+		timings = {}
+		try:
+			timings = builder.build( buf, name, filename, tv_episode,
+				subtitles.get( filename ) )
+			fh = open( out_fn, 'w' )
+			try:
+				fh.write( buf.getvalue() )
+			finally:
+				fh.close()
+		except KeyboardInterrupt:
+			raise
+		except BaseException, ex:
+			failures += 1
+			status = 'failed: %s %s' % (ex.__class__.__name__, ex)
+			log.warning( 'Unable to write the post of %s: %s', filename, status )
+		timings[ 'total' ] = time.time() - item_started
+		rows.append( ( name, status, timings ) )
+	batch_timings[ 'total' ] = time.time() - started
+
+	summary = _batchSummary( rows, batch_timings )
+	fh = open( os.path.join( output_dir, 'summary.txt' ), 'w' )
+	try:
+		fh.write( summary )
+	finally:
+		fh.close()
+	report.write( summary )
+	return failures
+
+def _batchSummary( rows, batch_timings ):
+	known = [ 'movie', 'enrich', 'subtitles', 'tv', 'mediainfo', 'screenshots', 'uploads' ]
+	stages = []
+	for name, status, timings in rows:
+		for stage in timings:
+			if stage != 'total' and stage not in stages:
+				stages.append( stage )
+	stages.sort( key=lambda stage: stage in known and known.index( stage ) + 1 or len( known ) + 1 )
+	stages.append( 'total' )
+	width = max( [ len( name ) for name, status, timings in rows ] + [ 7 ] )
+	lines = []
+	lines.append( '%-*s  %s  %s' % ( width, 'release',
+		'  '.join( [ '%11s' % stage for stage in stages ] ), 'status' ) )
+	totals = dict( [ (stage, 0.0) for stage in stages ] )
+	for name, status, timings in rows:
+		cells = []
+		for stage in stages:
+			if stage in timings:
+				totals[ stage ] += timings[ stage ]
+				cells.append( '%11.2f' % timings[ stage ] )
+			else:
+				cells.append( '%11s' % '-' )
+		lines.append( '%-*s  %s  %s' % ( width, name, '  '.join( cells ), status ) )
+	lines.append( '%-*s  %s  %d of %d ok' % ( width, 'sum',
+		'  '.join( [ '%11.2f' % totals[ stage ] for stage in stages ] ),
+		len( [ r for r in rows if r[1] == 'ok' ] ), len( rows ) ) )
+	for stage in sorted( batch_timings ):
+		lines.append( 'batch %s: %.2fs' % ( stage, batch_timings[ stage ] ) )
+	return '\n'.join( lines ) + '\n'
+
+class JobQueue(object):
+	"""
+	Writes posts for whoever asks, on a fixed number of worker threads,
+	for the life of the process; see `serveJobs`. Each worker keeps a
+	`PostBuilder` per image uploader it has been asked for, so their
+	connections stay open from one job to the next.
+
+	Jobs are maps holding their ``id``, ``name``, ``file``, ``episode``,
+	``uploader`` and ``status`` (queued, running, done or failed), the
+	times they were queued, started and finished at, and once finished
+	either the ``bbcode`` or the ``error``, and the seconds each stage
+	took in ``timings``. Only the last ``keep`` finished jobs are kept.
+
+	:param make_builder: called with the name of an uploader, returns the
+		`PostBuilder` a worker is to use for it
+	:param max_jobs: how many jobs may run at the same time
+	"""
+	keep = 1000
+
+	def __init__(self, make_builder, max_jobs=1):
+		self.make_builder = make_builder
+		self.max_jobs = max(1, max_jobs)
+		self._todo = Queue.Queue()
+		self._jobs = {}
+		self._finished = []
+		self._next_id = 1
+		self._lock = threading.Condition()
+		self._builders = []
+		self._threads = []
+		for i in xrange(0, self.max_jobs):
+			t = threading.Thread(target=self._worker, name='job-worker-%d' % i)
+			t.daemon = True
+			t.start()
+			self._threads.append(t)
+
+	def submit(self, name, filename, episode=None, uploader='bb'):
+		"""
+		Queues a job.
+
+		:param episode: the (season, episode) tuple of a TV episode, or
+			None for a movie
+		:return: a copy of the job
+		"""
+		self._lock.acquire()
+		try:
+			job = {'id': self._next_id, 'name': name, 'file': filename,
+				'episode': episode, 'uploader': uploader, 'status': 'queued',
+				'queued_at': time.time(), 'started_at': None, 'finished_at': None,
+				'bbcode': None, 'error': None, 'timings': {}}
+			self._next_id += 1
+			self._jobs[job['id']] = job
+			self._todo.put(job['id'])
+			return dict(job)
+		finally:
+			self._lock.release()
+
+	def get(self, job_id, wait=None):
+		"""
+		:param wait: how many seconds to wait for the job to finish, if it
+			has not yet
+		:return: a copy of the job, or None if there is no such job
+		"""
+		self._lock.acquire()
+		try:
+			job = self._jobs.get(job_id)
+			if job is not None and wait:
+				deadline = time.time() + wait
+				while job['status'] in ('queued', 'running'):
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						break
+					self._lock.wait(remaining)
+			return job is not None and dict(job) or None
+		finally:
+			self._lock.release()
+
+	def jobs(self):
+		"""
+		:return: copies of the jobs, without their ``bbcode``, by ``id``
+		"""
+		self._lock.acquire()
+		try:
+			return [dict(self._jobs[job_id], bbcode=None)
+				for job_id in sorted(self._jobs.keys())]
+		finally:
+			self._lock.release()
+
+	def stats(self):
+		"""
+		:return: how many jobs are in each status, and the limit on the
+			running ones
+		"""
+		self._lock.acquire()
+		try:
+			counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+			for job in self._jobs.values():
+				counts[job['status']] += 1
+			counts['max_jobs'] = self.max_jobs
+			return counts
+		finally:
+			self._lock.release()
+
+	def stop(self):
+		"""
+		Lets the running jobs finish, drops the queued ones and closes
+		the workers' builders.
+		"""
+		while True:
+			try:
+				self._todo.get_nowait()
+			except Queue.Empty:
+				break
+		for t in self._threads:
+			self._todo.put(None)
+		for t in self._threads:
+			while t.isAlive():
+				t.join(0.1)
+		for builder in self._builders:
+			builder.close()
+
+	def _worker(self):
+		import shutil
+		from StringIO import StringIO
+		builders = {}
+		while True:
+			job_id = self._todo.get()
+			if job_id is None:
+				return
+			self._lock.acquire()
+			try:
+				job = self._jobs[job_id]
+				job['status'] = 'running'
+				job['started_at'] = time.time()
+			finally:
+				self._lock.release()
+			out = StringIO()
+			status, bbcode, error, timings = 'done', None, None, {}
+			# jobs running side by side must not overwrite each other's
+			# screenshots
+			screen_dir = tempfile.mkdtemp(prefix='pythonbits-job-%d-' % job_id)
+			try:
+				builder = builders.get(job['uploader'])
+				if builder is None:
+					builder = self.make_builder(job['uploader'])
+					builders[job['uploader']] = builder
+					self._lock.acquire()
+					self._builders.append(builder)
+					self._lock.release()
+				timings = builder.build(out, job['name'], job['file'], job['episode'],
+					screen_dir=screen_dir)
+				bbcode = out.getvalue()
+				# a daemon may well be killed rather than stopped
+				builder.save()
+			except KeyboardInterrupt:
+				raise
+			except BaseException, ex:
+				# this includes the SystemExit of "No films found." and the like
+				status, error = 'failed', '%s %s' % (ex.__class__.__name__, ex)
+				logging.getLogger('JobQueue').warning('Job %d failed: %s', job_id, error)
+			shutil.rmtree(screen_dir, True)
+			self._finish(job, status, bbcode, error, timings)
+
+	def _finish(self, job, status, bbcode, error, timings):
+		self._lock.acquire()
+		try:
+			job['finished_at'] = time.time()
+			timings['queued'] = job['started_at'] - job['queued_at']
+			timings['total'] = job['finished_at'] - job['started_at']
+			job.update(status=status, bbcode=bbcode, error=error, timings=timings)
+			self._finished.append(job['id'])
+			while len(self._finished) > self.keep:
+				del self._jobs[self._finished.pop(0)]
+			self._lock.notifyAll()
+		finally:
+			self._lock.release()
+		logging.getLogger('JobQueue').info('Job %d %s in %.2fs', job['id'],
+			status, timings['total'])
+
+class _JobRequestHandler:
+	"""
+	The HTTP face of a `JobQueue`, mixed into a
+	``BaseHTTPServer.BaseHTTPRequestHandler`` by `serveJobs`:
+
+	``POST /jobs``
+		queues the job described by the JSON object in the body, which
+		needs a ``name`` and a ``file`` and may have an ``episode`` (1x2
+		or S01E02) and an ``uploader``; answers ``202`` and the job, or
+		with ``"wait": true`` (or ``?wait=SECONDS``), ``200`` and the job
+		once it has finished
+	``GET /jobs/ID[?wait=SECONDS]``
+		the job, ``bbcode`` and all
+	``GET /jobs``
+		every job kept, without their ``bbcode``
+	``GET /stats``
+		how many jobs are in each status, and with ``--profile`` the
+		`Instrumentation` report so far
+	"""
+	# set on the class made for each server by serveJobs
+	queue = None
+	uploaders = ()
+	default_uploader = 'bb'
+
+	def do_GET(self):
+		path, query = self._split()
+		if '/jobs' == path:
+			return self._reply(200, {'jobs': self.queue.jobs()})
+		if '/stats' == path:
+			stats = self.queue.stats()
+			if Instrumentation.active is not None:
+				stats['profile'] = Instrumentation.active.report()
+			return self._reply(200, stats)
+		if path.startswith('/jobs/'):
+			try:
+				job_id = int(path[len('/jobs/'):])
+				wait = float(query.get('wait', 0))
+			except ValueError:
+				return self._reply(400, {'error': 'bad job id or wait'})
+			job = self.queue.get(job_id, wait)
+			if job is None:
+				return self._reply(404, {'error': 'no job %d' % job_id})
+			return self._reply(200, job)
+		return self._reply(404, {'error': 'no such resource'})
+
+	def do_POST(self):
+		path, query = self._split()
+		if '/jobs' != path:
+			return self._reply(404, {'error': 'no such resource'})
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+			request = json.loads(self.rfile.read(length) or '{}')
+			if not isinstance(request, dict):
+				raise ValueError('expected a JSON object')
+		except ValueError, ex:
+			return self._reply(400, {'error': 'bad request: %s' % ex})
+		name = request.get('name')
+		filename = request.get('file')
+		if not name or not filename:
+			return self._reply(400, {'error': 'a job needs a name and a file'})
+		episode = None
+		if request.get('episode'):
+			episode = parseEpisode(str(request['episode']))
+			if not episode:
+				return self._reply(400, {'error': 'unable to decipher the tv-episode'})
+		uploader = request.get('uploader') or self.default_uploader
+		if uploader not in self.uploaders:
+			return self._reply(400, {'error': 'unknown uploader %s' % uploader})
+		job = self.queue.submit(unicode(name).encode('utf-8'),
+			unicode(filename).encode('utf-8'), episode, uploader)
+		wait = query.get('wait')
+		if request.get('wait') is True and wait is None:
+			wait = 24 * 60 * 60
+		if wait:
+			try:
+				job = self.queue.get(job['id'], float(wait))
+			except ValueError:
+				return self._reply(400, {'error': 'bad wait'})
+		if job['status'] in ('done', 'failed'):
+			return self._reply(200, job)
+		return self._reply(202, job, {'Location': '/jobs/%d' % job['id']})
+
+	def _split(self):
+		parts = urlparse.urlsplit(self.path)
+		return parts.path.rstrip('/') or '/', dict(urlparse.parse_qsl(parts.query))
+
+	def _reply(self, code, body, headers={}):
+		data = json.dumps(body)
+		self.send_response(code)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		for key, value in headers.items():
+			self.send_header(key, value)
+		self.end_headers()
+		self.wfile.write(data)
+
+	def address_string(self):
+		# the client address of a UNIX socket is an empty string
+		return str(self.client_address and self.client_address[0] or 'local')
+
+	def log_message(self, format, *args):
+		logging.getLogger('serve').info('%s %s', self.address_string(), format % args)
+
+def _bindJobServer( address, handler ):
+	"""
+	Makes the server of `serveJobs` on ``address``.
+
+	:return: the server, and the path of its UNIX socket, if it has one
+	:raise ValueError: if ``address`` is not one to serve on
+	"""
+	import socket
+	import stat
+	import BaseHTTPServer
+	import SocketServer
+	log = logging.getLogger('serve')
+	socket_path = None
+	if '/' in address:
+		socket_path = address
+		if os.path.lexists(socket_path):
+			if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+				raise ValueError('%s exists and is not a socket' % socket_path)
+			probe = socket.socket(socket.AF_UNIX)
+			try:
+				try:
+					probe.connect(socket_path)
+				except socket.error:
+					# left behind by a server which is gone
+					os.remove(socket_path)
+				else:
+					raise ValueError('something already serves on %s' % socket_path)
+			finally:
+				probe.close()
+		class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+			daemon_threads = True
+		# the socket is created with the right mode, rather than changed
+		# to it once others could have connected
+		umask = os.umask(0177)
+		try:
+			server = Server(socket_path, handler)
+		finally:
+			os.umask(umask)
+		log.info('Serving jobs on %s', socket_path)
+	else:
+		host, port = '127.0.0.1', address
+		if ':' in address:
+			host, port = address.rsplit(':', 1)
+		try:
+			port = int(port)
+			loopback = socket.gethostbyname(host).startswith('127.')
+		except (ValueError, socket.error):
+			raise ValueError('%s is not a [HOST:]PORT to serve on' % address)
+		if not loopback:
+			raise ValueError('jobs are only served on a loopback address, not %s' % host)
+		class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+			daemon_threads = True
+		server = Server((host, port), handler)
+		log.info('Serving jobs on http://%s:%d/', *server.server_address[:2])
+	return server, socket_path
+
+def serveJobs( address, queue, uploaders, default_uploader='bb' ):
+	"""
+	Answers the job API of `_JobRequestHandler` for ``queue`` until
+	interrupted (^C or SIGTERM), then stops the queue.
+
+	The API has no authentication, and jobs name any file this user can
+	read, so it is only ever served to this machine: the socket is made
+	accessible to this user alone, and TCP is only served on the
+	loopback interface.
+
+	:param address: the path of a UNIX socket to listen on (anything
+		with a ``/`` in it), or ``[HOST:]PORT`` for TCP; HOST defaults to
+		127.0.0.1 and has to be a loopback address, and PORT 0 picks a
+		free one
+	:param uploaders: the names of the uploaders jobs may ask for
+	:raise ValueError: if ``address`` is not one to serve on, such as a
+		path which is not a socket, or a socket something already serves;
+		the queue is stopped all the same
+	"""
+	import signal
+	import BaseHTTPServer
+	log = logging.getLogger('serve')
+	class Handler(_JobRequestHandler, BaseHTTPServer.BaseHTTPRequestHandler):
+		pass
+	Handler.queue = queue
+	Handler.uploaders = tuple(uploaders)
+	Handler.default_uploader = default_uploader
+	try:
+		server, socket_path = _bindJobServer(address, Handler)
+	except:
+		# refused, so there is nothing for the workers to do
+		queue.stop()
+		raise
+	def terminate(signum, frame):
+		raise KeyboardInterrupt()
+	signal.signal(signal.SIGTERM, terminate)
+	try:
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			log.info('Shutting down')
+	finally:
+		server.server_close()
+		if socket_path is not None and os.path.exists(socket_path):
+			os.remove(socket_path)
+		queue.stop()
+
+class TaskGraph(object):
+	"""
+	Runs each task on its own thread as soon as the tasks it depends upon
+	have finished, handing it their results, so that independent stages
+	(network lookups, hashing, ffmpeg, mediainfo) overlap.
+	"""
+	def __init__(self):
+		self._tasks = {}
+
+	def add(self, name, func, *deps):
+		"""
+		Starts the task ``name``, which will call ``func`` with the results
+		of the ``deps`` tasks (in that order) once they are available.
+		Should a dependency fail, so does this task, with the same error.
+		"""
+		task = _Task(name, func, [self._tasks[dep] for dep in deps])
+		self._tasks[name] = task
+		task.start()
+
+	def result(self, name):
+		"""
+		Waits for the task ``name`` to finish.
+
+		:return: whatever its ``func`` returned
+		:raise: whatever its ``func`` raised
+		"""
+		return self._tasks[name].result()
+
+	def wait(self):
+		"""
+		Waits for every task to finish, whether it succeeded or not.
+		"""
+		for task in self._tasks.values():
+			task.wait()
+
+	def timings(self):
+		"""
+		:return: a map of the name of each task that has run to the
+			seconds its ``func`` took, not counting the wait for its
+			dependencies.
+		"""
+		return dict([(name, task.elapsed) for name, task in self._tasks.items()
+			if task.elapsed is not None])
+
+class _Task(threading.Thread):
+	def __init__(self, name, func, deps):
+		threading.Thread.__init__(self, name=name)
+		self.daemon = True
+		self.func = func
+		self.deps = deps
+		self.elapsed = None
+		self._result = None
+		self._exc_info = None
+
+	def run(self):
+		try:
+			args = [dep.result() for dep in self.deps]
+			started = time.time()
+			try:
+				self._result = self.func(*args)
+			finally:
+				self.elapsed = time.time() - started
+		except:
+			# this includes the SystemExit of the "not installed" errors,
+			# which must reach the main thread to have any effect
+			self._exc_info = sys.exc_info()
+
+	def wait(self):
+		# join() without a timeout would keep ^C from being noticed
+		while self.isAlive():
+			self.join(0.1)
+
+	def result(self):
+		self.wait()
+		if self._exc_info:
+			err_type, err_value, err_tb = self._exc_info
+			raise err_type, err_value, err_tb
+		return self._result
+
 if __name__ == "__main__":
 	from optparse import OptionParser
 
-	img_uploaders = {'bb':BaconBits, 'imgur':Imgur, 'minus':MinUs}
+	img_uploaders = {'bb':BaconBits, 'imgur':Imgur, 'minus':MinUs, 'local':LocalUploader}
 
-	usage = 'Usage: %prog [OPTIONS] "MOVIENAME/SERIESNAME" FILENAME'
+	usage = 'Usage: %prog [OPTIONS] "MOVIENAME/SERIESNAME" FILENAME\n' \
+		'       %prog [OPTIONS] --batch MANIFEST | --batch-dir DIR'
 	parser = OptionParser(usage=usage, version="%%prog %s" % __version_str__)
 	parser.add_option("-e", "--episode", type="string", action="store", dest="tv_episode",
 		help="Provides the TV episode identifier (1x2 or S01E02)")
 	parser.add_option("-u", "--update", action="store_true", dest="update",
 		help="update the config hints from the central github repository")
+	parser.add_option("--prewarm-hashes", type="string", action="store",
+		dest="prewarm_dir", metavar="DIR",
+		help="hash every file below DIR into the OpenSubtitles hash cache and exit")
+	parser.add_option("--forget-probe", type="string", action="append",
+		dest="forget_probe", metavar="PATH",
+		help="drop the cached ffmpeg/mediainfo results for PATH (or every "
+			"file below it); may be repeated")
+	parser.add_option("--probe-stats", action="store_true", dest="probe_stats",
+		help="report the ffmpeg/mediainfo probe cache hits and misses")
+	parser.add_option("--osub-logout", action="store_true", dest="osub_logout",
+		help="log out of the shared OpenSubtitles session and exit")
 	parser.add_option("-s", "--screenshots", type="int", action="store",
 		dest="screenshots", help="Set the amount of screenshots, max 7")
+	parser.add_option("-j", "--jobs", type="int", action="store",
+		dest="jobs", help="Run up to this many ffmpeg processes at once "
+			"(default: the number of cores)")
+	parser.add_option("--seek", type="choice", action="store",
+		choices=ScreenExtractor.SEEK_MODES, dest="seek", default='fast',
+		help=("How screenshots seek to their frame, one of: %s (default: fast)"
+			  % ",".join(ScreenExtractor.SEEK_MODES)))
+	parser.add_option("--image-format", type="choice", action="store",
+		choices=ScreenExtractor.IMAGE_FORMATS.keys(), dest="image_format",
+		default='png', help=("The screenshot format, one of: %s (default: png)"
+			  % ",".join(ScreenExtractor.IMAGE_FORMATS.keys())))
+	parser.add_option("--image-quality", type="int", action="store",
+		dest="image_quality", help="PNG compression level (0-9) or "
+			"JPEG quality scale (2-31, lower is better) of the screenshots")
+	parser.add_option("--screenshot-engine", type="choice", action="store",
+		choices=ScreenExtractor.ENGINES, dest="engine", default='per-shot',
+		help=("Run one ffmpeg per screenshot or a single one for all of them"
+			  " (which still opens the file once per screenshot),"
+			  " one of: %s (default: per-shot)" % ",".join(ScreenExtractor.ENGINES)))
+	parser.add_option("--cache-dir", type="string", action="store",
+		dest="cache_dir", metavar="DIR",
+		help="keep fetched pages in DIR (default: pythonbits-http-cache in the temp directory)")
+	parser.add_option("--no-cache", action="store_true", dest="no_cache",
+		help="fetch every page afresh, without the page cache")
+	parser.add_option("--cache-ttl", type="string", action="append",
+		dest="cache_ttl", metavar="[HOST=]SECONDS",
+		help="how long fetched pages stay fresh, for every host or just HOST; "
+			"may be repeated")
+	parser.add_option("--batch", type="string", action="store",
+		dest="batch", metavar="MANIFEST",
+		help="write the post of every release listed in MANIFEST, one per line "
+			"as CSV (name,file[,episode]) or JSON ({\"name\":..., \"file\":..., "
+			"\"episode\":...}), instead of the one given on the command line")
+	parser.add_option("--batch-dir", type="string", action="store",
+		dest="batch_dir", metavar="DIR",
+		help="write the post of every media file below DIR, guessing the name "
+			"and episode from the filename")
+	parser.add_option("--output-dir", type="string", action="store",
+		dest="output_dir", metavar="DIR", default=".",
+		help="where --batch and --batch-dir write the posts and summary.txt "
+			"(default: the current directory)")
+	parser.add_option("--serve", type="string", action="store",
+		dest="serve", metavar="ADDRESS",
+		help="keep running and write posts for the jobs sent to ADDRESS, a UNIX "
+			"socket path or [HOST:]PORT on a loopback address; see JobQueue and "
+			"_JobRequestHandler")
+	parser.add_option("--serve-jobs", type="int", action="store",
+		dest="serve_jobs", metavar="N", default=1,
+		help="how many jobs --serve runs at the same time (default: 1)")
+	parser.add_option("--import-times", action="store_true", dest="import_times",
+		help="Print what loading each module cost, when the program exits")
+	parser.add_option("--profile", type="string", action="store",
+		dest="profile", metavar="FILE",
+		help="time every stage and count the HTTP requests of the run, writing "
+			"the JSON report to FILE (- for stderr) when the program exits")
+	parser.add_option("--profile-stage", type="string", action="store",
+		dest="profile_stage", metavar="STAGE",
+		help="with --profile, also run the stage STAGE (e.g. SearchImdb.parse "
+			"or ScreenExtractor.extract) under cProfile")
+	parser.add_option("--stream-microdata", action="store_true", dest="stream_microdata",
+		help="read the IMDB microdata off the page as it arrives, without "
+			"building a BeautifulSoup tree (experimental)")
+	parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
+		help="log progress, such as the time taken by each screenshot")
 	parser.add_option("-i", "--imager", type="choice", action="store",
 		choices=img_uploaders.keys(),
 		dest="img_uploader",
@@ -897,18 +3086,39 @@ if __name__ == "__main__":
 		help=("One of the following upload services: %s"
 			  % ",".join(img_uploaders.keys())))
 	options, args = parser.parse_args()
+	if options.stream_microdata:
+		SearchImdb.STREAM_MICRODATA = True
+	if options.verbose:
+		logging.basicConfig(level=logging.INFO)
+	else:
+		logging.basicConfig()
+	if options.profile:
+		import atexit
+		Instrumentation.active = Instrumentation( options.profile_stage )
+		atexit.register( Instrumentation.active.write, options.profile )
+	default_ttl = None
+	host_ttls = {}
+	for ttl in options.cache_ttl or []:
+		host, seconds = None, ttl
+		if '=' in ttl:
+			host, seconds = ttl.split('=', 1)
+		try:
+			seconds = int(seconds)
+		except ValueError:
+			seconds = -1
+		if seconds < 0 or '' == host:
+			parser.error("--cache-ttl wants [HOST=]SECONDS, a whole number "
+				"of seconds, not %r" % ttl)
+		if host is None:
+			default_ttl = seconds
+		else:
+			host_ttls[host] = seconds
+	if not options.no_cache:
+		_MyOpener.cache = HTTPCache(options.cache_dir, default_ttl, host_ttls)
 
 	tv_episode = None
 	if options.tv_episode:
-		matchers = [
-				re.compile(r'(\d+)x(\d+)'),
-				re.compile(r'(?i)s(\d+)e(\d+)')
-				]
-		for matcher in matchers:
-			ma = matcher.match(options.tv_episode)
-			if ma:
-				tv_episode = ( int(ma.group(1)), int(ma.group(2)) )
-				break
+		tv_episode = parseEpisode( options.tv_episode )
 		if not tv_episode:
 			print >> sys.stderr, \
 				"Unable to decipher your tv-episode \"%s\"" % options.tv_episode
@@ -917,6 +3127,24 @@ if __name__ == "__main__":
 		print "Updating Configfile"
 		updateConfig()
 		sys.exit(0)
+	if options.prewarm_dir:
+		prewarmHashCache( options.prewarm_dir )
+		sys.exit(0)
+	if options.osub_logout:
+		logoutOpenSubtitles()
+		sys.exit(0)
+	batch = options.batch or options.batch_dir or options.serve
+	probe_cache = ProbeCache()
+	if options.forget_probe:
+		for path in options.forget_probe:
+			print >> sys.stderr, "Forgot %d probe cache entries for %s" % \
+				(probe_cache.invalidate(path), path)
+		probe_cache.save()
+		if not args and not batch:
+			sys.exit(0)
+	if options.probe_stats and not args and not batch:
+		print >> sys.stderr, probe_cache.stats()
+		sys.exit(0)
 	conf = PythonbitsConfig()
 	conf.set_location(tempdir()+"config.xml")
 	try:
@@ -924,91 +3152,50 @@ if __name__ == "__main__":
 	except Exception, ex:
 		print >> sys.stderr, "Unable to read config:", ex
 		updateConfig()
+		conf.read()
 
-	up_class = img_uploaders[options.img_uploader]
-	uploader = up_class()
-
-	search_string = args[0]
-	filename = args[1]
-
-	movie = None
-	if tv_episode:
-		results = SearchTV(search_string, tv_episode).result
-	else:
-		results = SearchMovie(search_string).results
-		if results:
-			movie = SearchImdb(results[0][1])
-		else:
-			__logerror("No films found.\n")
-			exit(1)
-	if movie and movie.getSummary():
-		print "[b]Description:[/b]"
-		print "[quote]%s[/quote]\n" % movie.summary[0]
-	print "[b]Information:[/b]"
-	print "[quote]"
-	if movie:
-		if movie.findWiki():
-			print "Wikipedia url: %s" % movie.wikiurl
-		if movie.findTrailer():
-			print "Trailer: %s" % movie.trailerurl
-		file_size, file_hash = hash_filename( filename )
-		user_agent = USER_AGENT
-		username = ''
-		password = ''
-		osub = OpenSubtitlesClient( user_agent )
-		osub.LogIn( username, password )
-		sub_results = osub.SearchSubtitles( file_size, file_hash )
-		osub.LogOut()
-		if sub_results:
-			links = []
-			for it in sub_results:
-				links.append(
-					'[url=%s]%s[/url]' % (
-					it['SubDownloadLink'], it['ISO639'], ) )
-			print 'Subtitles: %s' % ' | '.join( links )
-		print movie.overview()
-	elif tv_episode:
-		interesting_fields = [
-			'Classification',
-			'Country',
-			'Ended',
-			'Episode URL',
-			'Genres',
-			'Network',
-			'Premiered',
-			'Runtime',
-			'Episode Description',
-			'Show Name',
-			'Show URL',
-			'Started',
-			'Status',
-			'Summary' # this is added below, not from the API :-(
-		]
-		if 'Episode URL' in results:
-			ep_url = results[ 'Episode URL' ]
-			ep_summary = get_tv_rage_episode_summary( ep_url )
-			if ep_summary:
-				results['Summary'] = ep_summary
-		for field_name in interesting_fields:
-			if not field_name in results:
-				continue
-			v = results[ field_name ]
-			print "[b]%s[/b]: %s" % (field_name, v)
-	print "[/quote]"
-	print "[b]Screenshots:[/b]"
+	number_of_screens = 2
 	if options.screenshots:
-		extractor = ScreenExtractor(filename, int(options.screenshots))
+		number_of_screens = int(options.screenshots)
+	def make_builder(uploader_name, hash_cache=None):
+		return PostBuilder(img_uploaders[uploader_name](), probe_cache, hash_cache,
+			number_of_screens=number_of_screens, jobs=options.jobs, seek=options.seek,
+			image_format=options.image_format, quality=options.image_quality,
+			engine=options.engine)
+	failures = 0
+	if options.serve:
+		from opensubtitles import HashCache
+		# one hash cache for all the workers, rather than one each
+		hash_cache = HashCache()
+		# what every job needs, loaded before the first one arrives
+		import microdata
+		try:
+			serveJobs( options.serve,
+				JobQueue( lambda name: make_builder( name, hash_cache ), options.serve_jobs ),
+				img_uploaders.keys(), options.img_uploader )
+		except ValueError, ex:
+			print >> sys.stderr, "Unable to serve jobs: %s" % ex
+			sys.exit(1)
 	else:
-		extractor = ScreenExtractor(filename)
-	image_filenames = extractor.extract()
-	if not image_filenames:
-		raise ValueError("Expected to have image files but found none")
-	image_urls = uploader.get_urls( image_filenames )
-	if image_urls:
-		print "[quote][align=center]" 
-		for url in image_urls:
-			print "[img=%s]" % url
-		print "[/align][/quote]"
-	mediainfo = findMediaInfo(filename)
-	if mediainfo:
-		print "[mediainfo]\n%s\n[/mediainfo]" % mediainfo
+		builder = make_builder( options.img_uploader )
+		try:
+			if batch:
+				items = []
+				if options.batch:
+					items.extend( readManifest( options.batch ) )
+				if options.batch_dir:
+					items.extend( walkMediaFiles( options.batch_dir ) )
+				failures = runBatch( builder, items, options.output_dir )
+			else:
+				search_string = args[0]
+				filename = args[1]
+				builder.build( sys.stdout, search_string, filename, tv_episode )
+		finally:
+			builder.close()
+	probe_cache.save()
+	if options.probe_stats:
+		print >> sys.stderr, probe_cache.stats()
+	if _MyOpener.cache is not None:
+		logging.getLogger('HTTPCache').info(_MyOpener.cache.stats())
+	if failures:
+		sys.exit(1)